@@ -13,18 +13,17 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from math import sin, cos, radians
+from math import sin, cos, exp, floor, radians, hypot
 from dataclasses import dataclass
 from random import uniform
+from array import array
 
-from twisted.internet.reactor import callLater
-
-from pyspades.contained import SetColor, BlockAction, GrenadePacket
-from pyspades.common import Vertex3, make_color
-from pyspades.constants import BUILD_BLOCK
+from pyspades.common import Vertex3
 from pyspades.world import Grenade
 
-from arenalib.raycast import cast
+from arenalib.raycast import cube_line
+from arenalib.broadcast import broadcast_data, broadcast_effect
+from arenalib import packets
 
 tuple3i = tuple[int, int, int]
 tuple3f = tuple[float, float, float]
@@ -47,54 +46,43 @@ class LightFieldGun:
     rate_of_fire        = NotImplementedField
     blast_radius        = NotImplementedField
 
-    shell_explode_call = None
-    shell_reload_call  = None
+    # Blocks per second squared (the z axis points down) and 1/s respectively.
+    gravity = 0.0
+    drag    = 0.0
 
-    def do_release_trigger(self, protocol, x, y, z):
-        protocol.map.set_point(x, y, z, self.trigger_block_color)
+    # Number of shells fired per trigger and the delay between them (seconds).
+    salvo_size     = 1
+    salvo_interval = 0.5
 
-        set_color           = SetColor()
-        set_color.player_id = 32
-        set_color.value     = make_color(*self.trigger_block_color)
+    trigger_location = None
+    reload_deadline  = None
+    salvo_deadline   = None
+    salvo_remaining  = 0
+    salvo_player     = None
 
-        protocol.send_contained(set_color, save = True)
+    def do_release_trigger(self, protocol):
+        x, y, z = self.trigger_location
 
-        block_action           = BlockAction()
-        block_action.x         = x
-        block_action.y         = y
-        block_action.z         = z
-        block_action.player_id = 32
-        block_action.value     = BUILD_BLOCK
+        protocol.map.set_point(x, y, z, self.trigger_block_color)
 
-        protocol.send_contained(block_action, save = True)
+        broadcast_data(protocol, packets.encode_set_color(32, self.trigger_block_color), save = True)
+        broadcast_data(protocol, packets.build_block.encode(32, x, y, z), save = True)
 
-        self.shell_reload_call = None
+        self.trigger_location = None
+        self.reload_deadline  = None
 
     def do_muzzle_flash(self, protocol):
-        contained           = GrenadePacket()
-        contained.player_id = 32
-        contained.value     = 0
-        contained.position  = self.muzzle_position
-        contained.velocity  = (0, 0, 0)
-
-        protocol.broadcast_contained(contained)
+        data = packets.grenade_effect.encode(32, *self.muzzle_position)
+        broadcast_effect(protocol, data, *self.muzzle_position)
 
     def do_explode_shell(self, player, x, y, z):
         protocol = player.protocol
 
-        contained           = GrenadePacket()
-        contained.player_id = player.player_id
-        contained.value     = 0
-        contained.position  = (x, y, z)
-        contained.velocity  = (0, 0, 0)
-
-        protocol.broadcast_contained(contained)
+        broadcast_effect(protocol, packets.grenade_effect.encode(player.player_id, x, y, z), x, y, z)
 
         grenade = Grenade(protocol.world, 0.0, Vertex3(x, y, z), None, Vertex3(0, 0, 0))
         player.grenade_exploded(grenade, dmax = self.blast_radius)
 
-        self.shell_explode_call = None
-
     def is_barrel_broken(self, protocol):
         for x, y, z in self.barrel_blocks:
             if protocol.map.get_solid(x, y, z) is False:
@@ -102,65 +90,234 @@ class LightFieldGun:
 
         return False
 
-    def do_fire_gun(self, player, x0, y0, z0):
-        if self.shell_reload_call is not None:
+    def is_loaded(self):
+        return self.reload_deadline is None
+
+    def aim(self, protocol):
+        φ0, Δφ = radians(self.firing_azimuth), radians(self.max_deviation)
+
+        d = uniform(self.near_firing_range, self.far_firing_range)
+        φ = uniform(φ0 - Δφ, φ0 + Δφ)
+
+        x1, y1, z1 = self.muzzle_position
+
+        x2 = x1 + d * cos(φ)
+        y2 = y1 + d * sin(φ)
+        z2 = protocol.map.get_z(x2, y2, z1)
+
+        dx, dy, dz = x2 - x1, y2 - y1, z2 - z1
+        norm = hypot(dx, dy, dz)
+
+        vx = dx / norm * self.muzzle_velocity
+        vy = dy / norm * self.muzzle_velocity
+        vz = dz / norm * self.muzzle_velocity
+
+        # Raise the barrel just enough to compensate for the drop over the time of flight,
+        # so that a gun with no gravity and no drag fires in a straight line as before.
+        T = norm / self.muzzle_velocity
+        vz -= 0.5 * self.gravity * T
+
+        return x1, y1, z1, vx, vy, vz
+
+class FieldBattery:
+    # All in-flight shells of every gun in the battery are kept as parallel arrays and advanced
+    # together with a fixed time step, so a map with dozens of guns costs one loop per tick.
+    step = 1 / 60
+
+    def __init__(self, guns, linked = False, salvo_stagger = 0.25):
+        self.guns          = guns
+        self.linked        = linked
+        self.salvo_stagger = salvo_stagger
+
+        self.reset()
+
+    def reset(self):
+        self.time        = 0.0
+        self.accumulator = 0.0
+
+        self.px = array('d')
+        self.py = array('d')
+        self.pz = array('d')
+        self.vx = array('d')
+        self.vy = array('d')
+        self.vz = array('d')
+        self.damping = array('d')
+        self.impulse = array('d')
+
+        self.shell_gun    = []
+        self.shell_player = []
+
+        for field_gun in self.guns.values():
+            field_gun.trigger_location = None
+            field_gun.reload_deadline  = None
+            field_gun.salvo_deadline   = None
+            field_gun.salvo_remaining  = 0
+            field_gun.salvo_player     = None
+
+    def __len__(self):
+        return len(self.shell_gun)
+
+    def launch(self, protocol, field_gun, player):
+        if field_gun.is_barrel_broken(protocol):
+            self.explode(field_gun, player, *field_gun.trigger_location)
+            field_gun.salvo_remaining = 0
+
             return
 
-        protocol = player.protocol
+        field_gun.do_muzzle_flash(protocol)
+
+        x, y, z, vx, vy, vz = field_gun.aim(protocol)
 
-        if self.is_barrel_broken(protocol):
-            self.do_explode_shell(player, x0, y0, z0)
-        else:
-            self.do_muzzle_flash(protocol)
+        self.px.append(x)
+        self.py.append(y)
+        self.pz.append(z)
+        self.vx.append(vx)
+        self.vy.append(vy)
+        self.vz.append(vz)
+        self.damping.append(exp(-field_gun.drag * self.step))
+        self.impulse.append(field_gun.gravity * self.step)
 
-            φ0, Δφ = radians(self.firing_azimuth), radians(self.max_deviation)
+        self.shell_gun.append(field_gun)
+        self.shell_player.append(player)
+
+    def explode(self, field_gun, player, x, y, z):
+        if player.name is None:
+            return
+
+        field_gun.do_explode_shell(player, x, y, z)
+
+    def fire(self, field_gun, player, x, y, z, delay = 0.0):
+        if not field_gun.is_loaded():
+            return
 
-            d = uniform(self.near_firing_range, self.far_firing_range)
-            φ = uniform(φ0 - Δφ, φ0 + Δφ)
+        field_gun.trigger_location = (x, y, z)
+        field_gun.reload_deadline  = self.time + delay + 60 / field_gun.rate_of_fire
+        field_gun.salvo_deadline   = self.time + delay
+        field_gun.salvo_remaining  = field_gun.salvo_size
+        field_gun.salvo_player     = player
 
-            x1, y1, z1 = self.muzzle_position
+    def on_trigger(self, player, x, y, z):
+        if field_gun := self.guns.get((x, y, z), None):
+            if not field_gun.is_loaded():
+                return
 
-            x2 = x1 + d * cos(φ)
-            y2 = y1 + d * sin(φ)
-            z2 = protocol.map.get_z(x2, y2, z1)
+            self.fire(field_gun, player, x, y, z)
 
-            r = Vertex3(x1, y1, z1)
-            v = Vertex3(x2 - x1, y2 - y1, z2 - z1).normal() * self.muzzle_velocity
+            if self.linked:
+                # A linked battery fires every loaded gun at once, staggered for the effect.
+                k = 0
 
-            # We assume that the map is small enough and the shell is fast enough so that the shell
-            # flies almost in a straight line. Hence, we ignore gravitation, aerodynamic drag
-            # and other forces, and do a simple raycast.
+                for (X, Y, Z), other in self.guns.items():
+                    if other is field_gun or not other.is_loaded():
+                        continue
 
-            for t, x, y, z in cast(r, v):
-                if protocol.map.get_solid(x, y, z):
-                    self.shell_explode_call = callLater(t, self.do_explode_shell, player, x, y, z - 1)
+                    k += 1
 
+                    self.fire(other, player, X, Y, Z, delay = k * self.salvo_stagger)
+
+    def update(self, protocol, dt):
+        self.accumulator += dt
+
+        while self.accumulator >= self.step:
+            self.accumulator -= self.step
+            self.time        += self.step
+
+            self.advance(protocol)
+
+        for field_gun in self.guns.values():
+            if field_gun.salvo_remaining > 0 and field_gun.salvo_deadline <= self.time:
+                field_gun.salvo_remaining -= 1
+                field_gun.salvo_deadline  += field_gun.salvo_interval
+
+                self.launch(protocol, field_gun, field_gun.salvo_player)
+
+            if field_gun.reload_deadline is not None and field_gun.reload_deadline <= self.time:
+                if field_gun.salvo_remaining <= 0:
+                    field_gun.do_release_trigger(protocol)
+
+    def advance(self, protocol):
+        N = len(self.shell_gun)
+        if N <= 0: return
+
+        M, dt = protocol.map, self.step
+
+        px, py, pz = self.px, self.py, self.pz
+        vx, vy, vz = self.vx, self.vy, self.vz
+
+        damping, impulse = self.damping, self.impulse
+
+        keep = []
+
+        for i in range(N):
+            x0, y0, z0 = px[i], py[i], pz[i]
+
+            k = damping[i]
+
+            vx[i] *= k
+            vy[i] *= k
+            vz[i]  = vz[i] * k + impulse[i]
+
+            x1, y1, z1 = x0 + vx[i] * dt, y0 + vy[i] * dt, z0 + vz[i] * dt
+
+            px[i], py[i], pz[i] = x1, y1, z1
+
+            # The map is checked as it is now, so the shell respects any block placed or destroyed
+            # while it was in flight.
+            X0, Y0, Z0 = floor(x0), floor(y0), floor(z0)
+            X1, Y1, Z1 = floor(x1), floor(y1), floor(z1)
+
+            hit = None
+            last = X0, Y0, Z0
+
+            for x, y, z in cube_line(X0, Y0, Z0, X1, Y1, Z1):
+                if z < 0:
+                    last = x, y, z
+                    continue
+
+                if M.get_solid(x, y, z) is not False:
+                    hit = last
                     break
 
-        self.shell_reload_call = callLater(60 / self.rate_of_fire, self.do_release_trigger, protocol, x0, y0, z0)
+                last = x, y, z
 
-def fire_gun_on_block_removed(game_field_guns):
-    def on_block_removed(player, x, y, z):
-        protocol = player.protocol
+            # “cube_line” stops at the water level and at the map boundaries.
+            if hit is None and (X1, Y1, Z1) != last:
+                if 63 <= Z1:
+                    hit = last
+                else:
+                    # The shell left the map sideways, with nothing left to hit: it is dropped
+                    continue
 
-        if field_gun := game_field_guns.get((x, y, z), None):
-            field_gun.do_fire_gun(player, x, y, z)
+            if hit is not None:
+                self.explode(self.shell_gun[i], self.shell_player[i], *hit)
+            else:
+                keep.append(i)
 
-    return on_block_removed
+        if len(keep) < N:
+            self.compact(keep)
 
-def unload_guns_on_map_unloaded(game_field_guns):
-    def on_map_unloaded(protocol, rot_info):
-        for field_gun in game_field_guns.values():
-            if defer := field_gun.shell_explode_call:
-                field_gun.shell_explode_call = None
+    def compact(self, keep):
+        for name in 'px', 'py', 'pz', 'vx', 'vy', 'vz', 'damping', 'impulse':
+            arr = getattr(self, name)
+            setattr(self, name, array('d', (arr[i] for i in keep)))
+
+        self.shell_gun    = [self.shell_gun[i]    for i in keep]
+        self.shell_player = [self.shell_player[i] for i in keep]
 
-                if defer.active():
-                    defer.cancel()
+def fire_gun_on_block_removed(battery):
+    def on_block_removed(player, x, y, z):
+        battery.on_trigger(player, x, y, z)
 
-            if defer := field_gun.shell_reload_call:
-                field_gun.shell_reload_call = None
+    return on_block_removed
 
-                if defer.active():
-                    defer.cancel()
+def update_guns_on_world_update(battery):
+    def on_world_update(protocol, dt):
+        battery.update(protocol, dt)
+
+    return on_world_update
+
+def unload_guns_on_map_unloaded(battery):
+    def on_map_unloaded(protocol, rot_info):
+        battery.reset()
 
     return on_map_unloaded
@@ -0,0 +1,324 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections.abc import Sequence
+from mmap import mmap, ACCESS_READ
+from functools import wraps, partial
+from hashlib import sha1
+from ast import literal_eval
+from io import BytesIO
+import struct
+import zlib
+import re
+
+from os.path import join, isfile, getmtime, getsize, basename, splitext
+from os import makedirs, replace, getpid, scandir, unlink, utime
+
+from pyspades.vxl import VXLData
+
+from piqueserver.config import config
+
+# Directory where data derived from the maps (the compressed map, the maps generated by `gen_script`,
+# masks and spawns) is shared between the servers running on the same host, see `arenalib.supervisor`
+# (disabled if empty)
+asset_dir_option = config.section("arena").option("asset_dir", "")
+
+# Above this size, the assets used least recently are removed (MiB, 0 for no limit): generated maps
+# get a new seed at every load unless the rotation gives one, so most of them are never used again
+asset_dir_size_option = config.section("arena").option("asset_dir_size", 512)
+
+# Compression level of the generated maps
+COMPRESSION_LEVEL = 6
+
+COLUMNS = 512 * 512
+
+# Layers are handled as integers of 8 × COLUMNS bits, one byte (0 or 255) per column,
+# so that they are combined with a single bitwise operation.
+def as_int(layer):
+    return int.from_bytes(layer, 'little')
+
+def as_bytes(n):
+    return n.to_bytes(COLUMNS, 'little')
+
+def count(n):
+    return n.bit_count() // 8
+
+def get_layers(M):
+    # The alpha channel of an overview of the layer `z` tells which columns are solid at `z`
+    return [as_int(M.get_overview(z)[3::4]) for z in range(64)]
+
+class AssetCache:
+    """
+    Read-only data derived from the maps, written once in `dirname` by the first process
+    that needs it and memory-mapped by every other one, so that several servers
+    on the same host share a single copy of it (in the page cache). Past `limit` bytes,
+    the assets used least recently are removed (the modification time of an asset
+    is updated whenever it is used).
+    """
+
+    def __init__(self, dirname, limit = 0):
+        self.dirname = dirname
+        self.limit   = limit
+
+    def get(self, key, build = None):
+        """
+        Returns the asset `key` (as a read-only `mmap`), writing `build()` first if it does not exist.
+        """
+
+        filename = join(self.dirname, key)
+
+        try:
+            fin = open(filename, 'rb')
+        except FileNotFoundError:
+            if build is None:
+                raise
+
+            self.put(filename, build())
+            fin = open(filename, 'rb')
+        else:
+            utime(fin.fileno())
+
+        with fin:
+            return mmap(fin.fileno(), 0, access = ACCESS_READ)
+
+    def put(self, filename, data):
+        makedirs(self.dirname, exist_ok = True)
+
+        # Several processes might build the same asset at once: the last one wins
+        temporary = "{}.{}.tmp".format(filename, getpid())
+
+        with open(temporary, 'wb') as fout:
+            fout.write(data)
+
+        replace(temporary, filename)
+
+        if self.limit > 0:
+            self.evict(filename)
+
+    def evict(self, keep):
+        entries = []
+
+        with scandir(self.dirname) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+
+        # The servers that have mapped a removed asset keep their copy of it
+        for _, size, path in sorted(entries):
+            if total <= self.limit:
+                break
+
+            if path == keep:
+                continue
+
+            try:
+                unlink(path)
+            except FileNotFoundError:
+                pass
+
+            total -= size
+
+    def has(self, key):
+        return isfile(join(self.dirname, key))
+
+def get_shared_assets():
+    if dirname := asset_dir_option.get():
+        return AssetCache(dirname, asset_dir_size_option.get() << 20)
+
+def get_file_digest(filename):
+    return sha1("{}:{}:{}".format(filename, getmtime(filename), getsize(filename)).encode()).hexdigest()[:16]
+
+def get_safe_name(name):
+    return re.sub(r'[^\w]+', '', name)
+
+def get_source_files(map_info):
+    rot_info, load_dir = map_info.rot_info, map_info.load_dir
+
+    yield rot_info.get_meta_filename(load_dir)
+
+    if not map_info.gen_script:
+        yield rot_info.get_map_filename(load_dir)
+
+def get_map_key(map_info, suffix):
+    """
+    Name of an asset of the map `map_info` as it is loaded, or `None` if the map cannot be shared.
+    """
+
+    # Maps that save themselves (`WorldVXL`) are not loaded the same way twice
+    if hasattr(map_info.data, 'map_cache'):
+        return None
+
+    # The name includes the seed of generated maps, and the files are identified by their modification time
+    digest = sha1(map_info.name.encode())
+
+    for filename in get_source_files(map_info):
+        if isfile(filename):
+            digest.update(get_file_digest(filename).encode())
+
+    return "{}-{}{}".format(get_safe_name(map_info.short_name), digest.hexdigest()[:16], suffix)
+
+def get_mask_data(M):
+    """
+    Returns the solid voxels of `M` as a bitmap: 8 bytes per column (bit `z` for the voxel `z`), row after row.
+    """
+
+    layers = get_layers(M)
+    data   = bytearray(8 * COLUMNS)
+
+    for i in range(8):
+        n = 0
+
+        for k in range(8):
+            n |= layers[8 * i + k] & as_int(bytes([1 << k]) * COLUMNS)
+
+        data[i::8] = as_bytes(n)
+
+    return bytes(data)
+
+class VoxelMask:
+    """
+    Read-only set of voxels over a bitmap of `get_mask_data`, with the `get_solid` of `VXLData`.
+    """
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def get_solid(self, x, y, z):
+        if 0 <= x < 512 and 0 <= y < 512 and 0 <= z < 64:
+            return bool(self.data[(y << 9 | x) << 3 | z >> 3] >> (z & 7) & 1)
+        else:
+            return False
+
+def load_mask(filename):
+    """
+    Loads a VXL file used as a mask: a `VoxelMask` shared between the servers if possible,
+    else a `VXLData`.
+    """
+
+    if (assets := get_shared_assets()) is None:
+        with open(filename, 'rb') as fin:
+            return VXLData(fin)
+
+    def build():
+        with open(filename, 'rb') as fin:
+            return get_mask_data(VXLData(fin))
+
+    stem = splitext(basename(filename))[0]
+    return VoxelMask(assets.get("{}-{}.mask".format(get_safe_name(stem), get_file_digest(filename)), build))
+
+def restore(namespace, name, value):
+    current = namespace.get(name)
+
+    if isinstance(current, (dict, set)) and type(value) is type(current):
+        current.clear()
+        current.update(value)
+    elif isinstance(current, list) and isinstance(value, list):
+        current[:] = value
+    else:
+        namespace[name] = value
+
+def shared_gen_script(*names):
+    """
+    Decorator of `gen_script` for maps that are always generated the same way for the same seed:
+    the first server generating the map publishes it (compressed, with the global variables
+    `names` that `gen_script` sets) in the shared assets, and the others load it from there
+    instead of generating it again. Masks (`VXLData`) among these variables are replaced by
+    a shared `VoxelMask`, the others must be literals (numbers, strings, tuples, sets...).
+    Dictionaries, sets and lists are updated in place, as other modules might hold them
+    (e.g. the `extensions` of `map_info`).
+    """
+
+    def decorator(gen_script):
+        namespace = gen_script.__globals__
+
+        @wraps(gen_script)
+        def wrapper(basename, seed):
+            if (assets := get_shared_assets()) is None:
+                return gen_script(basename, seed)
+
+            key = "{}.{}-{}".format(get_safe_name(basename), seed, get_file_digest(namespace['__file__']))
+
+            # The state is written last: once it exists, the other assets exist as well,
+            # unless some of them have been removed since (see `AssetCache.evict`)
+            if assets.has(key + ".state"):
+                try:
+                    masks, values = literal_eval(assets.get(key + ".state")[:].decode())
+                    shared = {name: VoxelMask(assets.get("{}.{}.bits".format(key, name))) for name in masks}
+
+                    with assets.get(key + ".vxl.z") as data:
+                        M = VXLData(BytesIO(zlib.decompress(data)))
+                except FileNotFoundError:
+                    pass
+                else:
+                    for name, value in values.items():
+                        restore(namespace, name, value)
+
+                    namespace.update(shared)
+
+                    return M
+
+            M = gen_script(basename, seed)
+
+            masks  = [name for name in names if isinstance(namespace[name], VXLData)]
+            values = {name: namespace[name] for name in names if name not in masks}
+
+            assets.get(key + ".vxl.z", lambda: zlib.compress(M.generate(), COMPRESSION_LEVEL))
+
+            for name in masks:
+                bits = assets.get("{}.{}.bits".format(key, name), partial(get_mask_data, namespace[name]))
+                namespace[name] = VoxelMask(bits)
+
+            assets.get(key + ".state", lambda: repr((masks, values)).encode())
+
+            return M
+
+        return wrapper
+
+    return decorator
+
+point_layout = struct.Struct('<hhh')
+
+class PointTable(Sequence):
+    """
+    Read-only sequence of points (x, y, z), packed as `point_layout`.
+    """
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data) // point_layout.size
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+
+        if i < 0:
+            i += len(self)
+
+        if not 0 <= i < len(self):
+            raise IndexError("point index out of range")
+
+        return point_layout.unpack_from(self.data, i * point_layout.size)
+
+def get_point_table(assets, key, points):
+    return PointTable(assets.get(key, lambda: b''.join(point_layout.pack(*map(int, point)) for point in points)))
@@ -0,0 +1,165 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from itertools import product
+
+from pyspades.contained import (
+    BlockAction, BlockLine, SetColor, SetTool, ChangeWeapon,
+    IntelPickup, IntelDrop, MoveObject
+)
+from pyspades.constants import (
+    BUILD_BLOCK, DESTROY_BLOCK, SPADE_DESTROY, BLUE_FLAG, GREEN_FLAG
+)
+
+from arenalib.packets import block_action_layout, block_line_layout
+from arenalib.raycast import cube_line
+
+# The dropped packets are only reclaimed past this many slots
+COMPACT_MIN = 256
+
+def get_destroyed(value, x, y, z):
+    if value == SPADE_DESTROY:
+        return ((x, y, z + dz) for dz in (-1, 0, 1))
+    else:
+        return ((x + dx, y + dy, z + dz) for dx, dy, dz in product((-1, 0, 1), repeat = 3))
+
+class SavedPackets:
+    """
+    Packets broadcast with `save = True` while a player downloads the map, replayed once
+    it is done. Used in place of the plain list of `ServerConnection.saved_loaders`, it only
+    keeps what still matters for the final state: a block built or destroyed again is only
+    sent once, and only the last color, tool and weapon of every player and the last state
+    of every flag are kept. Above `limit` packets, `overflow` is set. The slots of the dropped
+    packets are reclaimed once they outnumber the packets kept.
+    """
+
+    def __init__(self, protocol, packets = (), limit = 8192):
+        self.protocol = protocol
+        self.limit    = limit
+
+        self.entries  = []
+        self.count    = 0
+        self.overflow = False
+
+        self.blocks   = dict() # voxel → (index, value) of the last single block change
+        self.latest   = dict() # (packet id, player or flag) → index
+        self.painted  = set()  # players who have built since their last color change
+
+        for data in packets:
+            self.append(data)
+
+    def __iter__(self):
+        return (data for data in self.entries if data is not None)
+
+    def __len__(self):
+        return self.count
+
+    def compact(self):
+        indices = dict() # index in `entries` → index in the compacted list
+        entries = []
+
+        for index, data in enumerate(self.entries):
+            if data is not None:
+                indices[index] = len(entries)
+                entries.append(data)
+
+        self.entries = entries
+
+        self.blocks = {
+            voxel: (indices[index], value) for voxel, (index, value) in self.blocks.items() if index in indices
+        }
+
+        self.latest = {
+            key: indices[index] for key, index in self.latest.items() if index in indices
+        }
+
+    def drop(self, index):
+        if self.entries[index] is not None:
+            self.entries[index] = None
+            self.count -= 1
+
+    def supersede(self, key):
+        if (index := self.latest.get(key)) is not None:
+            self.drop(index)
+
+        self.latest[key] = len(self.entries)
+
+    def get_flag(self, player_id):
+        # A player can only carry the flag of the other team
+        if player := self.protocol.players.get(player_id):
+            if team := player.team:
+                if other := team.other:
+                    return other.id
+
+    def append(self, data):
+        data = bytes(data)
+
+        packet_id = data[0]
+
+        if packet_id == BlockAction.id:
+            self.on_block_action(*block_action_layout.unpack_from(data)[1:])
+        elif packet_id == BlockLine.id:
+            self.on_block_line(*block_line_layout.unpack_from(data)[1:])
+        elif packet_id == SetColor.id:
+            if data[1] not in self.painted:
+                self.supersede((packet_id, data[1]))
+            else:
+                self.latest[packet_id, data[1]] = len(self.entries)
+
+            self.painted.discard(data[1])
+        elif packet_id in (SetTool.id, ChangeWeapon.id):
+            self.supersede((packet_id, data[1]))
+        elif packet_id in (IntelPickup.id, IntelDrop.id):
+            if (flag := self.get_flag(data[1])) is not None:
+                self.supersede((MoveObject.id, flag))
+        elif packet_id == MoveObject.id:
+            if data[1] in (BLUE_FLAG, GREEN_FLAG):
+                self.supersede((MoveObject.id, data[1]))
+
+        self.entries.append(data)
+        self.count += 1
+
+        if len(self.entries) > max(COMPACT_MIN, 2 * self.count):
+            self.compact()
+
+        if self.count > self.limit:
+            self.overflow = True
+
+    def on_block_action(self, player_id, value, x, y, z):
+        if value == BUILD_BLOCK or value == DESTROY_BLOCK:
+            if value == BUILD_BLOCK:
+                self.painted.add(player_id)
+
+            # Destroying a block supersedes the previous change of it, building it only a previous build
+            # (the block might have existed before the download started)
+            if last := self.blocks.get((x, y, z)):
+                index, last_value = last
+
+                if value == DESTROY_BLOCK or last_value == BUILD_BLOCK:
+                    self.drop(index)
+
+            self.blocks[x, y, z] = (len(self.entries), value)
+        else:
+            for voxel in get_destroyed(value, x, y, z):
+                if last := self.blocks.pop(voxel, None):
+                    self.drop(last[0])
+
+    def on_block_line(self, player_id, x1, y1, z1, x2, y2, z2):
+        self.painted.add(player_id)
+
+        # A line skips the blocks that already exist: an earlier build is still needed for its color,
+        # it is only no longer the last change of its block
+        for voxel in cube_line(x1, y1, z1, x2, y2, z2):
+            self.blocks.pop(voxel, None)
@@ -0,0 +1,474 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Micro-benchmarks of the hot paths of the arena, timed with `timeit` in this process: the arena
+game mode and the scripts `falloff`, `handicap` and `map_extensions` are loaded on top of
+`BenchProtocol` (a protocol without network), on a map of the rotation, with 32 players
+whose packets are counted and dropped by `BenchPeer`.
+
+    python -m arenalib.bench [-d CONFIG_DIR] [-c CONFIG_FILE] [--map MAP] [--number N] [--repeat R] [--json FILE] [BENCHMARK...]
+
+Every benchmark is run R times N calls (by default, as many calls as fit in 0.2 s), and reported
+as the best and the mean time per call, with the packets sent per call. The benchmarks take place
+on a block of ground added to a corner of the map; those that modify it (grenades, line builds)
+move to another place on every call, so that every call does the same work, and start every
+repeat from the original map.
+"""
+
+from argparse import ArgumentParser
+from collections import deque
+from itertools import cycle, product
+from types import SimpleNamespace
+from time import monotonic
+import timeit
+import math
+import json
+import sys
+
+from os.path import join, abspath
+
+from pyspades.constants import RIFLE_WEAPON, SMG_WEAPON, SHOTGUN_WEAPON, TORSO
+from pyspades.contained import ExistingPlayer
+from pyspades.common import Vertex3
+from pyspades.types import IDPool
+from pyspades import world
+
+from piqueserver.config import config
+from piqueserver.server import FeatureProtocol, FeatureConnection
+from piqueserver.map import Map, RotationInfo
+from piqueserver import extensions
+
+from arenalib.mapconfig import ArenaMapConfig
+from arenalib.supervisor import load_config
+
+PROTOCOL_VERSION = 3
+
+SCRIPTS = ["falloff", "handicap", "map_extensions"]
+WEAPONS = (RIFLE_WEAPON, SMG_WEAPON, SHOTGUN_WEAPON)
+PLAYERS = 32
+
+class BenchPeer:
+    """
+    Stands for the enet peer of a player: counts the packets sent to it.
+    """
+
+    reliableDataInTransit = 0
+
+    def __init__(self, i):
+        self.address       = SimpleNamespace(host = "127.0.0.1", port = 40000 + i)
+        self.eventData     = PROTOCOL_VERSION
+        self.roundTripTime = 0
+        self.packets       = 0
+        self.bytes         = 0
+
+    def send(self, channel, packet):
+        self.packets += 1
+        self.bytes   += len(packet.data)
+
+    def disconnect(self, data = 0):
+        pass
+
+    def disconnect_later(self, data = 0):
+        pass
+
+class BenchProtocol(FeatureProtocol):
+    """
+    `FeatureProtocol` without its network, bans, console and timers, with the defaults of its config.
+    """
+
+    respawn_time             = 0
+    respawn_waves            = False
+    team1_name               = "Blue"
+    team2_name               = "Green"
+    team1_color              = (0, 0, 196)
+    team2_color              = (0, 196, 0)
+    friendly_fire            = False
+    friendly_fire_on_grief   = True
+    friendly_fire_time       = 2.0
+    spade_teamkills_on_grief = False
+    fall_damage              = True
+    teamswitch_interval      = 0
+    teamswitch_allowed       = True
+    max_players              = PLAYERS
+    melee_damage             = 100
+    max_connections_per_ip   = 0
+    passwords                = {}
+    server_prefix            = "[*]"
+    time_announcements       = []
+    balanced_teams           = None
+    login_retries            = 1
+    command_limit_size       = 5
+    command_limit_time       = 2
+    default_time_limit       = 0
+    default_cap_limit        = 10
+    speedhack_detect         = False
+    rubberband_distance      = None
+    set_god_build            = False
+    motd                     = None
+    max_connections          = PLAYERS
+
+    def __init__(self):
+        self.config         = {}
+        self.bans           = {}
+        self.hard_bans      = set()
+        self.player_memory  = deque(maxlen = 100)
+        self.end_calls      = []
+        self.start_time     = monotonic()
+        self.game_mode_name = "arena"
+
+        # `ServerProtocol.__init__`, but for the host and the master server
+        self.host        = None
+        self.connections = {}
+        self.clients     = {}
+        self.entities    = []
+        self.players     = {}
+        self.player_ids  = IDPool()
+
+        self._create_teams()
+
+        self.world    = world.World()
+        self.pos_table = sorted(
+            product(range(-5, 6), repeat = 3),
+            key = lambda v: abs(v[0] * 1.03) + abs(v[1] * 1.02) + abs(v[2] * 1.01)
+        )
+
+        self.last_network_update = self.world_time = monotonic()
+        self.loop_count = 0
+
+    def set_map_info(self, map_info):
+        # `FeatureProtocol.set_map_name`, with a map already loaded
+        if self.map_info:
+            self.on_map_leave()
+
+        self.map_info  = map_info
+        self.max_score = map_info.cap_limit or self.default_cap_limit
+        self.set_map(map_info.data)
+
+    def irc_say(self, msg, me = False):
+        pass
+
+    def set_time_limit(self, time_limit = None, additive = False):
+        pass
+
+    def update_format(self):
+        pass
+
+    def update_master(self):
+        pass
+
+    def get_sent(self):
+        return sum(player.peer.packets for player in self.connections.values())
+
+def load_classes(config_dir):
+    scripts = extensions.load_scripts_regular_extension(SCRIPTS, join(config_dir, "scripts"))
+    protocol_class, connection_class = extensions.apply_scripts(scripts, config, BenchProtocol, FeatureConnection)
+
+    game_mode = extensions.load_script_game_mode("arena", join(config_dir, "game_modes"))
+    protocol_class, connection_class = extensions.apply_scripts(game_mode, config, protocol_class, connection_class)
+
+    protocol_class.connection_class = connection_class
+
+    return protocol_class
+
+def join_player(protocol, i):
+    peer   = BenchPeer(i)
+    player = protocol.connection_class(protocol, peer)
+
+    protocol.connections[peer] = player
+    player.player_id = protocol.player_ids.pop()
+
+    contained        = ExistingPlayer()
+    contained.team   = i % 2
+    contained.weapon = WEAPONS[i % len(WEAPONS)]
+    contained.name   = "Bench{}".format(i + 1)
+
+    player.on_new_player_recieved(contained)
+
+    return player
+
+# A flat block of ground added to the map for the benchmarks, in a corner of it
+GROUND_X, GROUND_Y = 8, 8
+GROUND_SIZE        = 192
+GROUND_TOP         = 40
+GROUND_COLOR       = 0x7F7F7F
+
+def add_ground(M):
+    for x, y in product(range(GROUND_X, GROUND_X + GROUND_SIZE), range(GROUND_Y, GROUND_Y + GROUND_SIZE)):
+        M.set_column_fast(x, y, GROUND_TOP, 62, GROUND_TOP + 4, GROUND_COLOR)
+
+def set_world_map(protocol, M = None):
+    if M is not None:
+        protocol.map = protocol.world.map = M
+
+    # The raycasts of the physics use the map given to them by the last step of the world
+    protocol.world.update(0.0)
+
+def load_map(config_dir, map_name):
+    return Map(RotationInfo(map_name), join(config_dir, "maps"))
+
+def make_arena(config_dir, map_name):
+    map_info = load_map(config_dir, map_name)
+    add_ground(map_info.data)
+
+    protocol = load_classes(config_dir)()
+    protocol.set_map_info(map_info)
+
+    players = [join_player(protocol, i) for i in range(PLAYERS)]
+
+    protocol.begin_arena(await_players = False)
+    set_world_map(protocol)
+
+    return protocol, players
+
+def get_columns(step):
+    # Columns of the ground, far enough apart for what is done at one to leave the others alone
+    xs = range(GROUND_X + step, GROUND_X + GROUND_SIZE - step, step)
+    ys = range(GROUND_Y + step, GROUND_Y + GROUND_SIZE - step, step)
+
+    return cycle(product(xs, ys))
+
+def place(player, x, y, z, orientation = (1, 0, 0)):
+    wo = player.world_object
+    wo.set_position(x, y, z)
+    wo.orientation.x, wo.orientation.y, wo.orientation.z = orientation
+
+def consume(iterable):
+    deque(iterable, maxlen = 0)
+
+benchmarks = dict()
+
+def benchmark(name, modifies_map = False):
+    """
+    Registers `setup(protocol, players)`, which returns the function to time. The map of the benchmarks
+    that modify it is restored before every repeat.
+    """
+
+    def decorator(setup):
+        benchmarks[name] = (setup, modifies_map)
+        return setup
+
+    return decorator
+
+@benchmark("cube_line")
+def bench_cube_line(protocol, players):
+    from arenalib.raycast import cube_line
+
+    return lambda: consume(cube_line(100, 100, 10, 150, 130, 40))
+
+@benchmark("line_rasterizer")
+def bench_line_rasterizer(protocol, players):
+    from arenalib.raycast import line_rasterizer
+
+    return lambda: consume(line_rasterizer(100.5, 100.5, 30.5, 0.8, 0.6, 0.0))
+
+@benchmark("cast")
+def bench_cast(protocol, players):
+    from arenalib.raycast import cast
+
+    r, v = Vertex3(100.5, 100.5, 30.5), Vertex3(0.8, 0.6, 0.0)
+
+    return lambda: consume(cast(r.copy(), v))
+
+@benchmark("wall_tunnel")
+def bench_wall_tunnel(protocol, players):
+    from arenalib.common import wall_tunnel
+
+    M, player = protocol.map, players[0]
+
+    # A wall 3 blocks thick above the ground, in front of the player
+    x, y, z = GROUND_X + 16, GROUND_Y + 16, GROUND_TOP - 20
+
+    for X, Y, Z in product(range(x, x + 3), range(y - 4, y + 5), range(z - 5, z + 5)):
+        M.set_point(X, Y, Z, (127, 127, 127))
+
+    def call():
+        place(player, x - 1.5, y + 0.5, z - 1.0)
+        wall_tunnel(player)
+
+    return call
+
+@benchmark("block_line", modifies_map = True)
+def bench_block_line(protocol, players):
+    from arenalib.maptools import doBlockLinePacket
+
+    # Lines of 12 blocks, standing on the ground (or on the previous line at the same place)
+    player  = players[0]
+    columns = get_columns(3)
+
+    def call():
+        x, y = next(columns)
+        z = protocol.map.get_z(x, y) - 1
+        doBlockLinePacket(player, x, y, z, x + 2, y + 1, z - 8)
+
+    return call
+
+@benchmark("grenade_destroy", modifies_map = True)
+def bench_grenade_destroy(protocol, players):
+    player  = players[0]
+    columns = get_columns(3)
+
+    def call():
+        x, y = next(columns)
+        player.grenade_destroy(x + 0.5, y + 0.5, protocol.map.get_z(x, y) + 0.5)
+
+    return call
+
+@benchmark("grenade_exploded")
+def bench_grenade_exploded(protocol, players):
+    # Every player is in the air, 24 blocks away from the grenade: the enemies are hit, not killed.
+    # The terrain destroyed by a grenade is `grenade_destroy`.
+    thrower = players[0]
+
+    x, y, z = GROUND_X + GROUND_SIZE / 2, GROUND_Y + GROUND_SIZE / 2, GROUND_TOP - 20
+
+    for i, player in enumerate(players):
+        a = 2 * math.pi * i / len(players)
+        place(player, x + 24 * math.cos(a), y + 24 * math.sin(a), z)
+
+    grenade = protocol.world.create_object(world.Grenade, 1e9, Vertex3(x, y, z), None, Vertex3(0, 0, 0), None)
+    grenade.team = thrower.team
+
+    def call():
+        thrower.grenade_exploded(grenade)
+
+        for player in players:
+            player.hp = 100
+
+    return call
+
+@benchmark("defusal")
+def bench_defusal(protocol, players):
+    from arenalib.defusal import arena_try_defuse
+
+    # A heartbeat of the defusal: the bomb of one team is planted, one of the other team defuses it
+    defuser, team = players[0], players[0].team.other
+    position = defuser.world_object.position.copy()
+
+    bomb = protocol.world.create_object(world.Grenade, 1e9, position, None, Vertex3(0, 0, 0), None)
+    bomb.team = team
+    team.bomb = bomb
+
+    defuser.bomb_defusal_timer = monotonic()
+
+    def call():
+        for player in players:
+            arena_try_defuse(player)
+
+    return call
+
+@benchmark("falloff")
+def bench_falloff(protocol, players):
+    weapons = [player.weapon_object for player in players[:len(WEAPONS)]]
+    v1, v2  = Vertex3(100, 100, 30), Vertex3(140, 120, 35)
+
+    def call():
+        for weapon in weapons:
+            weapon.get_damage(TORSO, v1, v2)
+
+    return call
+
+@benchmark("position_update")
+def bench_position_update(protocol, players):
+    # A player within bounds, away from the water and from 16 teleporters
+    protocol.arena_config = ArenaMapConfig({
+        **protocol.map_info.extensions,
+        'water_damage':        100,
+        'boundary_damage':     dict(left = 2, right = 510, top = 2, bottom = 510, damage = 100),
+        'boundary_blue_team':  dict(near = 1, damage = 100),
+        'boundary_green_team': dict(near = 1, damage = 100),
+        'teleporters': [
+            dict(xmin = x, xmax = x + 2, ymin = 400, ymax = 402, zmin = 0, zmax = 64, xout = x, yout = 100, zout = 10)
+            for x in range(16, 512, 32)
+        ]
+    }, protocol.refill_interval)
+
+    player = players[0]
+    place(player, GROUND_X + 32.5, GROUND_Y + 32.5, GROUND_TOP - 3)
+
+    return player.on_position_update
+
+def run_benchmark(name, protocol, players, number, repeat):
+    setup, modifies_map = benchmarks[name]
+
+    call = setup(protocol, players)
+
+    if modifies_map:
+        original = protocol.map.copy()
+
+        def restore():
+            set_world_map(protocol, original.copy())
+
+        timer = timeit.Timer(call, restore)
+    else:
+        timer = timeit.Timer(call)
+
+    if number <= 0:
+        number, _ = timer.autorange()
+
+    sent = protocol.get_sent()
+    times = [t / number for t in timer.repeat(repeat, number)]
+    sent = protocol.get_sent() - sent
+
+    # Microseconds per call
+    return {
+        "name":    name,
+        "number":  number,
+        "repeat":  repeat,
+        "best":    1e6 * min(times),
+        "mean":    1e6 * sum(times) / repeat,
+        "packets": sent / (number * repeat)
+    }
+
+def format_result(result):
+    return "{name:<18} best {best:10.2f} µs  mean {mean:10.2f} µs  {packets:6.1f} packets/call  ({repeat} × {number})".format(**result)
+
+def main(argv = None):
+    parser = ArgumentParser(prog = "python -m arenalib.bench", description = "Time the hot paths of the arena.")
+    parser.add_argument("names", nargs = "*", metavar = "BENCHMARK", help = "{} (default: all)".format(", ".join(benchmarks)))
+    parser.add_argument("-d", "--config-dir", default = ".", help = "directory of the maps, scripts and game modes (default: .)")
+    parser.add_argument("-c", "--config-file", default = None, help = "config file of the server (default: none)")
+    parser.add_argument("--map", default = "Babylon#1", help = "map of the benchmarks (default: Babylon#1)")
+    parser.add_argument("--number", type = int, default = 0, help = "calls per repeat (default: as many as fit in 0.2 s)")
+    parser.add_argument("--repeat", type = int, default = 5, help = "repeats of every benchmark (default: 5)")
+    parser.add_argument("--json", metavar = "FILE", help = "write the results to FILE")
+
+    args = parser.parse_args(argv)
+
+    if unknown := [name for name in args.names if name not in benchmarks]:
+        parser.error("unknown benchmark: {}".format(", ".join(unknown)))
+
+    config_dir = abspath(args.config_dir)
+
+    # Before the game mode is loaded: it reads its options once
+    if args.config_file is not None:
+        load_config(config_dir, abspath(args.config_file))
+
+    protocol, players = make_arena(config_dir, args.map)
+
+    results = []
+
+    for name in args.names or benchmarks:
+        results.append(result := run_benchmark(name, protocol, players, args.number, args.repeat))
+        print(format_result(result), flush = True)
+
+    if args.json is not None:
+        with open(args.json, 'w') as fout:
+            json.dump({"map": args.map, "players": len(players), "results": results}, fout, indent = 2)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,489 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Headless clients (protocol 0.75) simulating players, for load tests (see `arenalib.loadtest`).
+
+Bots do not load the map: they walk towards the enemies they see in the world updates
+(or the enemy intel, or a planted bomb to defuse it), shoot them and throw grenades,
+or build and dig around themselves. Like the actions of real players, some of theirs
+are rejected by the server (a hit through a wall, a block with nothing to stick to).
+"""
+
+from random import Random
+from time import monotonic
+import math
+
+import enet
+
+from pyspades.contained import (
+    ExistingPlayer, InputData, OrientationData, PositionData, WeaponInput,
+    WeaponReload, HitPacket, GrenadePacket, SetTool, SetColor, BlockAction,
+    BlockLine, ChatMessage, StateData, CreatePlayer, KillAction, PlayerLeft,
+    WorldUpdate, IntelPickup, IntelDrop, MoveObject, CTFState
+)
+
+from pyspades.packet import load_server_packet
+from pyspades.bytes import ByteReader, ByteWriter
+from pyspades.constants import *
+
+PROTOCOL_VERSION = 3 # 0.75
+
+FIGHTER = 'fighter'
+BUILDER = 'builder'
+
+# Delay between two hits, number of shots in a clip and time to reload it (seconds)
+weapon_cadence = {
+    RIFLE_WEAPON:   (0.5, 10, 2.5),
+    SMG_WEAPON:     (0.1, 30, 2.5),
+    SHOTGUN_WEAPON: (1.0, 6,  3.0),
+}
+
+ORIENTATION_RATE = 30.0 # orientation updates per second
+POSITION_RATE    = 1.0  # position updates per second
+BUILD_INTERVAL   = 0.6  # above `TOOL_INTERVAL[BLOCK_TOOL]`, to stay clear of the rapid hack detection
+CHAT_INTERVAL    = 2.0
+FIRE_DISTANCE    = 96.0
+
+# Grenades thrown by players have a fuse of at most 3 s: longer ones are bombs being planted
+BOMB_MIN_FUSE = 5.0
+
+def encode(contained):
+    writer = ByteWriter()
+    contained.write(writer)
+
+    return bytes(writer)
+
+class BotStats:
+    __slots__ = ('sent', 'received', 'sent_bytes', 'received_bytes')
+
+    def __init__(self):
+        self.sent           = 0
+        self.received       = 0
+        self.sent_bytes     = 0
+        self.received_bytes = 0
+
+    def add(self, other):
+        self.sent           += other.sent
+        self.received       += other.received
+        self.sent_bytes     += other.sent_bytes
+        self.received_bytes += other.received_bytes
+
+class Bot:
+    def __init__(self, name, team, weapon, role, address, seed = None):
+        self.name   = name
+        self.team   = team
+        self.weapon = weapon
+        self.role   = role
+        self.random = Random(seed)
+        self.stats  = BotStats()
+
+        host, port = address
+
+        # A host (so a socket) of its own, as every real client
+        self.host = enet.Host(None, 1, 1, 0, 0)
+        self.host.compress_with_range_coder()
+        self.peer = self.host.connect(enet.Address(host.encode(), port), 1, PROTOCOL_VERSION)
+
+        self.connected    = False
+        self.disconnected = False
+        self.player_id    = None
+        self.alive        = False
+        self.spawned      = False
+        self.position     = None
+        self.orientation  = (1.0, 0.0, 0.0)
+        self.teams        = dict() # player_id → team
+        self.dead         = set()
+        self.positions    = []
+        self.flags        = dict() # team → position of its intel
+        self.intel        = False
+        self.bomb         = None
+        self.bomb_until   = 0.0
+        self.firing       = False
+        self.shots        = 0
+        self.tool         = WEAPON_TOOL
+
+        self.next_input       = 0.0
+        self.next_orientation = 0.0
+        self.next_position    = 0.0
+        self.next_shot        = 0.0
+        self.next_grenade     = 0.0
+        self.next_build       = 0.0
+        self.next_chat        = 0.0
+
+        self.handlers = {
+            StateData.id:      self.on_state_data,
+            CreatePlayer.id:   self.on_create_player,
+            ExistingPlayer.id: self.on_existing_player,
+            PlayerLeft.id:     self.on_player_left,
+            KillAction.id:     self.on_kill_action,
+            WorldUpdate.id:    self.on_world_update,
+            PositionData.id:   self.on_position_data,
+            IntelPickup.id:    self.on_intel_pickup,
+            IntelDrop.id:      self.on_intel_drop,
+            MoveObject.id:     self.on_move_object,
+            GrenadePacket.id:  self.on_grenade,
+        }
+
+    def send(self, contained):
+        data = encode(contained)
+
+        self.stats.sent       += 1
+        self.stats.sent_bytes += len(data)
+
+        self.peer.send(0, enet.Packet(data, enet.PACKET_FLAG_RELIABLE))
+
+    def disconnect(self):
+        if self.connected and not self.disconnected:
+            self.peer.disconnect()
+            self.host.flush()
+
+        self.disconnected = True
+
+    def service(self):
+        while (event := self.host.service(0)) is not None:
+            if event.type == enet.EVENT_TYPE_NONE:
+                break
+            elif event.type == enet.EVENT_TYPE_CONNECT:
+                self.connected = True
+            elif event.type == enet.EVENT_TYPE_DISCONNECT:
+                self.disconnected = True
+                self.alive        = False
+            elif event.type == enet.EVENT_TYPE_RECEIVE:
+                data = event.packet.data
+
+                self.stats.received       += 1
+                self.stats.received_bytes += len(data)
+
+                # Only the packets that the bots act upon are decoded (not the map, notably)
+                if data and (handler := self.handlers.get(data[0])):
+                    try:
+                        contained = load_server_packet(ByteReader(data))
+                    except Exception:
+                        continue
+
+                    handler(contained)
+
+    # Server packets
+
+    def on_state_data(self, contained):
+        self.player_id = contained.player_id
+
+        if isinstance(state := contained.state, CTFState):
+            self.flags[0] = (state.team1_flag_x, state.team1_flag_y, state.team1_flag_z)
+            self.flags[1] = (state.team2_flag_x, state.team2_flag_y, state.team2_flag_z)
+
+        join           = ExistingPlayer()
+        join.player_id = self.player_id
+        join.team      = self.team
+        join.weapon    = self.weapon
+        join.tool      = WEAPON_TOOL
+        join.kills     = 0
+        join.color     = 0
+        join.name      = self.name
+
+        self.send(join)
+
+    def on_create_player(self, contained):
+        self.teams[contained.player_id] = contained.team
+        self.dead.discard(contained.player_id)
+
+        if contained.player_id == self.player_id:
+            self.alive    = True
+            self.spawned  = True
+            self.position = (contained.x, contained.y, contained.z)
+            self.intel    = False
+            self.firing   = False
+            self.shots    = 0
+            self.tool     = WEAPON_TOOL
+
+            if self.role == BUILDER:
+                color           = SetColor()
+                color.player_id = self.player_id
+                color.value     = self.random.randrange(1 << 24)
+
+                self.send(color)
+                self.set_tool(BLOCK_TOOL)
+
+    def on_existing_player(self, contained):
+        self.teams[contained.player_id] = contained.team
+
+    def on_player_left(self, contained):
+        self.teams.pop(contained.player_id, None)
+        self.dead.discard(contained.player_id)
+
+    def on_kill_action(self, contained):
+        self.dead.add(contained.player_id)
+
+        if contained.player_id == self.player_id:
+            self.alive = False
+            self.intel = False
+
+    def on_world_update(self, contained):
+        self.positions = contained.items
+
+        if self.alive and self.player_id < len(self.positions):
+            self.position = self.positions[self.player_id][0]
+
+    def on_position_data(self, contained):
+        self.position = (contained.x, contained.y, contained.z)
+
+    def on_intel_pickup(self, contained):
+        if contained.player_id == self.player_id:
+            self.intel = True
+
+    def on_intel_drop(self, contained):
+        if contained.player_id == self.player_id:
+            self.intel = False
+
+    def on_move_object(self, contained):
+        if contained.object_type in (BLUE_FLAG, GREEN_FLAG):
+            self.flags[contained.object_type] = (contained.x, contained.y, contained.z)
+
+    def on_grenade(self, contained):
+        if contained.value >= BOMB_MIN_FUSE and self.teams.get(contained.player_id) not in (None, self.team):
+            self.bomb       = contained.position
+            self.bomb_until = monotonic() + contained.value
+
+    # Actions
+
+    def set_tool(self, tool):
+        contained           = SetTool()
+        contained.player_id = self.player_id
+        contained.value     = tool
+
+        self.tool = tool
+        self.send(contained)
+
+    def set_weapon_input(self, primary, secondary = False):
+        contained           = WeaponInput()
+        contained.player_id = self.player_id
+        contained.primary   = primary
+        contained.secondary = secondary
+
+        self.send(contained)
+
+    def get_target(self):
+        """
+        Returns the player id and the position of the nearest living enemy, or `(None, None)`.
+        """
+
+        if self.position is None:
+            return None, None
+
+        x, y, z = self.position
+        nearest, target, position = math.inf, None, None
+
+        for player_id, (r, _) in enumerate(self.positions):
+            if self.teams.get(player_id, self.team) == self.team or player_id in self.dead:
+                continue
+
+            if r == (0.0, 0.0, 0.0):
+                continue
+
+            d = (r[0] - x) ** 2 + (r[1] - y) ** 2 + (r[2] - z) ** 2
+
+            if d < nearest:
+                nearest, target, position = d, player_id, r
+
+        return target, position
+
+    def aim(self, position):
+        x, y, z = self.position
+        dx, dy, dz = position[0] - x, position[1] - y, position[2] - z
+
+        # Hidden intels are infinitely far away
+        if 1e-3 < (norm := math.sqrt(dx * dx + dy * dy + dz * dz)) < math.inf:
+            self.orientation = (dx / norm, dy / norm, dz / norm)
+
+    def wander(self):
+        angle = self.random.uniform(0, 2 * math.pi)
+        self.orientation = (math.cos(angle), math.sin(angle), 0.0)
+
+    def update_input(self, t):
+        contained           = InputData()
+        contained.player_id = self.player_id
+        contained.up        = self.random.random() < 0.8
+        contained.down      = False
+        contained.left      = self.random.random() < 0.2
+        contained.right     = not contained.left and self.random.random() < 0.2
+        contained.jump      = self.random.random() < 0.1
+        contained.crouch    = self.random.random() < 0.05
+        contained.sneak     = self.role == BUILDER
+        contained.sprint    = self.role == FIGHTER and self.random.random() < 0.3
+
+        self.send(contained)
+        self.next_input = t + self.random.uniform(0.5, 2.0)
+
+    def update(self, t):
+        if self.disconnected or self.player_id is None or not self.alive or self.position is None:
+            return
+
+        if t >= self.next_input:
+            self.update_input(t)
+
+        if self.role == FIGHTER:
+            self.fight(t)
+        else:
+            self.build(t)
+
+        if t >= self.next_orientation:
+            contained = OrientationData()
+            contained.x, contained.y, contained.z = self.orientation
+
+            self.send(contained)
+            self.next_orientation = max(self.next_orientation + 1 / ORIENTATION_RATE, t)
+
+        if t >= self.next_position:
+            contained = PositionData()
+            contained.x, contained.y, contained.z = self.position
+
+            self.send(contained)
+            self.next_position = t + 1 / POSITION_RATE
+
+    def fight(self, t):
+        target, position = self.get_target()
+
+        if self.bomb is not None and t < self.bomb_until:
+            self.aim(self.bomb)
+        elif position is not None:
+            self.aim(position)
+        elif (flag := self.flags.get(1 - self.team)) is not None and not self.intel:
+            self.aim(flag)
+        elif t >= self.next_input:
+            self.wander()
+
+        if self.intel and t >= self.next_chat:
+            contained           = ChatMessage()
+            contained.player_id = self.player_id
+            contained.chat_type = CHAT_ALL
+            contained.value     = "/plant"
+
+            self.send(contained)
+            self.next_chat = t + CHAT_INTERVAL
+
+        if t >= self.next_grenade:
+            if self.next_grenade > 0:
+                self.throw_grenade()
+
+            self.next_grenade = t + self.random.uniform(10.0, 20.0)
+
+        interval, clip, reload_time = weapon_cadence[self.weapon]
+
+        if target is None or self.distance(position) > FIRE_DISTANCE:
+            if self.firing:
+                self.set_weapon_input(False)
+                self.firing = False
+
+            return
+
+        if t < self.next_shot:
+            return
+
+        if not self.firing:
+            self.set_weapon_input(True)
+            self.firing = True
+
+        # A shotgun shot is several pellets, which might hit different parts of the body
+        for k in range(3 if self.weapon == SHOTGUN_WEAPON else 1):
+            contained           = HitPacket()
+            contained.player_id = target
+            contained.value     = HEAD if self.random.random() < 0.2 else TORSO
+
+            self.send(contained)
+
+        self.shots += 1
+
+        if self.shots >= clip:
+            self.set_weapon_input(False)
+            self.firing = False
+
+            contained              = WeaponReload()
+            contained.player_id    = self.player_id
+            contained.clip_ammo    = 0
+            contained.reserve_ammo = 0
+
+            self.send(contained)
+
+            self.shots     = 0
+            self.next_shot = t + reload_time
+        else:
+            self.next_shot = t + interval
+
+    def throw_grenade(self):
+        if self.firing:
+            self.set_weapon_input(False)
+            self.firing = False
+
+        self.set_tool(GRENADE_TOOL)
+
+        dx, dy, dz = self.orientation
+
+        contained           = GrenadePacket()
+        contained.player_id = self.player_id
+        contained.value     = self.random.uniform(1.5, 3.0)
+        contained.position  = self.position
+        contained.velocity  = (dx, dy, dz - 0.2)
+
+        self.send(contained)
+        self.set_tool(WEAPON_TOOL)
+
+    def distance(self, position):
+        return math.dist(self.position, position)
+
+    def build(self, t):
+        if t >= self.next_input:
+            self.wander()
+
+        if t < self.next_build:
+            return
+
+        self.next_build = t + BUILD_INTERVAL
+
+        # The position of a player standing is 3 blocks above the ground below them
+        x, y, z = map(int, self.position)
+        ground  = min(62, int(self.position[2] + 3))
+
+        dx, dy = self.random.choice(((1, 0), (-1, 0), (0, 1), (0, -1)))
+        action = self.random.random()
+
+        if action < 0.5:
+            contained           = BlockAction()
+            contained.player_id = self.player_id
+            contained.value     = BUILD_BLOCK
+            contained.x, contained.y, contained.z = x + dx, y + dy, ground - 1
+
+            self.send(contained)
+        elif action < 0.8:
+            # Line builds start with the secondary fire
+            self.set_weapon_input(False, True)
+
+            contained           = BlockLine()
+            contained.player_id = self.player_id
+            contained.x1, contained.y1, contained.z1 = x + dx - dy, y + dy - dx, ground - 1
+            contained.x2, contained.y2, contained.z2 = x + dx + dy, y + dy + dx, ground - 1
+
+            self.send(contained)
+            self.set_weapon_input(False, False)
+        else:
+            self.set_tool(SPADE_TOOL)
+
+            contained           = BlockAction()
+            contained.player_id = self.player_id
+            contained.value     = DESTROY_BLOCK
+            contained.x, contained.y, contained.z = x + dx, y + dy, ground
+
+            self.send(contained)
+            self.set_tool(BLOCK_TOOL)
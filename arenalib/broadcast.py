@@ -0,0 +1,209 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import Counter
+from math import cos, radians
+import textwrap
+import enet
+
+from pyspades.contained import ChatMessage
+from pyspades.bytes import ByteWriter
+from pyspades.constants import (
+    CHAT_ALL, CHAT_TEAM, CHAT_SYSTEM, CHAT_BIG, CHAT_INFO, CHAT_WARNING, CHAT_ERROR,
+    MAX_CHAT_SIZE, EXTENSION_CHATTYPE, OPENSPADES_CHATTYPES, FOG_DISTANCE
+)
+
+from piqueserver.config import config
+
+from arenalib.mapcache import map_packet_ids
+
+arena_section = config.section("arena")
+
+# Purely visual effects are only sent to players within this distance of them (blocks)...
+arena_effect_radius = arena_section.option("effect_radius", 64.0).get()
+
+# ...or looking at them, within this angle from the direction of view (degrees, 0 to disable)
+arena_effect_cone = arena_section.option("effect_cone", 60.0).get()
+
+# Clients see a chat message in one of these forms (cf. `ServerConnection.send_chat`)
+CHAT_PLAIN    = 0 # vanilla client: system message
+CHAT_EXTENDED = 1 # client with the chat type extension
+CHAT_PREFIXED = 2 # OpenSpades/BetterSpades without the extension: type given as a text prefix
+
+def chat_variant(player, custom_type):
+    if custom_type > CHAT_SYSTEM and "client" in player.client_info:
+        if EXTENSION_CHATTYPE in player.proto_extensions:
+            return CHAT_EXTENDED
+        else:
+            return CHAT_PREFIXED
+    else:
+        return CHAT_PLAIN
+
+def encode_chat(value, player_id, chat_type, prefix = ''):
+    packets = []
+
+    contained           = ChatMessage()
+    contained.player_id = player_id
+    contained.chat_type = chat_type
+
+    for line in textwrap.wrap(value, MAX_CHAT_SIZE - len(prefix) - 1):
+        contained.value = '{}{}'.format(prefix, line)
+
+        writer = ByteWriter()
+        contained.write(writer)
+
+        packets.append(enet.Packet(bytes(writer), enet.PACKET_FLAG_RELIABLE))
+
+    return packets
+
+def encode_chat_variant(protocol, value, custom_type, global_message, variant):
+    if variant == CHAT_EXTENDED:
+        return encode_chat(value, 35, custom_type)
+    elif variant == CHAT_PREFIXED:
+        return encode_chat(OPENSPADES_CHATTYPES[custom_type] + value, 35, CHAT_ALL)
+    elif global_message:
+        return encode_chat(value, 35, CHAT_TEAM, protocol.server_prefix + ' ')
+    else:
+        return encode_chat(value, 0, CHAT_SYSTEM)
+
+def broadcast_chat_message(
+    protocol, value, custom_type = CHAT_ALL, global_message = False,
+    team = None, rule = None, sender = None
+):
+    """
+    Sends a chat message to every player (or to a team, or to the players accepted by `rule`).
+    Every form of the message is encoded once, however many players receive it.
+    """
+
+    variants = dict()
+    sent     = Counter() # variant → number of players
+
+    for player in protocol.players.values():
+        if player is sender or player.deaf or player.disconnected:
+            continue
+
+        if team is not None and player.team is not team:
+            continue
+
+        if rule is not None and not rule(player):
+            continue
+
+        variant = chat_variant(player, custom_type)
+
+        if (packets := variants.get(variant)) is None:
+            packets = variants[variant] = encode_chat_variant(
+                protocol, value, custom_type, global_message, variant
+            )
+
+        for packet in packets:
+            player.peer.send(0, packet)
+
+        sent[variant] += 1
+
+    if stats := protocol.net_stats:
+        for variant, count in sent.items():
+            for packet in variants[variant]:
+                stats.record_sent(packet.data[0], packet.dataLength, count)
+
+def send_data(player, data, unsequenced = False):
+    """
+    Same as `ServerConnection.send_contained`, but for a packet that is already encoded.
+    """
+
+    flags = enet.PACKET_FLAG_UNSEQUENCED if unsequenced else enet.PACKET_FLAG_RELIABLE
+    player.peer.send(0, enet.Packet(data, flags))
+
+    if stats := player.protocol.net_stats:
+        stats.record_sent(data[0], len(data), 1)
+
+def broadcast_data(protocol, data, unsequenced = False, sender = None, team = None, save = False, rule = None):
+    """
+    Same as `ServerProtocol.broadcast_contained`, but for a packet that is already encoded.
+    """
+
+    if data[0] in map_packet_ids:
+        protocol.on_map_packet(data)
+
+    flags = enet.PACKET_FLAG_UNSEQUENCED if unsequenced else enet.PACKET_FLAG_RELIABLE
+    packet = enet.Packet(data, flags)
+
+    sent = saved = 0
+
+    for player in protocol.connections.values():
+        if player is sender or player.player_id is None:
+            continue
+
+        if team is not None and player.team is not team:
+            continue
+
+        if rule is not None and not rule(player):
+            continue
+
+        if player.saved_loaders is not None:
+            if save:
+                player.saved_loaders.append(data)
+                saved += 1
+        else:
+            player.peer.send(0, packet)
+            sent += 1
+
+    if stats := protocol.net_stats:
+        stats.record_sent(data[0], len(data), sent, saved, save)
+
+def sees_effect(player, x, y, z, radius = None, cone = None):
+    wo = player.world_object
+
+    if wo is None:
+        return True
+
+    radius = arena_effect_radius if radius is None else radius
+    cone   = arena_effect_cone if cone is None else cone
+
+    r = wo.position
+    dx, dy, dz = x - r.x, y - r.y, z - r.z
+
+    d2 = dx * dx + dy * dy + dz * dz
+
+    if d2 <= radius * radius:
+        return True
+
+    if cone <= 0 or d2 > FOG_DISTANCE * FOG_DISTANCE:
+        return False
+
+    o = wo.orientation
+    dot = dx * o.x + dy * o.y + dz * o.z
+
+    # cos(φ) ≥ cos(cone) with cos(φ) = dot / |d| (orientation is normalized)
+    return dot > 0 and dot * dot >= cos(radians(cone)) ** 2 * d2
+
+def broadcast_effect(protocol, data, x, y, z, radius = None, cone = None):
+    """
+    Sends a purely visual packet (e.g. a decorative explosion at (x, y, z)) only to the players
+    who are close enough to it or looking towards it. Nothing is saved for loading players.
+    """
+
+    broadcast_data(protocol, data, rule = lambda player: sees_effect(player, x, y, z, radius, cone))
+
+def broadcast_chat_status(protocol, value, **kw):
+    broadcast_chat_message(protocol, value, CHAT_BIG, **kw)
+
+def broadcast_chat_notice(protocol, value, **kw):
+    broadcast_chat_message(protocol, value, CHAT_INFO, **kw)
+
+def broadcast_chat_warning(protocol, value, **kw):
+    broadcast_chat_message(protocol, value, CHAT_WARNING, **kw)
+
+def broadcast_chat_error(protocol, value, **kw):
+    broadcast_chat_message(protocol, value, CHAT_ERROR, **kw)
@@ -16,11 +16,8 @@
 from datetime import datetime
 from time import monotonic
 
-from os.path import isfile, dirname, getmtime
-from os import makedirs
-
 from pyspades.constants import SPADE_TOOL, BLOCK_TOOL, WEAPON_TOOL, GRENADE_TOOL
-from pyspades.contained import GrenadePacket, IntelDrop
+from pyspades.contained import IntelDrop
 from pyspades.collision import vector_collision
 from pyspades.common import prettify_timespan
 
@@ -28,7 +25,10 @@ from piqueserver.commands import player_only, command, get_player
 from piqueserver.utils import timeparse
 from piqueserver.config import config
 
+from arenalib.savestore import get_store
 from arenalib.raycast import line_rasterizer
+from arenalib.broadcast import broadcast_effect
+from arenalib import packets
 
 class ArenaException(Exception):
     pass
@@ -40,34 +40,43 @@ flag_throw_distance = arena_section.option("flag_throw_distance", 5.0).get()
 @command('lsmap', 'statmap')
 def c_lsmap(connection, mapname):
     """
-    Give an information about `saves/X.vxl` map
+    Give an information about `saves/X` map
     /lsmap X or /statmap
     """
 
-    filename = "saves/{}.vxl".format(mapname)
+    store = get_store("saves")
 
-    if isfile(filename):
-        mtime = getmtime(filename)
+    if store.exists(mapname):
+        mtime = store.getmtime(mapname)
 
-        return "{}: {} (MODIFY)".format(
-            filename, datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
+        return "saves/{}: {} (MODIFY)".format(
+            mapname, datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
         )
     else:
-        return "{}: does not exist".format(filename)
+        return "saves/{}: does not exist".format(mapname)
 
 @command('savemap', 'save', admin_only = True)
 def c_savemap(connection, mapname):
     """
-    Save the current map to `saves/X.vxl`
+    Save the current map to `saves/X`
     /savemap X or /save
     """
 
-    filename = "saves/{}.vxl".format(mapname)
-    makedirs(dirname(filename), exist_ok = True)
+    get_store("saves").save(mapname, connection.protocol.map_cache.get_chunks())
+    return "Map saved to `saves/{}`".format(mapname)
+
+@command('savestore', admin_only = True)
+def c_savestore(connection):
+    """
+    Report the disk space used by the saved maps
+    /savestore
+    """
 
-    with open(filename, 'wb') as fout:
-        fout.write(connection.protocol.map.generate())
-        return "Map saved to `{}`".format(filename)
+    saves, chunks, size = get_store("saves").get_usage()
+
+    return "{} saves in {} chunks, {:.1f} MiB (a map is {:.1f} MiB uncompressed)".format(
+        saves, chunks, size / 1048576, len(connection.protocol.map_cache.get_data()) / 1048576
+    )
 
 @command('balance', 'money', 'cash')
 @player_only
@@ -107,6 +116,9 @@ def c_buy(player, argval = None):
     else:
         return "No `/buy {}` item is available".format(argval)
 
+    if not player.rate_limit('buy'):
+        return "You're doing that too often"
+
     for team in player.team, player.team.other:
         if vector_collision(player.world_object.position, team.base):
             player.try_use_buy_menu(tool)
@@ -229,14 +241,14 @@ def c_dropflag(player):
             return
 
         protocol = player.protocol
-        ds = protocol.map_info.extensions
+        cfg = protocol.arena_config
 
         if player.team is protocol.blue_team:
-            if 'arena_green_flag' not in ds:
+            if cfg.green_flag is None:
                 return
 
         if player.team is protocol.green_team:
-            if 'arena_blue_flag' not in ds:
+            if cfg.blue_flag is None:
                 return
 
         flag = player.team.other.flag
@@ -247,6 +259,9 @@ def c_dropflag(player):
         if flag.player is not player:
             return "You don't have the intel"
 
+        if not player.rate_limit('dropflag'):
+            return "You're doing that too often"
+
         if dest := wo.cast_ray(flag_throw_distance):
             loc = dest
         else:
@@ -271,13 +286,10 @@ def wall_tunnel(player):
             R = M.get_solid(x, y, z + 1)
 
             if not P and not Q and not R:
-                contained           = GrenadePacket()
-                contained.player_id = player.player_id
-                contained.value     = 0
-                contained.position  = wo.position.get()
-                contained.velocity  = (0, 0, 0)
+                r = wo.position.get()
+                data = packets.grenade_effect.encode(player.player_id, *r)
 
                 player.set_location((x, y, z))
-                protocol.broadcast_contained(contained)
+                broadcast_effect(protocol, data, *r)
 
                 return x, y, z
@@ -0,0 +1,162 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from struct import Struct
+from time import monotonic
+import enet
+
+from pyspades.contained import WorldUpdate
+from pyspades.constants import FOG_DISTANCE
+
+entry_layout = Struct('<6f')
+
+# What `ServerProtocol.update_network` sends for a player that should not be shown
+empty_entry = entry_layout.pack(0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+header = bytes((WorldUpdate.id,))
+
+class CullingState:
+    __slots__ = ('sent', 'visible', 'expires')
+
+    def __init__(self):
+        self.sent    = dict() # player → entry last sent to this client
+        self.visible = dict() # player → result of the last visibility test
+        self.expires = dict() # player → time when that result should be recomputed
+
+class WorldUpdateCuller:
+    """
+    Builds a separate `WorldUpdate` for every client: teammates and nearby visible enemies
+    are sent every time, distant ones every `far_interval` updates and the ones hidden
+    behind the terrain every `hidden_interval` updates (or never, if it is 0). Until then
+    the client keeps receiving the entry it was last sent, so the player stays in place.
+    """
+
+    def __init__(self, near_distance = 64.0, far_interval = 3, hidden_interval = 10, visibility_ttl = 0.3):
+        self.near_distance   = near_distance
+        self.far_interval    = far_interval
+        self.hidden_interval = hidden_interval
+        self.visibility_ttl  = visibility_ttl
+
+        self.states = dict()
+        self.count  = 0
+
+    def reset(self):
+        self.states.clear()
+
+    def forget(self, player):
+        self.states.pop(player, None)
+
+        for state in self.states.values():
+            state.sent.pop(player, None)
+            state.visible.pop(player, None)
+            state.expires.pop(player, None)
+
+    def get_entries(self, protocol, N):
+        entries = [empty_entry] * N
+
+        for i, player in protocol.players.items():
+            if player.filter_visibility_data or player.team is None or player.team.spectator:
+                continue
+
+            if wo := player.world_object:
+                r, o = wo.position, wo.orientation
+                entries[i] = entry_layout.pack(r.x, r.y, r.z, o.x, o.y, o.z)
+
+        return entries
+
+    def is_visible(self, state, player, viewer, target, t):
+        if state.expires.get(player, 0) > t:
+            return state.visible[player]
+
+        r = target.position
+        visible = viewer.can_see(r.x, r.y, r.z) or viewer.can_see(r.x, r.y, r.z + 1.5)
+
+        state.visible[player] = visible
+        state.expires[player] = t + self.visibility_ttl
+
+        return visible
+
+    def is_due(self, i, interval):
+        # Spread the players over the interval instead of refreshing all of them on the same update
+        return interval > 0 and (self.count + i) % interval == 0
+
+    def get_interval(self, state, player, viewer, target, t):
+        r, q = viewer.position, target.position
+
+        dx, dy, dz = q.x - r.x, q.y - r.y, q.z - r.z
+
+        if dx * dx + dy * dy > FOG_DISTANCE * FOG_DISTANCE:
+            return self.hidden_interval
+
+        if not self.is_visible(state, player, viewer, target, t):
+            return self.hidden_interval
+
+        if dx * dx + dy * dy + dz * dz > self.near_distance * self.near_distance:
+            return self.far_interval
+
+        return 1
+
+    def update_network(self, protocol):
+        if not len(protocol.players):
+            return
+
+        self.count += 1
+
+        N = max(protocol.players) + 1
+        entries = self.get_entries(protocol, N)
+
+        full = header + b''.join(entries)
+        t = monotonic()
+
+        states, self.states = self.states, dict()
+
+        clients = size = 0
+
+        for connection in protocol.connections.values():
+            if connection.player_id is None or connection.saved_loaders is not None:
+                continue
+
+            viewer = connection.world_object
+            team   = connection.team
+
+            if viewer is None or team is None or team.spectator:
+                data = full
+            else:
+                state = states.get(connection) or CullingState()
+                self.states[connection] = state
+
+                out, sent = list(entries), state.sent
+
+                for i, player in protocol.players.items():
+                    if out[i] is empty_entry or player is connection or player.team is team:
+                        continue
+
+                    if player in sent:
+                        interval = self.get_interval(state, player, viewer, player.world_object, t)
+
+                        if interval != 1 and not self.is_due(i, interval):
+                            out[i] = sent[player]
+
+                    sent[player] = out[i]
+
+                data = header + b''.join(out)
+
+            connection.peer.send(0, enet.Packet(data, enet.PACKET_FLAG_UNSEQUENCED))
+
+            clients += 1
+            size    += len(data)
+
+        if clients and (stats := protocol.net_stats):
+            stats.record_sent(WorldUpdate.id, size / clients, clients)
@@ -16,9 +16,7 @@
 from random import uniform
 from time import monotonic
 
-from twisted.internet import reactor
-
-from pyspades.contained import IntelDrop, GrenadePacket
+from pyspades.contained import IntelDrop
 from pyspades.collision import vector_collision
 from pyspades.common import Vertex3
 from pyspades import world
@@ -26,6 +24,9 @@ from pyspades import world
 from piqueserver.commands import player_only, command
 from piqueserver.config import config
 
+from arenalib.broadcast import broadcast_data, broadcast_effect, broadcast_chat_warning, broadcast_chat_error
+from arenalib import packets
+
 arena_cross_color = (255, 31, 31)
 
 def arena_mark_bombsite(vxl, x, y, z):
@@ -39,13 +40,7 @@ arena_bomb_defuse_time        = arena_section.option("bomb_defuse_kit", 10.0).ge
 arena_defuse_kit_time         = arena_section.option("defuse_kit_time", 5.0).get()
 
 def grenade_effect(protocol, player_id, x, y, z):
-    contained           = GrenadePacket()
-    contained.player_id = player_id
-    contained.value     = 0
-    contained.position  = (x, y, z)
-    contained.velocity  = (0, 0, 0)
-
-    protocol.broadcast_contained(contained)
+    broadcast_effect(protocol, packets.grenade_effect.encode(player_id, x, y, z), x, y, z)
 
 def arena_bomb_effect(player, bomb):
     player.grenade_exploded(bomb, dmax = 512)
@@ -54,14 +49,15 @@ def arena_bomb_effect(player, bomb):
     dx, dy, dz = 1.5, 1.5, 1.5
 
     for k in range(5):
-        reactor.callLater(
+        player.protocol.arena_timers.call_later(
             uniform(0.25, 0.75),
             grenade_effect,
             player.protocol,
             player.player_id,
             x + uniform(-dx, +dx),
             y + uniform(-dy, +dy),
-            z + uniform(-dz, +dz)
+            z + uniform(-dz, +dz),
+            scope = 'round'
         )
 
 def get_defuse_time(player):
@@ -87,8 +83,7 @@ def arena_try_defuse(player):
 
             player.team.other.bomb = None
 
-            for connection in player.protocol.players.values():
-                connection.send_chat_warning("The bomb has been defused.")
+            broadcast_chat_warning(player.protocol, "The bomb has been defused.")
     else:
         if player.bomb_defusal_timer is not None:
             player.bomb_defusal_timer = None
@@ -109,12 +104,12 @@ def c_plant(player):
         protocol = player.protocol
         team = player.team
 
-        ds = protocol.map_info.extensions
+        cfg = protocol.arena_config
 
         if player.team is protocol.blue_team:
-            sites = ds.get('arena_blue_bombsites', None)
+            sites = cfg.blue_bombsites
         elif player.team is protocol.green_team:
-            sites = ds.get('arena_green_bombsites', None)
+            sites = cfg.green_bombsites
         else:
             return
 
@@ -135,6 +130,9 @@ def c_plant(player):
         if flag.player is not player:
             return "You don't have the intel."
 
+        if not player.rate_limit('plant'):
+            return "You're doing that too often."
+
         x, y, z = wo.position.get()
 
         for site in sites:
@@ -162,21 +160,16 @@ def c_plant(player):
 
                 team.bomb = go
 
-                contained           = GrenadePacket()
-                contained.player_id = player.player_id
-                contained.value     = arena_bomb_fuse
-                contained.position  = wo.position.get()
-                contained.velocity  = (0, 0, 0)
-
-                protocol.broadcast_contained(contained)
+                broadcast_data(protocol, packets.grenade_effect.encode(
+                    player.player_id, *wo.position.get(), fuse = arena_bomb_fuse
+                ))
 
                 delay = arena_bomb_fuse + arena_bomb_explosion_duration
 
                 protocol.arena_limit_timer = max(protocol.arena_limit_timer, protocol.time + delay)
                 protocol.arena_timer_delay = max(protocol.arena_timer_delay, monotonic() + delay)
 
-                for connection in protocol.players.values():
-                    connection.send_chat_error("The bomb has been planted.")
+                broadcast_chat_error(protocol, "The bomb has been planted.")
 
                 return
 
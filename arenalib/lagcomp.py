@@ -0,0 +1,142 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from math import sqrt
+from array import array
+
+from pyspades.constants import TORSO, HEAD, ARMS, LEGS, MELEE, FOG_DISTANCE
+
+class PositionHistory:
+    """
+    Recent positions of a player with their timestamps, kept in preallocated arrays
+    that are overwritten in a circle, so recording a sample allocates nothing.
+    """
+
+    __slots__ = ('size', 't', 'x', 'y', 'z', 'head', 'count')
+
+    def __init__(self, size = 64):
+        self.size = size
+
+        self.t = array('d', bytes(8 * size))
+        self.x = array('d', bytes(8 * size))
+        self.y = array('d', bytes(8 * size))
+        self.z = array('d', bytes(8 * size))
+
+        self.clear()
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.head  = 0
+        self.count = 0
+
+    def push(self, t, x, y, z):
+        i = self.head
+
+        # Samples must stay sorted by time for the binary search.
+        if self.count > 0 and t < self.t[(i - 1) % self.size]:
+            return
+
+        self.t[i], self.x[i], self.y[i], self.z[i] = t, x, y, z
+
+        self.head  = (i + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def index(self, k):
+        # Physical index of the k-th oldest sample.
+        return (self.head - self.count + k) % self.size
+
+    def sample(self, t):
+        """
+        Returns the position at the time `t` interpolated between the two nearest samples,
+        clamped to the oldest and the newest ones, or `None` if nothing has been recorded.
+        """
+
+        N = self.count
+        if N <= 0: return None
+
+        T, index = self.t, self.index
+
+        i = index(N - 1)
+        if T[i] <= t: return self.x[i], self.y[i], self.z[i]
+
+        i = index(0)
+        if t <= T[i]: return self.x[i], self.y[i], self.z[i]
+
+        lo, hi = 0, N - 1
+
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+
+            if T[index(mid)] <= t:
+                lo = mid
+            else:
+                hi = mid
+
+        i, j = index(lo), index(hi)
+
+        t1, t2 = T[i], T[j]
+        k = (t - t1) / (t2 - t1) if t2 > t1 else 0.0
+
+        return (
+            self.x[i] + (self.x[j] - self.x[i]) * k,
+            self.y[i] + (self.y[j] - self.y[i]) * k,
+            self.z[i] + (self.z[j] - self.z[i]) * k
+        )
+
+part_offset = {
+    TORSO: 0.9,
+    HEAD:  0.0,
+    ARMS:  0.9,
+    LEGS:  1.8,
+    MELEE: 0.9
+}
+
+def validate_hit(position, orientation, x, y, z, part, aim_tolerance, dist_tolerance):
+    """
+    Same test as `Character.validate_hit`, but against an arbitrary position of the target
+    rather than its current one.
+    """
+
+    if part not in part_offset:
+        return False
+
+    ox = x - position.x
+    oy = y - position.y
+    oz = z + part_offset[part] - position.z
+
+    if sqrt(ox * ox + oy * oy) > FOG_DISTANCE + dist_tolerance:
+        return False
+
+    fx, fy, fz = orientation.x, orientation.y, orientation.z
+
+    f = sqrt(fx * fx + fy * fy)
+    if f <= 0: return False
+
+    sx, sy = -fy / f, fx / f
+    hx, hy, hz = -fz * sy, fz * sx, fx * sy - fy * sx
+
+    cz = ox * fx + oy * fy + oz * fz
+    if cz == 0: return False
+
+    r = 1 / cz
+
+    u = (ox * sx + oy * sy) * r
+    v = (ox * hx + oy * hy + oz * hz) * r
+
+    r *= aim_tolerance
+
+    return u - r < 0 < u + r and v - r < 0 < v + r
@@ -0,0 +1,470 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Load test of the arena: starts a server with the arena game mode and the scripts `falloff`,
+`handicap` and `map_extensions`, connects bots to it over the loopback (see `arenalib.bots`)
+and reports, for every scenario, the distribution of the tick time, the packet rates,
+and the CPU and memory used by the server.
+
+    python -m arenalib.loadtest [-d CONFIG_DIR] [-c CONFIG_FILE] [--duration S] [--json FILE] [SCENARIO...]
+
+SCENARIO is one of the `scenarios` below (all of them by default), or MAP:N[+B] for N bots
+fighting and B bots building on MAP (`Babylon:16+4`, `Babylon#5:32`). The server runs in a scratch
+directory, so that the maps saving themselves (`WorldVXL`) leave `saves/` alone, and loads this
+module as one of its scripts to measure itself:
+
+- tick: time spent by the server on a world step: the packets handled before it, the step itself
+  (scripts and game mode) and the network update that follows it;
+- lag: how late the physics of a step ran compared to their schedule (every 1/60 s), which
+  also accounts for the work not measured above (the physics, enet).
+"""
+
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+from time import monotonic, time, sleep, process_time
+import subprocess
+import json
+import sys
+
+from os.path import join, abspath, dirname
+from os import environ, pathsep, symlink
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+from pyspades.constants import UPDATE_FREQUENCY, RIFLE_WEAPON, SMG_WEAPON, SHOTGUN_WEAPON
+
+from piqueserver.config import config
+
+from arenalib.bots import Bot, BotStats, FIGHTER, BUILDER
+
+stats_option = config.section("loadtest").option("stats", "")
+
+FLUSH_INTERVAL = 1.0 # seconds
+BOT_TICK       = 1 / 60
+
+class Scenario:
+    def __init__(self, name, map_name, fighters, builders = 0):
+        self.name     = name
+        self.map_name = map_name
+        self.fighters = fighters
+        self.builders = builders
+
+    def __str__(self):
+        return "{}: {}, {} fighters, {} builders".format(self.name, self.map_name, self.fighters, self.builders)
+
+scenarios = {
+    'fight':    Scenario('fight', 'Bombermaniac', 32),
+    'builders': Scenario('builders', 'Arbeitslager', 8, 24),
+}
+
+def parse_scenario(spec):
+    if (scenario := scenarios.get(spec)) is not None:
+        return scenario
+
+    map_name, _, counts = spec.rpartition(':')
+    fighters, _, builders = counts.partition('+')
+
+    if not map_name or not fighters.isdecimal() or not (builders or '0').isdecimal():
+        raise ValueError("unknown scenario {!r} (expected one of {} or MAP:N[+B])".format(spec, ", ".join(scenarios)))
+
+    scenario = Scenario(spec, map_name, int(fighters), int(builders or 0))
+
+    if not 0 < scenario.fighters + scenario.builders <= 32:
+        raise ValueError("{}: between 1 and 32 bots".format(spec))
+
+    return scenario
+
+# Server side
+
+def get_memory():
+    """
+    Returns the resident and peak resident memory of the process (bytes), where it is known.
+    """
+
+    try:
+        with open("/proc/self/statm") as fin:
+            rss = int(fin.read().split()[1]) * resource.getpagesize()
+    except (OSError, AttributeError):
+        rss = None
+
+    # Linux gives the peak in KiB
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource is not None else None
+
+    return rss, max(rss, peak) if None not in (rss, peak) else peak
+
+class TickProbe:
+    """
+    Measures the world steps, network updates and packet handlers of `protocol`,
+    written every second to `filename`, one JSON object per line.
+    """
+
+    def __init__(self, protocol, filename):
+        self.protocol = protocol
+        self.fout     = open(filename, 'w')
+        self.steps    = []
+        self.packets  = 0.0
+        self.received = 0
+        self.flushed  = monotonic()
+
+        # Scripts are applied before the game mode: the methods of the instance are wrapped
+        # (rather than overridden) so that the game mode is measured as well
+        self.on_world_update = protocol.on_world_update
+        self.update_network  = protocol.update_network
+
+        protocol.on_world_update = self.step
+        protocol.update_network  = self.network
+
+    def step(self):
+        t = monotonic()
+
+        if t - self.flushed >= FLUSH_INTERVAL:
+            self.flush(t)
+
+        # The physics of this step ran just before, due `UPDATE_FREQUENCY` after `world_time`
+        lag = t - self.protocol.world_time - UPDATE_FREQUENCY
+
+        self.on_world_update()
+
+        self.steps.append([time(), lag, monotonic() - t, self.packets, 0.0])
+        self.packets = 0.0
+
+    def network(self):
+        t = monotonic()
+        self.update_network()
+
+        if self.steps:
+            self.steps[-1][4] += monotonic() - t
+
+    def wrap_handler(self, loader_received):
+        def wrapper(packet):
+            t = monotonic()
+
+            try:
+                loader_received(packet)
+            finally:
+                self.packets  += monotonic() - t
+                self.received += 1
+
+        return wrapper
+
+    def flush(self, t):
+        rss, peak = get_memory()
+
+        self.fout.write(json.dumps(dict(
+            t = time(), cpu = process_time(), rss = rss, peak = peak, received = self.received, steps = self.steps
+        )) + "\n")
+        self.fout.flush()
+
+        self.steps   = []
+        self.flushed = t
+
+def apply_script(protocol, connection, config):
+    if not (filename := stats_option.get()):
+        return protocol, connection
+
+    class LoadTestProtocol(protocol):
+        def __init__(self, *w, **kw):
+            protocol.__init__(self, *w, **kw)
+
+            self.tick_probe = TickProbe(self, filename)
+
+    class LoadTestConnection(connection):
+        def __init__(self, *w, **kw):
+            connection.__init__(self, *w, **kw)
+
+            self.loader_received = self.protocol.tick_probe.wrap_handler(self.loader_received)
+
+    return LoadTestProtocol, LoadTestConnection
+
+# Harness
+
+def start_server(scenario, config_dir, config_file, workdir, port, stats):
+    if config_file is None:
+        config_file = join(workdir, "config.json")
+
+        with open(config_file, 'w') as fout:
+            fout.write("{}")
+
+    # Some maps read files relatively to the working directory (`maps/...`)
+    symlink(join(config_dir, "maps"), join(workdir, "maps"))
+
+    overrides = {
+        "name":                   "loadtest",
+        "port":                   port,
+        "rotation":               [scenario.map_name],
+        "game_mode":              "arena",
+        "scripts":                ["falloff", "handicap", "map_extensions", "arenalib.loadtest"],
+        "max_players":            32,
+        "max_connections_per_ip": 0,
+        "logging":                {"logfile": join(workdir, "logs", "log.txt")},
+        "bans":                   {"file": join(workdir, "bans.txt")},
+        "loadtest":               {"stats": stats}
+    }
+
+    # The server imports `arenalib` from the same tree as this module
+    env = dict(environ)
+    env["PYTHONPATH"] = pathsep.join(filter(None, (dirname(dirname(abspath(__file__))), environ.get("PYTHONPATH"))))
+
+    command = [
+        sys.executable, "-m", "piqueserver", "-d", config_dir, "-c", config_file,
+        "-j", json.dumps(overrides)
+    ]
+
+    with open(join(workdir, "server.txt"), 'wb') as fout:
+        return subprocess.Popen(command, cwd = workdir, env = env, stdout = fout, stderr = subprocess.STDOUT)
+
+def stop_server(process, timeout = 10.0):
+    if process.poll() is None:
+        process.terminate()
+
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def make_bot(scenario, i, port):
+    weapons = (RIFLE_WEAPON, SMG_WEAPON, SHOTGUN_WEAPON)
+    role    = FIGHTER if i < scenario.fighters else BUILDER
+
+    return Bot("bot{}".format(i + 1), i % 2, weapons[i % 3], role, ("127.0.0.1", port), seed = i)
+
+def drive(bots, process, until, done = None):
+    """
+    Runs the bots until `until` (or until `done()` is true), 60 times per second.
+    """
+
+    t = monotonic()
+
+    while t < until:
+        if process.poll() is not None:
+            raise RuntimeError("the server exited with {}".format(process.returncode))
+
+        for bot in bots:
+            bot.service()
+            bot.update(t)
+
+        if done is not None and done():
+            return True
+
+        sleep(max(0.0, t + BOT_TICK - monotonic()))
+        t = monotonic()
+
+    return False
+
+def get_totals(bots):
+    totals = BotStats()
+
+    for bot in bots:
+        totals.add(bot.stats)
+
+    return totals
+
+def get_distribution(values):
+    # Milliseconds
+    if not values:
+        return None
+
+    values = sorted(values)
+    n = len(values)
+
+    def percentile(q):
+        return 1000 * values[min(n - 1, int(q * n))]
+
+    return {
+        "mean":  1000 * sum(values) / n,
+        "p50":   percentile(0.5),
+        "p90":   percentile(0.9),
+        "p99":   percentile(0.99),
+        "p99.9": percentile(0.999),
+        "max":   1000 * values[-1]
+    }
+
+def read_stats(filename, t0, t1):
+    with open(filename) as fin:
+        records = [json.loads(line) for line in fin if line.endswith("\n")]
+
+    steps   = [step for record in records for step in record['steps'] if t0 <= step[0] < t1]
+    samples = [record for record in records if t0 <= record['t'] <= t1]
+
+    if len(samples) >= 2:
+        first, last = samples[0], samples[-1]
+
+        cpu      = (last['cpu'] - first['cpu']) / (last['t'] - first['t'])
+        received = (last['received'] - first['received']) / (last['t'] - first['t'])
+    else:
+        cpu = received = None
+
+    last = samples[-1] if samples else dict()
+
+    return steps, cpu, received, last.get('rss'), last.get('peak')
+
+def run_scenario(scenario, args):
+    with TemporaryDirectory(prefix = "arena-loadtest-") as workdir:
+        stats   = join(workdir, "stats.jsonl")
+        process = start_server(scenario, abspath(args.config_dir), args.config_file, workdir, args.port, stats)
+        count   = scenario.fighters + scenario.builders
+        bots    = []
+
+        try:
+            bots = [make_bot(scenario, i, args.port) for i in range(count)]
+
+            # Bots that gave up connecting before the server was listening try again
+            def joined():
+                for i, bot in enumerate(bots):
+                    if bot.disconnected and not bot.connected:
+                        bots[i] = make_bot(scenario, i, args.port)
+
+                return all(bot.spawned for bot in bots)
+
+            drive(bots, process, monotonic() + args.warmup, joined)
+            drive(bots, process, monotonic() + 2.0)
+
+            spawned = sum(bot.spawned for bot in bots)
+            before  = get_totals(bots)
+            cpu     = process_time()
+            t0      = time()
+
+            drive(bots, process, monotonic() + args.duration)
+
+            t1       = time()
+            bots_cpu = (process_time() - cpu) / (t1 - t0)
+            after    = get_totals(bots)
+
+            # Lets the server write the last measures of the window
+            drive(bots, process, monotonic() + 2 * FLUSH_INTERVAL)
+        except RuntimeError as exc:
+            with open(join(workdir, "server.txt"), 'rb') as fin:
+                log = fin.read().decode(errors = 'replace')
+
+            raise RuntimeError("{}: {}\n{}".format(scenario.name, exc, log[-4000:]))
+        finally:
+            for bot in bots:
+                bot.disconnect()
+
+            stop_server(process)
+
+        steps, server_cpu, handled, rss, peak = read_stats(stats, t0, t1)
+
+    duration = t1 - t0
+
+    def rate(n):
+        return n / duration
+
+    ticks = [step + packets + network for t, lag, step, packets, network in steps]
+
+    return {
+        "scenario":    scenario.name,
+        "map":         scenario.map_name,
+        "fighters":    scenario.fighters,
+        "builders":    scenario.builders,
+        "spawned":     spawned,
+        "duration":    duration,
+        "ticks":       len(ticks),
+        "over_budget": sum(tick > UPDATE_FREQUENCY for tick in ticks) / max(1, len(ticks)),
+        "tick":        get_distribution(ticks),
+        "step":        get_distribution([step[2] for step in steps]),
+        "packets":     get_distribution([step[3] for step in steps]),
+        "network":     get_distribution([step[4] for step in steps]),
+        "lag":         get_distribution([step[1] for step in steps]),
+        "packets_per_second": {
+            "in":      rate(after.sent - before.sent),
+            "out":     rate(after.received - before.received),
+            "handled": handled
+        },
+        "bytes_per_second": {
+            "in":  rate(after.sent_bytes - before.sent_bytes),
+            "out": rate(after.received_bytes - before.received_bytes)
+        },
+        "server": {"cpu": server_cpu, "rss": rss, "peak_rss": peak},
+        "bots":   {"cpu": bots_cpu}
+    }
+
+def format_distribution(distribution):
+    if distribution is None:
+        return "-"
+
+    return "mean {:.2f}  p50 {:.2f}  p90 {:.2f}  p99 {:.2f}  p99.9 {:.2f}  max {:.2f} ms".format(
+        *(distribution[key] for key in ("mean", "p50", "p90", "p99", "p99.9", "max"))
+    )
+
+def format_result(result):
+    def percent(x):
+        return "{:.1%}".format(x) if x is not None else "?"
+
+    def mib(x):
+        return "{:.0f} MiB".format(x / 2 ** 20) if x is not None else "?"
+
+    pps, bps = result["packets_per_second"], result["bytes_per_second"]
+
+    lines = [
+        "{scenario}: {map}, {fighters} fighters, {builders} builders ({spawned} spawned), {duration:.0f} s".format(**result),
+        "  tick     {} ({} of {} ticks over {:.1f} ms)".format(
+            format_distribution(result["tick"]), percent(result["over_budget"]), result["ticks"], 1000 * UPDATE_FREQUENCY
+        ),
+        "  step     " + format_distribution(result["step"]),
+        "  packets  " + format_distribution(result["packets"]),
+        "  network  " + format_distribution(result["network"]),
+        "  lag      " + format_distribution(result["lag"]),
+        "  traffic  in {:.0f} packets/s ({:.1f} KiB/s), out {:.0f} packets/s ({:.1f} KiB/s)".format(
+            pps["in"], bps["in"] / 1024, pps["out"], bps["out"] / 1024
+        ),
+        "  server   cpu {}, rss {} (peak {})".format(
+            percent(result["server"]["cpu"]), mib(result["server"]["rss"]), mib(result["server"]["peak_rss"])
+        ),
+        "  bots     cpu {}".format(percent(result["bots"]["cpu"]))
+    ]
+
+    return "\n".join(lines)
+
+def main(argv = None):
+    parser = ArgumentParser(prog = "python -m arenalib.loadtest", description = "Load test the arena with simulated players.")
+    parser.add_argument("scenarios", nargs = "*", metavar = "SCENARIO", help = "{} or MAP:N[+B] (default: all)".format(", ".join(scenarios)))
+    parser.add_argument("-d", "--config-dir", default = ".", help = "directory of the maps, scripts and game modes (default: .)")
+    parser.add_argument("-c", "--config-file", default = None, help = "config file of the server (default: none)")
+    parser.add_argument("--port", type = int, default = 42887, help = "port of the server (default: 42887)")
+    parser.add_argument("--duration", type = float, default = 60.0, help = "measurement of every scenario (seconds, default: 60)")
+    parser.add_argument("--warmup", type = float, default = 60.0, help = "time given to the bots to join (seconds, default: 60)")
+    parser.add_argument("--json", metavar = "FILE", help = "write the results to FILE")
+
+    args = parser.parse_args(argv)
+
+    if args.config_file is not None:
+        args.config_file = abspath(args.config_file)
+
+    try:
+        selected = [parse_scenario(spec) for spec in args.scenarios or scenarios]
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    results = []
+
+    for scenario in selected:
+        print("running {} for {:.0f} s...".format(scenario, args.duration), flush = True)
+
+        results.append(result := run_scenario(scenario, args))
+        print(format_result(result), flush = True)
+
+    if args.json is not None:
+        with open(args.json, 'w') as fout:
+            json.dump(results, fout, indent = 2)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
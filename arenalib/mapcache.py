@@ -0,0 +1,306 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from time import perf_counter
+import zlib
+
+from pyspades.contained import BlockAction, BlockLine
+from pyspades.mapgenerator import COMPRESSION_LEVEL
+
+from piqueserver.commands import command
+
+from arenalib.savestore import CHUNK_COLUMNS
+
+# Packets that are broadcast whenever the map is modified
+map_packet_ids = frozenset((BlockAction.id, BlockLine.id))
+
+# The map is serialized and compressed over several ticks, at most this long on each (seconds)...
+BUILD_TIME = 0.002
+
+# ...this many columns at a time (a divisor of `CHUNK_COLUMNS`)
+BUILD_COLUMNS = 1024
+
+# Size announced to the clients while the map is compressed (as `ProgressiveMapGenerator` does)
+ESTIMATED_SIZE = 1536 * 1024
+
+def get_chunks(M):
+    """
+    Serializes the map `M` by pieces of `CHUNK_COLUMNS` columns, as saved by `SaveStore`.
+    """
+
+    generator = M.get_generator()
+    return list(iter(lambda: generator.get_data(CHUNK_COLUMNS), None))
+
+class CachedMapData:
+    """
+    Same interface as `ProgressiveMapGenerator`, reading from an already compressed map.
+    """
+
+    __slots__ = ('data', 'pos')
+
+    def __init__(self, data):
+        self.data = data
+        self.pos  = 0
+
+    def get_size(self):
+        return len(self.data)
+
+    def read(self, size):
+        data = self.data[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+    def data_left(self):
+        return self.pos < len(self.data)
+
+class MapBuilder:
+    """
+    Serializes and compresses the map a few columns at a time, as `ProgressiveMapGenerator` does,
+    from a copy of the map made by `get_generator()`.
+    """
+
+    __slots__ = ('revision', 'generator', 'compressor', 'data', 'compressed')
+
+    def __init__(self, M, revision):
+        self.revision   = revision
+        self.generator  = M.get_generator()
+        self.compressor = zlib.compressobj(COMPRESSION_LEVEL)
+        self.data       = []
+        self.compressed = bytearray()
+
+    def done(self):
+        return self.generator is None
+
+    def step(self, columns):
+        """
+        Returns True once the whole map is serialized.
+        """
+
+        if (generator := self.generator) is None:
+            return True
+
+        data = generator.get_data(columns)
+
+        if generator.done:
+            self.compressed += self.compressor.flush()
+            self.generator   = None
+
+            return True
+
+        self.data.append(data)
+        self.compressed += self.compressor.compress(data)
+
+        return False
+
+class MapBuilderReader:
+    """
+    Same interface as `ProgressiveMapGenerator`, reading from a `MapBuilder` that is shared
+    by every transfer started before it is done. It is built further when a transfer gets ahead.
+    """
+
+    __slots__ = ('builder', 'pos')
+
+    def __init__(self, builder):
+        self.builder = builder
+        self.pos     = 0
+
+    def get_size(self):
+        return len(self.builder.compressed) if self.builder.done() else ESTIMATED_SIZE
+
+    def read(self, size):
+        builder = self.builder
+
+        while len(builder.compressed) - self.pos < size:
+            if builder.step(BUILD_COLUMNS):
+                break
+
+        data = bytes(builder.compressed[self.pos:self.pos + size])
+        self.pos += len(data)
+
+        return data
+
+    def data_left(self):
+        return self.pos < len(self.builder.compressed) or not self.builder.done()
+
+class MapCache:
+    """
+    Serialized (and compressed) form of the current map, shared by the map transfers,
+    saves and dumps until the map is modified. Every change of the map must be followed
+    by `touch()`, which is done when a block packet is broadcast. The map transfers do not
+    wait for it: on a miss, `reader()` starts a `MapBuilder` that `update()` advances
+    on every tick, and that the transfers read as it is built.
+    """
+
+    def __init__(self):
+        self.map      = None
+        self.revision = 0
+
+        self.data       = None
+        self.chunks     = None
+        self.compressed = None
+
+        self.data_revision       = -1
+        self.chunks_revision     = -1
+        self.compressed_revision = -1
+
+        self.assets            = None
+        self.asset_key         = None
+        self.pristine_revision = None
+
+        self.builder = None
+
+        self.hits   = 0
+        self.misses = 0
+
+    def reset(self, M, assets = None, asset_key = None):
+        self.map = M
+        self.touch()
+
+        self.data       = None
+        self.chunks     = None
+        self.compressed = None
+        self.builder    = None
+
+        # Until it is modified, the map is the same for every server playing it: its compressed
+        # form is then taken from (or written to) the shared `AssetCache`
+        self.assets            = assets
+        self.asset_key         = asset_key
+        self.pristine_revision = self.revision if assets is not None and asset_key is not None else None
+
+        # Maps that save themselves periodically (`WorldVXL`) reuse the cache as well
+        if hasattr(M, 'map_cache'):
+            M.map_cache = self
+
+    def touch(self):
+        self.revision += 1
+
+    def ready(self):
+        return self.compressed_revision == self.revision
+
+    def reader(self):
+        """
+        Returns the map for a map transfer, with the interface of `ProgressiveMapGenerator`.
+        """
+
+        if self.ready():
+            self.hits += 1
+            return CachedMapData(self.compressed)
+
+        self.misses += 1
+
+        if self.revision == self.pristine_revision and self.assets.has(self.asset_key):
+            self.compressed          = self.assets.get(self.asset_key)
+            self.compressed_revision = self.revision
+
+            return CachedMapData(self.compressed)
+
+        if (builder := self.builder) is None or builder.revision != self.revision:
+            builder = self.builder = MapBuilder(self.map, self.revision)
+
+        return MapBuilderReader(builder)
+
+    def update(self):
+        if (builder := self.builder) is None:
+            return
+
+        # Modified while it was built: the transfers already reading it go on
+        if builder.revision != self.revision:
+            self.builder = None
+            return
+
+        deadline = perf_counter() + BUILD_TIME
+
+        while not builder.step(BUILD_COLUMNS):
+            if perf_counter() >= deadline:
+                return
+
+        self.builder = None
+
+        # The pieces of the builder are put together into the chunks of `SaveStore`
+        k = CHUNK_COLUMNS // BUILD_COLUMNS
+
+        self.chunks          = [b''.join(builder.data[i:i + k]) for i in range(0, len(builder.data), k)]
+        self.chunks_revision = builder.revision
+
+        self.data          = b''.join(self.chunks)
+        self.data_revision = builder.revision
+
+        compressed = bytes(builder.compressed)
+
+        if builder.revision == self.pristine_revision:
+            self.compressed = self.assets.get(self.asset_key, lambda: compressed)
+        else:
+            self.compressed = compressed
+
+        self.compressed_revision = builder.revision
+
+    def get_data(self):
+        if self.data_revision == self.revision:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+            self.data          = self.map.generate()
+            self.data_revision = self.revision
+
+        return self.data
+
+    def get_chunks(self):
+        if self.chunks_revision == self.revision:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+            self.chunks          = get_chunks(self.map)
+            self.chunks_revision = self.revision
+
+            self.data          = b''.join(self.chunks)
+            self.data_revision = self.revision
+
+        return self.chunks
+
+    def get_compressed(self):
+        if self.compressed_revision == self.revision:
+            self.hits += 1
+        else:
+            if self.revision == self.pristine_revision:
+                self.compressed = self.assets.get(self.asset_key, self.compress)
+            else:
+                self.compressed = self.compress()
+
+            self.compressed_revision = self.revision
+
+        return self.compressed
+
+    def compress(self):
+        return zlib.compress(self.get_data(), COMPRESSION_LEVEL)
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+@command('mapcache', admin_only = True)
+def c_mapcache(connection):
+    """
+    Report how often the serialized map is reused
+    /mapcache
+    """
+
+    cache = connection.protocol.map_cache
+
+    return "Map revision {}: {} hits, {} misses ({:.0f}% hit rate), {} KiB compressed".format(
+        cache.revision, cache.hits, cache.misses, 100 * cache.hit_rate(),
+        len(cache.compressed or b'') // 1024
+    )
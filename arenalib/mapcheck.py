@@ -0,0 +1,302 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Offline inspection of maps: block counts, heightmap and the placement of spawns, flags,
+bases, bombsites and teleporter exits, without running a server.
+
+    python -m arenalib.mapcheck [--maps DIR] [--png DIR] MAP...
+
+MAP is the name of a map in `maps/` (`Babylon`, or `Babylon#5` for a given seed),
+the path of its `.txt`, or a `.vxl`/`.manifest` save (block counts and heightmap only).
+Maps are loaded as on the server: maps that save themselves (`WorldVXL`) still read
+`saves/`, but a map generated for lack of a save is not written to it (it would then be one of
+the seeds picked by the server). Exits with 1 if a problem was found.
+"""
+
+from argparse import ArgumentParser
+from collections import defaultdict
+from itertools import product
+from time import monotonic
+import struct
+import zlib
+import sys
+
+from os.path import join, split, splitext
+from os import makedirs
+
+from pyspades.vxl import VXLData
+
+from piqueserver.map import Map, RotationInfo
+
+from arenalib.mapconfig import ArenaMapConfig
+from arenalib.maptools import WorldVXL
+from arenalib.savestore import MANIFEST_SUFFIX, get_store
+from arenalib.assets import COLUMNS, VoxelMask, as_int, as_bytes, count, get_layers, get_mask_data
+from arenalib.common import ArenaException
+
+WATER_LEVEL = 63
+
+def get_heightmap(layers):
+    """
+    Returns the topmost solid `z` of every column, row after row (64 if the column is empty).
+    """
+
+    full = (1 << 8 * COLUMNS) - 1
+    H    = as_int(bytes([64]) * COLUMNS)
+
+    for z in reversed(range(64)):
+        L = layers[z]
+        H = (as_int(bytes([z]) * COLUMNS) & L) | (H & (L ^ full))
+
+    return as_bytes(H)
+
+def write_png(filename, width, height, pixels):
+    # 8-bit grayscale
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    rows = b''.join(b'\x00' + pixels[y * width:(y + 1) * width] for y in range(height))
+
+    with open(filename, 'wb') as fout:
+        fout.write(b'\x89PNG\r\n\x1a\n')
+        fout.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)))
+        fout.write(chunk(b'IDAT', zlib.compress(rows, 9)))
+        fout.write(chunk(b'IEND', b''))
+
+# Higher is brighter, empty columns are black
+heightmap_palette = bytes(max(0, 255 - 4 * z) for z in range(256))
+
+def is_inside(x, y, z):
+    return 0 <= x < 512 and 0 <= y < 512 and 0 <= z < 64
+
+def check_spawn(M, x, y, z):
+    if not is_inside(x, y, z):
+        return "outside the map"
+
+    # Players spawn 3 blocks above the ground below the spawn point
+    ground = M.get_z(x, y, z)
+
+    if ground >= WATER_LEVEL:
+        return "underwater"
+
+    # Above the top of the map is fine: they just fall on the map
+    if any(M.get_solid(x, y, t) for t in range(max(0, ground - 3), ground)):
+        return "inside solid blocks"
+
+def check_entity(M, x, y, z):
+    if not is_inside(x, y, z):
+        return "outside the map"
+
+    # Entities are dropped on the ground below their location
+    ground = M.get_z(x, y, z)
+
+    if ground >= WATER_LEVEL:
+        return "in the water"
+
+    if ground > 0 and M.get_solid(x, y, ground - 1):
+        return "buried in solid blocks"
+
+def check_bombsite(M, box):
+    xmin, xmax, ymin, ymax, zmin, zmax = map(int, box)
+
+    if xmin >= xmax or ymin >= ymax or zmin >= zmax:
+        return "empty box"
+
+    voxels = product(
+        range(max(0, xmin), min(512, xmax)), range(max(0, ymin), min(512, ymax)), range(max(0, zmin), min(64, zmax))
+    )
+
+    free = sum(1 for x, y, z in voxels if not M.get_solid(x, y, z))
+
+    if free == 0:
+        return "no room to stand"
+
+def check_teleporter(M, teleporter):
+    xmin, xmax, ymin, ymax, zmin, zmax, xout, yout, zout = teleporter
+
+    if xmin >= xmax or ymin >= ymax or zmin >= zmax:
+        return "empty trigger box"
+
+    x, y, z = int(xout), int(yout), int(zout)
+
+    if not is_inside(x, y, z):
+        return "exit outside the map"
+
+    # The player is moved to the exit: its body takes up to 3 blocks below that point
+    if any(M.get_solid(x, y, t) for t in range(z, min(64, z + 3))):
+        return "exit in solid terrain"
+
+class Report:
+    def __init__(self, name):
+        self.name     = name
+        self.lines    = []
+        self.problems = 0
+
+    def info(self, fmt, *args):
+        self.lines.append("  " + fmt.format(*args))
+
+    def problem(self, fmt, *args):
+        self.problems += 1
+        self.lines.append("! " + fmt.format(*args))
+
+    def __str__(self):
+        return "\n".join([self.name, *self.lines])
+
+def check_points(report, M, what, points, check):
+    failed = defaultdict(list)
+
+    for point in points:
+        if reason := check(M, *point):
+            failed[reason].append(tuple(point))
+
+    for reason, failures in failed.items():
+        report.problem("{} {}: {} of {} (first at {})", what, reason, len(failures), len(points), failures[0])
+
+def get_spawns(extensions, team):
+    if (spawns := extensions.get('arena_{}_spawns'.format(team))) is not None:
+        return list(spawns)
+
+    if (spawn := extensions.get('arena_{}_spawn'.format(team))) is not None:
+        return [spawn]
+
+def check_map(report, M, info, extensions):
+    try:
+        cfg = ArenaMapConfig(extensions, 0)
+    except ArenaException as exc:
+        report.problem("invalid metadata: {}", exc)
+        return
+
+    for team in ('blue', 'green'):
+        if (spawns := get_spawns(extensions, team)) is None:
+            if extensions.get('arena', False):
+                report.problem("no {} spawns", team)
+        else:
+            check_points(report, M, "{} spawns".format(team), spawns, check_spawn)
+
+        for entity in ('flag', 'base'):
+            if (loc := getattr(cfg, '{}_{}'.format(team, entity))) is not None:
+                if reason := check_entity(M, *loc):
+                    report.problem("{} {} {}: {}", team, entity, reason, loc)
+
+        for box in getattr(cfg, '{}_bombsites'.format(team)) or ():
+            if reason := check_bombsite(M, box):
+                report.problem("{} bombsite {}: {}", team, reason, box)
+
+    for teleporter in cfg.teleporters or ():
+        if reason := check_teleporter(M, teleporter):
+            report.problem("teleporter {}: {}", reason, teleporter)
+
+def check_indestructible(report, M, info, layers, heights, solid):
+    if isinstance(mask := getattr(info, 'mask', None), (VXLData, VoxelMask)):
+        data    = mask.data if isinstance(mask, VoxelMask) else get_mask_data(mask)
+        covered = (as_int(get_mask_data(M)) & int.from_bytes(data, 'little')).bit_count()
+        report.info("indestructible: {} blocks ({:.1%})", covered, covered / max(1, solid))
+    elif is_indestructable := getattr(info, 'is_indestructable', None):
+        # Without a mask to compare layers with, only the surface is checked, block by block
+        surface = [(i % 512, i // 512, z) for i, z in enumerate(heights) if z < 64]
+        covered = sum(1 for x, y, z in surface if is_indestructable(None, x, y, z))
+        report.info("indestructible: {} of {} surface blocks ({:.1%})", covered, len(surface), covered / max(1, len(surface)))
+
+def load(name, load_dir):
+    """
+    Returns the name, map data, metadata module (or `None`) and extensions of `name`.
+    """
+
+    stem, suffix = splitext(name)
+
+    if suffix == ".vxl":
+        with open(name, 'rb') as fin:
+            return name, VXLData(fin), None, dict()
+
+    if suffix == MANIFEST_SUFFIX:
+        dirname, basename = split(stem)
+        return name, VXLData(get_store(dirname).open(basename)), None, dict()
+
+    if suffix == ".txt":
+        load_dir, name = split(stem)
+
+    rot_info = RotationInfo(name)
+
+    # Seeds are chosen as the server would
+    if rot_info.seed is None:
+        probe = Map.__new__(Map)
+        probe.load_information(rot_info, load_dir)
+
+        if on_seed_generation := getattr(probe.info, 'on_seed_generation', None):
+            rot_info.seed = on_seed_generation(rot_info)
+
+    map_info = Map(rot_info, load_dir)
+    return map_info.name, map_info.data, map_info.info, map_info.extensions
+
+def inspect(name, load_dir, png_dir):
+    t = monotonic()
+
+    try:
+        title, M, info, extensions = load(name, load_dir)
+    except Exception as exc:
+        report = Report(name)
+        report.problem("cannot be loaded: {!r}", exc)
+        return report
+
+    report = Report(title)
+
+    layers  = get_layers(M)
+    heights = get_heightmap(layers)
+    solid   = sum(map(count, layers))
+
+    report.info("{} blocks, {} empty columns, {} columns at the water level",
+        solid, heights.count(64), heights.count(WATER_LEVEL)
+    )
+
+    check_indestructible(report, M, info, layers, heights, solid)
+
+    if png_dir is not None:
+        makedirs(png_dir, exist_ok = True)
+
+        filename = join(png_dir, "{}.png".format(split(title)[1].replace(" ", "").replace("#", ".")))
+        write_png(filename, 512, 512, heights.translate(heightmap_palette))
+
+        report.info("heightmap: {}", filename)
+
+    if info is not None:
+        check_map(report, M, info, extensions)
+
+    report.info("checked in {:.2f} s", monotonic() - t)
+
+    return report
+
+def main(argv = None):
+    parser = ArgumentParser(prog = "python -m arenalib.mapcheck", description = "Inspect maps without running a server.")
+    parser.add_argument("maps", nargs = "+", metavar = "MAP", help = "map name (Name or Name#seed), .txt, .vxl or .manifest")
+    parser.add_argument("--maps", dest = "load_dir", default = "maps", metavar = "DIR", help = "directory of the maps (default: maps)")
+    parser.add_argument("--png", metavar = "DIR", help = "write the heightmaps to DIR")
+
+    args = parser.parse_args(argv)
+
+    WorldVXL.autosave = False
+
+    problems = 0
+
+    for name in args.maps:
+        report = inspect(name, args.load_dir, args.png)
+        problems += report.problems
+
+        print(report)
+
+    return 1 if problems > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from types import MappingProxyType
+from numbers import Real
+
+from pyspades.constants import RIFLE_WEAPON, SMG_WEAPON, SHOTGUN_WEAPON
+
+from arenalib.common import ArenaException
+
+# For every weapon requested by a client: the weapons to fall back to, in order of preference.
+weapon_preference = {
+    RIFLE_WEAPON:   (RIFLE_WEAPON, SMG_WEAPON, SHOTGUN_WEAPON),
+    SMG_WEAPON:     (SMG_WEAPON, RIFLE_WEAPON, SHOTGUN_WEAPON),
+    SHOTGUN_WEAPON: (SHOTGUN_WEAPON, RIFLE_WEAPON, SMG_WEAPON)
+}
+
+def get_number(ds, key, default, optional = False):
+    value = ds.get(key, default)
+
+    if value is None and optional:
+        return None
+
+    if isinstance(value, bool) or not isinstance(value, Real):
+        raise ArenaException("{} must be a number, got {!r}.".format(key, value))
+
+    return value
+
+def get_flag(ds, key, default):
+    value = ds.get(key, default)
+
+    if not isinstance(value, bool):
+        raise ArenaException("{} must be True or False, got {!r}.".format(key, value))
+
+    return value
+
+def get_point(ds, key):
+    value = ds.get(key, None)
+
+    if value is None:
+        return None
+
+    if len(value) != 3 or not all(isinstance(t, Real) for t in value):
+        raise ArenaException("{} must be a point (x, y, z), got {!r}.".format(key, value))
+
+    return tuple(value)
+
+def get_boxes(ds, key):
+    value = ds.get(key, None)
+
+    if value is None:
+        return None
+
+    for box in value:
+        if len(box) != 6 or not all(isinstance(t, Real) for t in box):
+            raise ArenaException(
+                "{} must contain boxes (xmin, xmax, ymin, ymax, zmin, zmax), got {!r}.".format(key, box)
+            )
+
+    return tuple(tuple(box) for box in value)
+
+teleporter_keys = ('xmin', 'xmax', 'ymin', 'ymax', 'zmin', 'zmax', 'xout', 'yout', 'zout')
+
+def get_teleporters(ds):
+    value = ds.get('teleporters', None)
+
+    if not value:
+        return None
+
+    teleporters = []
+
+    for teleporter in value:
+        if missing := [k for k in teleporter_keys if k not in teleporter]:
+            raise ArenaException("A teleporter lacks {}.".format(", ".join(missing)))
+
+        teleporters.append(tuple(teleporter[k] for k in teleporter_keys))
+
+    return tuple(teleporters)
+
+class ArenaMapConfig:
+    """
+    Arena settings of the current map, read and checked once from `map_info.extensions`
+    when the map is loaded. It cannot be modified: a map that changes its extensions
+    during the game should call `protocol.update_arena_config()` afterwards.
+    """
+
+    __slots__ = (
+        'game_mode', 'building_enabled', 'respawn_time', 'starting_balance',
+        'kill_reward', 'teamkill_penalty', 'win_reward', 'lose_reward', 'capture_reward',
+        'give_builder_kit', 'give_ammo', 'has_refill', 'refill_interval',
+        'kevlar_price', 'helmet_price', 'defuse_kit_price', 'builder_kit_price',
+        'blue_flag', 'green_flag', 'blue_base', 'green_base',
+        'blue_bombsites', 'green_bombsites', 'blue_has_bomb', 'green_has_bomb',
+        'weapons', 'discard_reloading', 'disabled_commands',
+        'water_damage', 'boundary_damage', 'boundary_blue_team', 'boundary_green_team', 'teleporters',
+        'rollback'
+    )
+
+    def __init__(self, ds, refill_interval):
+        init = lambda key, value: object.__setattr__(self, key, value)
+
+        game_mode = ds.get('arena_game_mode', 'arena')
+
+        if not isinstance(game_mode, str):
+            raise ArenaException("arena_game_mode must be a string, got {!r}.".format(game_mode))
+
+        init('game_mode',         game_mode)
+        init('building_enabled',  get_flag(ds, 'building_enabled', True))
+        init('respawn_time',      get_number(ds, 'arena_respawn_time', -1))
+        init('starting_balance',  get_number(ds, 'arena_starting_balance', 0))
+
+        init('kill_reward',       get_number(ds, 'arena_kill_reward', 0))
+        init('teamkill_penalty',  get_number(ds, 'arena_teamkill_penalty', 0))
+        init('win_reward',        get_number(ds, 'arena_win_reward', 0))
+        init('lose_reward',       get_number(ds, 'arena_lose_reward', 0))
+        init('capture_reward',    get_number(ds, 'arena_capture_reward', 0))
+
+        init('give_builder_kit',  get_flag(ds, 'arena_give_builder_kit', False))
+        init('give_ammo',         get_flag(ds, 'arena_give_ammo', True))
+        init('has_refill',        get_flag(ds, 'arena_has_refill', False))
+        init('refill_interval',   get_number(ds, 'arena_refill_interval', refill_interval))
+
+        init('kevlar_price',      get_number(ds, 'arena_kevlar_price', None, optional = True))
+        init('helmet_price',      get_number(ds, 'arena_helmet_price', None, optional = True))
+        init('defuse_kit_price',  get_number(ds, 'arena_defuse_kit_price', 0))
+        init('builder_kit_price', get_number(ds, 'arena_builder_kit_price', 0))
+
+        init('blue_flag',         get_point(ds, 'arena_blue_flag'))
+        init('green_flag',        get_point(ds, 'arena_green_flag'))
+        init('blue_base',         get_point(ds, 'arena_blue_base'))
+        init('green_base',        get_point(ds, 'arena_green_base'))
+
+        init('blue_bombsites',    get_boxes(ds, 'arena_blue_bombsites'))
+        init('green_bombsites',   get_boxes(ds, 'arena_green_bombsites'))
+        init('blue_has_bomb',     self.blue_bombsites is not None)
+        init('green_has_bomb',    self.green_bombsites is not None)
+
+        enabled = {
+            RIFLE_WEAPON:   get_flag(ds, 'arena_rifle_enabled', True),
+            SMG_WEAPON:     get_flag(ds, 'arena_smg_enabled', True),
+            SHOTGUN_WEAPON: get_flag(ds, 'arena_shotgun_enabled', True)
+        }
+
+        if not any(enabled.values()):
+            raise ArenaException("No weapons are configured to be available in map metadata.")
+
+        weapons = dict()
+
+        for weapon, preference in weapon_preference.items():
+            weapons[weapon] = next(w for w in preference if enabled[w])
+
+        init('weapons',           MappingProxyType(weapons))
+        init('discard_reloading', get_flag(ds, 'arena_discard_reloading', False))
+
+        disabled_commands = ds.get('disabled_commands', ())
+
+        if isinstance(disabled_commands, str) or not all(isinstance(c, str) for c in disabled_commands):
+            raise ArenaException("disabled_commands must be a list of command names.")
+
+        init('disabled_commands', frozenset(disabled_commands))
+
+        init('water_damage',        get_number(ds, 'water_damage', 0))
+        init('boundary_damage',     ds.get('boundary_damage', None))
+        init('boundary_blue_team',  ds.get('boundary_blue_team', None))
+        init('boundary_green_team', ds.get('boundary_green_team', None))
+        init('teleporters',         get_teleporters(ds))
+
+        init('rollback',            get_flag(ds, 'arena_rollback', False))
+
+    def __setattr__(self, key, value):
+        raise AttributeError("ArenaMapConfig is read-only")
+
+    def __delattr__(self, key):
+        raise AttributeError("ArenaMapConfig is read-only")
@@ -18,40 +18,68 @@ from itertools import product
 from math import inf
 import random
 
-from os.path import splitext, isfile, isdir
-from os import scandir
+from os.path import split, splitext, isfile, isdir
+from os import scandir, remove
 
 from twisted.internet.task import LoopingCall
 
-from pyspades.contained import BlockAction, BlockLine, GrenadePacket
-from pyspades.constants import BUILD_BLOCK, DESTROY_BLOCK
+from pyspades.contained import BlockLine
 from pyspades.common import Vertex3, make_color
 from pyspades.entities import Flag
 from pyspades.vxl import VXLData
 from pyspades import world
 
+from arenalib.savestore import MANIFEST_SUFFIX, get_store
+from arenalib.mapcache import get_chunks
 from arenalib.raycast import cube_line
+from arenalib.broadcast import broadcast_data
+from arenalib import packets
 
 class WorldVXL(VXLData):
+    map_cache       = None
+    dumped_revision = None
+
+    # Whether the map is written to its save (when generated, every minute and when unloaded)
+    autosave = True
+
     def __init__(self, filename):
         self.filename = filename
 
-        if isfile(filename):
+        # Saves are kept in the store of their directory, `saves/X.vxl` as `saves/X.manifest`
+        dirname, basename = split(filename)
+        self.store, self.name = get_store(dirname), splitext(basename)[0]
+
+        if self.store.exists(self.name):
+            VXLData.__init__(self, self.store.open(self.name))
+        elif isfile(filename):
             with open(filename, 'rb') as fin:
                 VXLData.__init__(self, fin)
         else:
             VXLData.__init__(self)
 
             self.mapgen()
-            self.dump()
+
+            if self.autosave:
+                self.dump()
 
         self.looping_call = LoopingCall(self.dump)
-        self.looping_call.start(60.0, now = False)
+
+        if self.autosave:
+            self.looping_call.start(60.0, now = False)
 
     def dump(self):
-        # TODO: do we need to run this as `deferToThread`?
-        with open(self.filename, 'wb') as fout:
-            fout.write(self.generate())
+        if cache := self.map_cache:
+            if self.dumped_revision == cache.revision:
+                return
+
+            self.dumped_revision = cache.revision
+
+        # The map is serialized once for the map transfers and the saves
+        self.store.save(self.name, cache.get_chunks() if cache else get_chunks(self))
+
+        # Saves from before the store are converted on their first dump
+        if isfile(self.filename):
+            remove(self.filename)
 
     def mapgen(self):
         grass = make_color(32, 146, 30)
@@ -98,14 +126,7 @@ def doBlockBuildPacket(player, x, y, z):
     if M.get_solid(x, y, z) is False:
         M.set_point(x, y, z, player.color)
 
-        contained           = BlockAction()
-        contained.x         = x
-        contained.y         = y
-        contained.z         = z
-        contained.player_id = player.player_id
-        contained.value     = BUILD_BLOCK
-
-        protocol.broadcast_contained(contained, save = True)
+        broadcast_data(protocol, packets.build_block.encode(player.player_id, x, y, z), save = True)
 
 def doBlockRemovePacket(player, x, y, z):
     protocol = player.protocol
@@ -117,14 +138,7 @@ def doBlockRemovePacket(player, x, y, z):
 
         M.destroy_point(x, y, z)
 
-        contained           = BlockAction()
-        contained.x         = x
-        contained.y         = y
-        contained.z         = z
-        contained.player_id = player.player_id
-        contained.value     = DESTROY_BLOCK
-
-        protocol.broadcast_contained(contained, save = True)
+        broadcast_data(protocol, packets.destroy_block.encode(player.player_id, x, y, z), save = True)
 
 def doGrenadePacket(player, fuse, x, y, z, vx, vy, vz):
     protocol = player.protocol
@@ -134,13 +148,9 @@ def doGrenadePacket(player, fuse, x, y, z, vx, vy, vz):
         Vertex3(vx, vy, vz), player.grenade_exploded
     )
 
-    contained           = GrenadePacket()
-    contained.player_id = player.player_id
-    contained.value     = grenade.fuse
-    contained.position  = grenade.position.get()
-    contained.velocity  = grenade.velocity.get()
-
-    protocol.broadcast_contained(contained)
+    broadcast_data(protocol, packets.encode_grenade(
+        player.player_id, grenade.fuse, *grenade.position.get(), *grenade.velocity.get()
+    ))
 
     return grenade
 
@@ -206,7 +216,7 @@ def scandir_seed(dirname):
 
         stem, suffix = splitext(entry.name)
 
-        if suffix != ".vxl":
+        if suffix != ".vxl" and suffix != MANIFEST_SUFFIX:
             continue
 
         if stem.isdigit():
@@ -217,7 +227,7 @@ def scandir_on_seed_generation(rot_info):
         return rot_info.seed
 
     # To avoid wasting space with random seeds in the “saves/” directory.
-    seeds = list(seed for seed in scandir_seed("saves/") if seed < 2_147_483_647)
+    seeds = list(set(seed for seed in scandir_seed("saves/") if seed < 2_147_483_647))
 
     if bool(seeds):
         random.seed() # FIXME: piqueserver changes this
@@ -0,0 +1,338 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import Counter, deque
+from threading import Thread
+from os.path import basename, dirname, join
+import sysconfig
+import json
+import sys
+
+import twisted
+import pyspades
+import piqueserver
+
+from pyspades.packet import _client_loaders, _server_loaders
+
+from piqueserver.commands import command
+
+# Functions that only pass packets on: the call site is the function that called them
+# (`data_received` passes the packets of the clients to their handlers)
+wrappers = {'broadcast_contained', 'send_contained', 'broadcast_chat', 'send_chat', 'data_received'}
+
+# So are the helpers of `arenalib.broadcast`. The frames of the library (and of the harnesses
+# of `arenalib.bench` and `arenalib.replay`, which stand for its main loop) are only a call site
+# if nothing else is found
+helper_files  = {join(dirname(__file__), "broadcast.py"), __file__}
+library_paths = tuple(dirname(module.__file__) for module in (pyspades, piqueserver, twisted)) + (
+    sysconfig.get_paths()["stdlib"], "<frozen ", join(dirname(__file__), "bench.py"), join(dirname(__file__), "replay.py")
+)
+
+SITE, LIBRARY, HELPER = 0, 1, 2
+
+# How far up the stack a call site is looked for
+MAX_DEPTH = 24
+
+# Seconds of history of the outgoing bandwidth
+HISTORY = 60
+
+kinds = dict() # code → SITE, LIBRARY or HELPER
+names = dict() # (code, line) → name of the call site
+
+def get_kind(code):
+    if code.co_name in wrappers or code.co_filename in helper_files:
+        return HELPER
+    elif code.co_filename.startswith(library_paths):
+        return LIBRARY
+    else:
+        return SITE
+
+def get_site_name(frame):
+    code = frame.f_code
+
+    if (name := names.get((code, frame.f_lineno))) is None:
+        name = names[code, frame.f_lineno] = "{}:{} {}".format(
+            basename(code.co_filename), frame.f_lineno, code.co_name
+        )
+
+    return name
+
+def get_site():
+    """
+    The first function up the stack that is neither a helper nor part of the library, so that
+    the packets sent by `player.spawn()` are told apart whether it is called by `arena_spawn` or
+    by a command. Without such a function, the first function of the library.
+    """
+
+    frame = sys._getframe(1)
+    first = None
+
+    for _ in range(MAX_DEPTH):
+        if frame is None:
+            break
+
+        code = frame.f_code
+
+        if (kind := kinds.get(code)) is None:
+            kind = kinds[code] = get_kind(code)
+
+        if kind == SITE:
+            return get_site_name(frame)
+
+        if kind == LIBRARY and first is None:
+            first = frame
+
+        frame = frame.f_back
+
+    return get_site_name(first) if first is not None else "unknown"
+
+def get_packet_name(loaders, packet_id):
+    if loader := loaders.get(packet_id):
+        return loader.__name__
+    else:
+        return "packet {}".format(packet_id)
+
+class SiteStats:
+    __slots__ = ('calls', 'sent', 'saved', 'bytes', 'max_fanout')
+
+    def __init__(self):
+        self.calls      = 0
+        self.sent       = 0 # packets sent
+        self.saved      = 0 # packets saved for players downloading the map
+        self.bytes      = 0
+        self.max_fanout = 0
+
+class NetStats:
+    """
+    Packets and bytes received and sent per packet type, sends per call site (the caller
+    of `broadcast_contained`, `send_contained`, `broadcast_data`… and whether it saves the packet
+    for loading players), and the depth of the send queue of every client.
+    """
+
+    def __init__(self, t):
+        self.start = t
+
+        self.received_packets = Counter() # packet id → count
+        self.received_bytes   = Counter()
+        self.sent_packets     = Counter()
+        self.sent_bytes       = Counter()
+        self.sites            = dict()    # (site, save) → SiteStats
+
+        # Depth of the send queues: bytes of reliable packets not acknowledged yet
+        # and packets saved for the end of the map download, for every client
+        self.queues        = dict()   # connection → (name, in flight, saved)
+        self.max_in_flight = (0, None) # (bytes, name)
+        self.max_saved     = (0, None)
+
+        # Outgoing bytes per second, and the second with the most of them
+        self.history      = deque(maxlen = HISTORY)
+        self.second_start = t
+        self.second_bytes = 0
+        self.second_sites = Counter() # site → bytes
+        self.peak         = (0.0, t, []) # (bytes per second, time, [(site, bytes)])
+
+        self.metrics = b'{}'
+
+    def record_received(self, data):
+        if data:
+            self.received_packets[data[0]] += 1
+            self.received_bytes[data[0]]   += len(data)
+
+    def record_sent(self, packet_id, size, sent, saved = 0, save = False, site = None):
+        """
+        Records a packet of `size` bytes sent to `sent` clients and saved for `saved` others.
+        """
+
+        if site is None:
+            site = get_site()
+
+        if (stats := self.sites.get((site, save))) is None:
+            stats = self.sites[site, save] = SiteStats()
+
+        n = size * sent
+
+        stats.calls      += 1
+        stats.sent       += sent
+        stats.saved      += saved
+        stats.bytes      += n
+        stats.max_fanout  = max(stats.max_fanout, sent + saved)
+
+        self.sent_packets[packet_id] += sent
+        self.sent_bytes[packet_id]   += n
+
+        self.second_bytes      += n
+        self.second_sites[site] += n
+
+    def sample_queues(self, protocol):
+        queues = dict()
+
+        for connection in protocol.connections.values():
+            in_flight = connection.peer.reliableDataInTransit
+            saved     = len(connection.saved_loaders) if connection.saved_loaders is not None else 0
+
+            queues[connection] = (connection.name, in_flight, saved)
+
+            if in_flight > self.max_in_flight[0]:
+                self.max_in_flight = (in_flight, connection.name)
+
+            if saved > self.max_saved[0]:
+                self.max_saved = (saved, connection.name)
+
+        self.queues = queues
+
+    def update(self, protocol, t):
+        if (dt := t - self.second_start) <= 0:
+            return
+
+        rate = self.second_bytes / dt
+        self.history.append(rate)
+
+        if rate > self.peak[0]:
+            self.peak = (rate, t, self.second_sites.most_common(5))
+
+        self.second_start = t
+        self.second_bytes = 0
+        self.second_sites = Counter()
+
+        if protocol.net_stats_server is not None:
+            self.metrics = json.dumps(self.get_snapshot(t)).encode()
+
+    def get_snapshot(self, t):
+        rate, peak_time, peak_sites = self.peak
+
+        return {
+            "uptime": t - self.start,
+            "received": [
+                {
+                    "packet":  get_packet_name(_client_loaders, packet_id),
+                    "packets": count,
+                    "bytes":   self.received_bytes[packet_id]
+                }
+                for packet_id, count in self.received_packets.most_common()
+            ],
+            "sent": [
+                {
+                    "packet":  get_packet_name(_server_loaders, packet_id),
+                    "packets": count,
+                    "bytes":   self.sent_bytes[packet_id]
+                }
+                for packet_id, count in self.sent_packets.most_common()
+            ],
+            "sites": [
+                {
+                    "site":      site,
+                    "save":      save,
+                    "calls":     stats.calls,
+                    "sent":      stats.sent,
+                    "saved":     stats.saved,
+                    "bytes":     stats.bytes,
+                    "fanout":    (stats.sent + stats.saved) / stats.calls,
+                    "maxFanout": stats.max_fanout
+                }
+                for (site, save), stats in sorted(self.sites.items(), key = lambda item: item[1].bytes, reverse = True)
+            ],
+            "queues": [
+                {"player": name, "inFlight": in_flight, "saved": saved}
+                for name, in_flight, saved in self.queues.values()
+            ],
+            "maxInFlight": {"bytes": self.max_in_flight[0], "player": self.max_in_flight[1]},
+            "maxSaved":    {"packets": self.max_saved[0], "player": self.max_saved[1]},
+            "bandwidth":   list(self.history),
+            "peak": {
+                "bandwidth": rate,
+                "age":       t - peak_time,
+                "sites":     [{"site": site, "bytes": n} for site, n in peak_sites]
+            }
+        }
+
+def serve_metrics(protocol, port):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            # Serialized by `NetStats.update`, on the thread of the server
+            body = protocol.net_stats.metrics
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    Thread(target = server.serve_forever, daemon = True).start()
+
+    return server
+
+def format_bytes(n):
+    if n >= 1 << 20:
+        return "{:.1f} MiB".format(n / (1 << 20))
+    elif n >= 1 << 10:
+        return "{:.1f} KiB".format(n / (1 << 10))
+    else:
+        return "{:.0f} B".format(n)
+
+@command('netstats', 'bandwidth', admin_only = True)
+def c_netstats(connection, value = None):
+    """
+    Report the packets sent per packet type and per call site, and the deepest send queues
+    /netstats [reset]
+    """
+
+    protocol = connection.protocol
+
+    if (stats := protocol.net_stats) is None:
+        return "Network statistics are disabled (arena.net_stats)"
+
+    if value == 'reset':
+        protocol.net_stats = NetStats(protocol.time)
+        return "Network statistics reset"
+    elif value is not None:
+        return "Usage: /netstats [reset]"
+
+    uptime = max(1.0, protocol.time - stats.start)
+    rate, peak_time, peak_sites = stats.peak
+
+    packets = ", ".join(
+        "{} {}".format(get_packet_name(_server_loaders, packet_id), format_bytes(n / uptime))
+        for packet_id, n in stats.sent_bytes.most_common(5)
+    )
+
+    sites = ", ".join(
+        "{}{} {} ×{:.1f}".format(
+            site, " (saved)" if save else "", format_bytes(site_stats.bytes / uptime),
+            (site_stats.sent + site_stats.saved) / site_stats.calls
+        )
+        for (site, save), site_stats in sorted(stats.sites.items(), key = lambda item: item[1].bytes, reverse = True)[:5]
+    )
+
+    queues = ", ".join(
+        "{} {}/{}".format(name, format_bytes(in_flight), saved)
+        for name, in_flight, saved in sorted(stats.queues.values(), key = lambda queue: queue[1], reverse = True)[:3]
+    )
+
+    return "\n".join((
+        "Sent {}/s, received {}/s. Peak {}/s {:.0f} s ago: {}".format(
+            format_bytes(sum(stats.sent_bytes.values()) / uptime),
+            format_bytes(sum(stats.received_bytes.values()) / uptime),
+            format_bytes(rate), protocol.time - peak_time,
+            ", ".join("{} {}".format(site, format_bytes(n)) for site, n in peak_sites) or "nothing"
+        ),
+        "Packets: {}".format(packets or "none"),
+        "Sites: {}".format(sites or "none"),
+        "Queues (in flight/saved): {}".format(queues or "none")
+    ))
@@ -0,0 +1,78 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from struct import Struct
+
+from pyspades.contained import GrenadePacket, BlockAction, BlockLine, SetColor
+from pyspades.constants import BUILD_BLOCK, DESTROY_BLOCK, SPADE_DESTROY, GRENADE_DESTROY
+
+# Wire layouts of the packets as written by `pyspades.contained` (little-endian).
+grenade_layout      = Struct('<BBf3f3f') # id, player_id, fuse, position, velocity
+grenade_head_layout = Struct('<Bf3f')    # player_id, fuse, position
+block_action_layout = Struct('<BBBiii')  # id, player_id, value, x, y, z
+block_xyz_layout    = Struct('<iii')
+block_line_layout   = Struct('<BBiiiiii') # id, player_id, x1, y1, z1, x2, y2, z2
+
+class GrenadeTemplate:
+    """
+    Encoded `GrenadePacket` with a fixed velocity: only the player, the fuse
+    and the position are written for every packet.
+    """
+
+    __slots__ = ('buffer',)
+
+    def __init__(self, velocity = (0, 0, 0)):
+        self.buffer = bytearray(grenade_layout.size)
+        grenade_layout.pack_into(self.buffer, 0, GrenadePacket.id, 0, 0.0, 0.0, 0.0, 0.0, *velocity)
+
+    def encode(self, player_id, x, y, z, fuse = 0.0):
+        grenade_head_layout.pack_into(self.buffer, 1, player_id, fuse, x, y, z)
+        return bytes(self.buffer)
+
+class BlockActionTemplate:
+    """
+    Encoded `BlockAction` with a fixed action: only the player and the block are written for every packet.
+    """
+
+    __slots__ = ('buffer',)
+
+    def __init__(self, value):
+        self.buffer = bytearray(block_action_layout.size)
+        block_action_layout.pack_into(self.buffer, 0, BlockAction.id, 0, value, 0, 0, 0)
+
+    def encode(self, player_id, x, y, z):
+        buffer = self.buffer
+
+        buffer[1] = player_id
+        block_xyz_layout.pack_into(buffer, 3, x, y, z)
+
+        return bytes(buffer)
+
+def encode_grenade(player_id, fuse, x, y, z, vx, vy, vz):
+    return grenade_layout.pack(GrenadePacket.id, player_id, fuse, x, y, z, vx, vy, vz)
+
+def encode_block_line(player_id, x1, y1, z1, x2, y2, z2):
+    return block_line_layout.pack(BlockLine.id, player_id, x1, y1, z1, x2, y2, z2)
+
+def encode_set_color(player_id, color):
+    r, g, b = color
+    return bytes((SetColor.id, player_id, b, g, r))
+
+grenade_effect = GrenadeTemplate()
+
+build_block     = BlockActionTemplate(BUILD_BLOCK)
+destroy_block   = BlockActionTemplate(DESTROY_BLOCK)
+spade_destroy   = BlockActionTemplate(SPADE_DESTROY)
+grenade_destroy = BlockActionTemplate(GRENADE_DESTROY)
@@ -0,0 +1,326 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import OrderedDict, Counter
+from itertools import product
+from array import array
+from time import time
+
+from pyspades.common import prettify_timespan
+
+from piqueserver.commands import command, player_only
+from piqueserver.utils import timeparse
+
+from arenalib.snapshot import pack, apply_blocks
+
+CHUNK_BITS = 3
+CHUNK_SIZE = 1 << CHUNK_BITS
+CHUNK_MASK = CHUNK_SIZE - 1
+
+# Every chunk covers CHUNK_SIZE × CHUNK_SIZE columns of the map
+CHUNK_VOXELS = CHUNK_SIZE * CHUNK_SIZE * 64
+
+NONE, BUILT, DESTROYED = 0, 1, 2
+
+action_names = {BUILT: "built", DESTROYED: "destroyed"}
+
+# Values of `before`: the color of the block, or one of these
+EMPTY, UNKNOWN = -1, -2
+
+def encode_color(color):
+    r, g, b = color
+    return r << 16 | g << 8 | b
+
+def decode_color(value):
+    return (value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF
+
+def destroy_point(M, x, y, z):
+    """
+    Same as `VXLData.destroy_point`, but also returns the colors (voxel → `encode_color`)
+    of the blocks that fell with the block, which `check_node` only counts (or `None`).
+    """
+
+    if z >= 62 or not M.get_solid(x, y, z):
+        return 0, None
+
+    M.remove_point(x, y, z)
+
+    count, falling = 1, None
+
+    for node in M.get_neighbors(x, y, z):
+        if node[2] >= 62 or (falling and node in falling):
+            continue
+
+        # `check_node` is 0 for blocks connected to the bottom of the map
+        if M.check_node(*node) == 0:
+            continue
+
+        if falling is None:
+            falling = dict()
+
+        component = [node]
+        falling[node] = encode_color(M.get_color(*node))
+
+        for voxel in component:
+            for other in M.get_neighbors(*voxel):
+                if other not in falling:
+                    falling[other] = encode_color(M.get_color(*other))
+                    component.append(other)
+
+        count += M.check_node(*node, True)
+
+    return count, falling
+
+class HistoryChunk:
+    __slots__ = ('who', 'action', 'time', 'before', 'updated')
+
+    def __init__(self):
+        self.who     = array('H', bytes(2 * CHUNK_VOXELS))
+        self.action  = array('B', bytes(CHUNK_VOXELS))
+        self.time    = array('I', bytes(4 * CHUNK_VOXELS))
+        self.before  = array('i', [UNKNOWN]) * CHUNK_VOXELS
+        self.updated = 0
+
+def get_chunk_key(x, y):
+    return x >> CHUNK_BITS, y >> CHUNK_BITS
+
+def get_index(x, y, z):
+    return ((x & CHUNK_MASK) << CHUNK_BITS | (y & CHUNK_MASK)) << 6 | z
+
+class BlockHistory:
+    """
+    Last player to build or destroy every block, with the time and the state of the block
+    before that player started to modify it. Stored in arrays by chunks of columns, created
+    when a block of the chunk is first modified. At most `max_chunks` are kept, and the chunks
+    not modified for `max_age` seconds are dropped.
+    """
+
+    def __init__(self, max_chunks = 256, max_age = 3600):
+        self.max_chunks = max_chunks
+        self.max_age    = max_age
+
+        self.chunks = OrderedDict() # least recently modified first
+        self.names  = [None]
+        self.index  = dict()
+
+    def reset(self):
+        self.chunks.clear()
+
+        self.names = [None]
+        self.index.clear()
+
+    def get_who(self, name):
+        if (who := self.index.get(name)) is None:
+            # Every player is identified by an array('H') index: start over when they run out
+            if len(self.names) > 0xFFFF:
+                self.reset()
+
+            who = self.index[name] = len(self.names)
+            self.names.append(name)
+
+        return who
+
+    def record(self, x, y, z, name, action, before, t = None):
+        t = int(time() if t is None else t)
+
+        key = get_chunk_key(x, y)
+
+        if (chunk := self.chunks.get(key)) is None:
+            chunk = self.chunks[key] = HistoryChunk()
+        else:
+            self.chunks.move_to_end(key)
+
+        i, who = get_index(x, y, z), self.get_who(name)
+
+        # Reverting a player restores the block as it was before their first change
+        if chunk.action[i] == NONE or chunk.who[i] != who:
+            chunk.before[i] = before
+
+        chunk.who[i]    = who
+        chunk.action[i] = action
+        chunk.time[i]   = t
+        chunk.updated   = t
+
+        self.evict(t)
+
+    def forget(self, x, y, z):
+        if chunk := self.chunks.get(get_chunk_key(x, y)):
+            chunk.action[get_index(x, y, z)] = NONE
+
+    def evict(self, t):
+        while len(self.chunks) > self.max_chunks:
+            self.chunks.popitem(last = False)
+
+        while self.chunks:
+            key, chunk = next(iter(self.chunks.items()))
+
+            if chunk.updated >= t - self.max_age:
+                break
+
+            del self.chunks[key]
+
+    def get(self, x, y, z):
+        """
+        Returns the last player, action, time and previous state of the block, or `None`.
+        """
+
+        if chunk := self.chunks.get(get_chunk_key(x, y)):
+            i = get_index(x, y, z)
+
+            if (action := chunk.action[i]) != NONE:
+                return self.names[chunk.who[i]], action, chunk.time[i], chunk.before[i]
+
+    def find(self, name, since = 0):
+        """
+        Yields the blocks last modified by the player `name` since the time `since`.
+        """
+
+        if (who := self.index.get(name)) is None:
+            return
+
+        for (cx, cy), chunk in list(self.chunks.items()):
+            if chunk.updated < since:
+                continue
+
+            for i, w in enumerate(chunk.who):
+                if w != who or chunk.action[i] == NONE or chunk.time[i] < since:
+                    continue
+
+                x = cx << CHUNK_BITS | (i >> (CHUNK_BITS + 6))
+                y = cy << CHUNK_BITS | ((i >> 6) & CHUNK_MASK)
+                z = i & 0x3F
+
+                yield x, y, z, chunk.action[i], chunk.time[i], chunk.before[i]
+
+    def lookup_name(self, name):
+        # Players are looked up by name case-insensitively, as they might have left already
+        if name in self.index:
+            return name
+
+        for known in self.names[1:]:
+            if known.lower() == name.lower():
+                return known
+
+def get_target(connection, args):
+    if args:
+        try:
+            x, y, z = map(int, args)
+        except ValueError:
+            return None
+
+        if 0 <= x < 512 and 0 <= y < 512 and 0 <= z < 64:
+            return x, y, z
+        else:
+            return None
+
+    if wo := connection.world_object:
+        return wo.cast_ray(128.0)
+
+def describe(entry, t):
+    name, action, when, before = entry
+    return "{} {} {} ago".format(name, action_names[action], prettify_timespan(max(0, t - when)))
+
+@command('whobuilt', 'wb', admin_only = True)
+@player_only
+def c_whobuilt(connection, *args):
+    """
+    Tell who last built or destroyed the block you are looking at (or the given one)
+    /whobuilt [x y z]
+    """
+
+    if (target := get_target(connection, args)) is None:
+        return "Look at a block or give its coordinates"
+
+    history = connection.protocol.block_history
+
+    if entry := history.get(*target):
+        return "{}: {}".format(target, describe(entry, time()))
+    else:
+        return "{}: no record".format(target)
+
+@command('whodestroyed', 'wd', admin_only = True)
+@player_only
+def c_whodestroyed(connection, *args):
+    """
+    Tell who destroyed the blocks around the one you are looking at (or the given one)
+    /whodestroyed [x y z]
+    """
+
+    if (target := get_target(connection, args)) is None:
+        return "Look at a block or give its coordinates"
+
+    history = connection.protocol.block_history
+
+    x, y, z = target
+    counts, latest = Counter(), dict()
+
+    for X, Y, Z in product(range(x - 2, x + 3), range(y - 2, y + 3), range(max(0, z - 2), min(64, z + 3))):
+        if entry := history.get(X, Y, Z):
+            name, action, when, before = entry
+
+            if action == DESTROYED:
+                counts[name] += 1
+                latest[name] = max(latest.get(name, 0), when)
+
+    if not counts:
+        return "{}: nothing was destroyed around".format(target)
+
+    t = time()
+
+    return "{}: {}".format(target, ", ".join(
+        "{} ({} blocks, last {} ago)".format(name, count, prettify_timespan(max(0, t - latest[name])))
+        for name, count in counts.most_common(5)
+    ))
+
+@command('revert', admin_only = True)
+def c_revert(connection, name, timeval = None):
+    """
+    Undo the blocks built and destroyed by a player within the given time (10 minutes by default)
+    /revert <player> [time]
+    """
+
+    protocol = connection.protocol
+    history  = protocol.block_history
+
+    Δt = 600 if timeval is None else timeparse(timeval)
+    if Δt is None: return "'{}' was not recognized as a valid time value".format(timeval)
+
+    if (known := history.lookup_name(name)) is None:
+        return "No blocks were modified by {}".format(name)
+
+    M = protocol.map
+
+    builds, destroys = dict(), []
+
+    for x, y, z, action, when, before in list(history.find(known, time() - Δt)):
+        if before == EMPTY:
+            if M.get_solid(x, y, z):
+                destroys.append(pack(x, y, z))
+        elif before != UNKNOWN:
+            builds[pack(x, y, z)] = decode_color(before)
+        else:
+            continue
+
+        history.forget(x, y, z)
+
+    # The blocks are sent on behalf of the admin, or of anyone if it is run from the console
+    if connection not in protocol.players.values():
+        connection = next((player for player in protocol.players.values() if player.name is not None), None)
+
+    built, destroyed = apply_blocks(protocol, builds, destroys, connection)
+
+    return "Reverted {}: {} blocks restored, {} removed in the last {}".format(
+        known, built, destroyed, prettify_timespan(Δt)
+    )
@@ -0,0 +1,111 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import Counter
+
+from piqueserver.commands import command
+
+# How many tokens every rate-limited action takes (see `ActionLimiter`)
+default_action_costs = {
+    'line':     5, # line build: rasterized and built block by block
+    'tunnel':  10, # spade secondary fire between rounds: `wall_tunnel`
+    'buy':      2, # /buy
+    'plant':    2, # /plant
+    'dropflag': 2  # /dropflag
+}
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'time')
+
+    def __init__(self, rate, burst, t):
+        self.rate   = rate
+        self.burst  = burst
+        self.tokens = burst
+        self.time   = t
+
+    def refill(self, t):
+        self.tokens = min(self.burst, self.tokens + (t - self.time) * self.rate)
+        self.time   = t
+
+    def has(self, n):
+        return n <= self.tokens
+
+    def take(self, n):
+        self.tokens -= n
+
+class ActionStats:
+    def __init__(self):
+        self.allowed   = Counter() # action → count
+        self.throttled = Counter() # action → count
+        self.offenders = Counter() # player name → count of throttled actions
+
+    def record(self, player, action, allowed):
+        if allowed:
+            self.allowed[action] += 1
+        else:
+            self.throttled[action] += 1
+            self.offenders[player.name] += 1
+
+class ActionLimiter:
+    """
+    Every rate-limited action of a player takes `costs[action]` tokens from the same bucket,
+    refilled at `rate` tokens per second up to `burst`. An action that finds the bucket
+    short of tokens should not be performed. A rate of 0 disables the limit.
+    """
+
+    __slots__ = ('bucket', 'costs', 'stats')
+
+    def __init__(self, rate, burst, costs, stats, t):
+        self.bucket = TokenBucket(rate, burst, t) if rate > 0 else None
+        self.costs  = costs
+        self.stats  = stats
+
+    def allow(self, player, action, t):
+        if bucket := self.bucket:
+            cost = self.costs.get(action, 1)
+
+            bucket.refill(t)
+
+            if allowed := bucket.has(cost):
+                bucket.take(cost)
+        else:
+            allowed = True
+
+        self.stats.record(player, action, allowed)
+
+        return allowed
+
+@command('throttled', 'ratelimit', admin_only = True)
+def c_throttled(connection):
+    """
+    Report the actions refused by the rate limiter
+    /throttled or /ratelimit
+    """
+
+    stats = connection.protocol.action_stats
+
+    if not stats.throttled:
+        return "No actions have been throttled"
+
+    actions = ", ".join(
+        "{} {}/{}".format(action, count, count + stats.allowed[action])
+        for action, count in stats.throttled.most_common()
+    )
+
+    offenders = ", ".join(
+        "{} ({})".format(name, count) for name, count in stats.offenders.most_common(5)
+    )
+
+    return "Throttled: {}. Most throttled: {}".format(actions, offenders)
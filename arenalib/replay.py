@@ -0,0 +1,432 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Records what the clients send to the server, and replays it in this process as fast as possible
+to measure the server on real traffic.
+
+Loaded as a script (`arenalib.replay`), this module records, when “record” is set in the section
+`[replay]`, every connection, disconnection, map change and packet received by the server, with
+its time, to a file (the name is given to `strftime`):
+
+    [replay]
+    record = "recordings/%Y%m%d-%H%M%S.rec"
+
+The records are buffered, then compressed and written by a thread of their own. The arguments
+of the commands that take a secret (`/login <password>`) are left out of the recording. Run as a module,
+it replays a recording against the arena game mode and the scripts `falloff`, `handicap` and
+`map_extensions` (see `arenalib.bench`), and reports the CPU time spent and the cost of every
+handler (every type of packet, the world steps and the network updates):
+
+    python -m arenalib.replay [-d CONFIG_DIR] [-c CONFIG_FILE] [--json FILE] RECORDING
+
+The replay runs on the clock of the recording, so that timers, rate limits and map transfers
+behave as they did, and with a fixed random seed: two replays of the same recording do the
+same work. Maps are generated again from their name and seed; maps that save themselves
+are loaded as they are saved at the time of the replay.
+"""
+
+from argparse import ArgumentParser
+from collections import defaultdict
+from functools import partial
+from datetime import datetime
+from queue import SimpleQueue
+from threading import Thread
+import struct
+import zlib
+import json
+import time
+import sys
+
+from os.path import abspath, dirname
+from os import makedirs
+
+import enet
+
+from twisted.internet.task import Clock
+from twisted.internet import reactor
+
+from pyspades.constants import UPDATE_FREQUENCY, NETWORK_FPS
+from pyspades.packet import _client_loaders
+from pyspades.contained import ChatMessage
+
+from piqueserver.config import config
+
+record_option = config.section("replay").option("record", "")
+
+MAGIC = b"ARENAREC\x01"
+
+MAP, CONNECT, DISCONNECT, PACKET = range(4)
+
+# Time (µs since the start of the recording), kind, peer, size of the data that follows
+record_header = struct.Struct('<QBII')
+block_header  = struct.Struct('<I')
+
+COMPRESSION_LEVEL = 6
+
+# The buffer is handed to the writer at least this often (seconds), or once it is this large (bytes)
+FLUSH_INTERVAL = 1.0
+FLUSH_SIZE     = 1 << 20
+
+# Commands whose arguments are not recorded
+secret_commands = frozenset((b'login',))
+
+def redact(data):
+    # Chat messages are laid out as id, player id, chat type, then the text, null-terminated
+    if len(data) > 4 and data[0] == ChatMessage.id and data[3] == ord('/'):
+        name, *args = data[4:].rstrip(b'\x00').split(None, 1) or (b'',)
+
+        if args and (name := name.lower()) in secret_commands:
+            return data[:4] + name + b'\x00'
+
+    return data
+
+class Recorder:
+    def __init__(self, filename):
+        self.start  = time.monotonic()
+        self.buffer = bytearray()
+        self.queue  = SimpleQueue()
+        self.peers  = dict() # peer → index
+        self.count  = 0
+
+        self.last_flush = self.start
+
+        self.thread = Thread(target = self.write, args = (filename,), daemon = True)
+        self.thread.start()
+
+    def record(self, kind, peer = 0, data = b''):
+        t = int(1e6 * (time.monotonic() - self.start))
+
+        self.buffer += record_header.pack(t, kind, peer, len(data))
+        self.buffer += data
+
+        if len(self.buffer) >= FLUSH_SIZE:
+            self.flush()
+
+    def get_peer(self, peer):
+        if (index := self.peers.get(peer)) is None:
+            self.count += 1
+            index = self.peers[peer] = self.count
+
+        return index
+
+    def on_connect(self, peer):
+        self.record(CONNECT, self.get_peer(peer))
+
+    def on_disconnect(self, peer):
+        if (index := self.peers.pop(peer, None)) is not None:
+            self.record(DISCONNECT, index)
+
+    def on_packet(self, peer, data):
+        self.record(PACKET, self.get_peer(peer), redact(data))
+
+    def on_map(self, name):
+        self.record(MAP, 0, name.encode())
+
+    def update(self):
+        if (t := time.monotonic()) - self.last_flush >= FLUSH_INTERVAL:
+            self.last_flush = t
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.queue.put(bytes(self.buffer))
+            self.buffer.clear()
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+
+    def write(self, filename):
+        with open(filename, 'wb') as fout:
+            fout.write(MAGIC)
+
+            while (data := self.queue.get()) is not None:
+                block = zlib.compress(data, COMPRESSION_LEVEL)
+
+                fout.write(block_header.pack(len(block)))
+                fout.write(block)
+                fout.flush()
+
+def read_records(filename):
+    """
+    Yields the records of a recording as (time in seconds, kind, peer, data).
+    """
+
+    with open(filename, 'rb') as fin:
+        if fin.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a recording".format(filename))
+
+        # A recording cut short (e.g. the server was killed) ends with an incomplete block
+        while len(header := fin.read(block_header.size)) == block_header.size:
+            size, = block_header.unpack(header)
+
+            if len(block := fin.read(size)) < size:
+                break
+
+            data = zlib.decompress(block)
+            i = 0
+
+            while i < len(data):
+                t, kind, peer, size = record_header.unpack_from(data, i)
+                i += record_header.size
+
+                yield t / 1e6, kind, peer, data[i:i + size]
+                i += size
+
+def get_map_name(map_info):
+    # The name of a generated map gives its seed
+    return map_info.name if map_info.gen_script else map_info.rot_info.full_name
+
+def apply_script(protocol, connection, config):
+    if not (pattern := record_option.get()):
+        return protocol, connection
+
+    class RecordingProtocol(protocol):
+        def __init__(self, *w, **kw):
+            filename = datetime.now().strftime(pattern)
+
+            if directory := dirname(filename):
+                makedirs(directory, exist_ok = True)
+
+            self.recorder = Recorder(filename)
+
+            protocol.__init__(self, *w, **kw)
+
+        def on_connect(self, peer):
+            self.recorder.on_connect(peer)
+            protocol.on_connect(self, peer)
+
+        def on_disconnect(self, peer):
+            self.recorder.on_disconnect(peer)
+            protocol.on_disconnect(self, peer)
+
+        def data_received(self, peer, packet):
+            self.recorder.on_packet(peer, packet.data)
+            protocol.data_received(self, peer, packet)
+
+        def set_map(self, M):
+            self.recorder.on_map(get_map_name(self.map_info))
+            protocol.set_map(self, M)
+
+        def on_world_update(self):
+            self.recorder.update()
+            protocol.on_world_update(self)
+
+        async def shutdown(self):
+            await protocol.shutdown(self)
+            self.recorder.close()
+
+    return RecordingProtocol, connection
+
+class ReplayClock(Clock):
+    """
+    Stands for `time.monotonic` and for the clock of the reactor during a replay: the time of
+    the recording. Calls scheduled with `reactor.callLater` are run when the replay gets there.
+    """
+
+    def __init__(self, t):
+        Clock.__init__(self)
+        self.rightNow = t
+
+    def __call__(self):
+        return self.rightNow
+
+class Costs:
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.time  = defaultdict(float)
+
+    def measure(self, name, f, *w):
+        t0 = time.perf_counter()
+        f(*w)
+        self.time[name] += time.perf_counter() - t0
+        self.calls[name] += 1
+
+    def get_handlers(self):
+        total = sum(self.time.values())
+
+        return [
+            {
+                "name":  name,
+                "calls": self.calls[name],
+                "total": 1e3 * self.time[name],
+                "mean":  1e6 * self.time[name] / self.calls[name],
+                "share": self.time[name] / total if total > 0 else 0.0
+            }
+            for name in sorted(self.time, key = self.time.get, reverse = True)
+        ]
+
+class Replay:
+    """
+    Feeds a recording to `protocol` as `ServerProtocol.update` would have: the packets received
+    before every iteration of the loop, then the map transfers, the world steps and the network update.
+    """
+
+    def __init__(self, protocol, clock, load_map, make_peer):
+        self.protocol  = protocol
+        self.clock     = clock
+        self.load_map  = load_map
+        self.make_peer = make_peer
+        self.costs     = Costs()
+        self.peers     = dict() # index → peer
+        self.dropped   = 0
+
+        self.packet_names = {
+            i: "packet {}".format(loader.__name__) for i, loader in _client_loaders.items()
+        }
+
+        self.next_iteration = protocol.world_time + UPDATE_FREQUENCY
+
+    def set_time(self, t):
+        # Exactly `t`: the world steps are due at multiples of UPDATE_FREQUENCY
+        self.clock.rightNow = t
+        self.costs.measure("timers", self.clock.advance, 0)
+
+    def advance(self, t):
+        while self.next_iteration <= t:
+            self.set_time(self.next_iteration)
+            self.iterate()
+
+            self.next_iteration = self.protocol.world_time + UPDATE_FREQUENCY
+
+        self.set_time(t)
+
+    def iterate(self):
+        protocol, measure = self.protocol, self.costs.measure
+
+        for player in list(protocol.connections.values()):
+            if player.map_data is not None and not player.peer.reliableDataInTransit:
+                measure("map transfer", player.continue_map_transfer)
+
+        # A step is due at `world_time + UPDATE_FREQUENCY`, which is when the replay wakes up
+        while protocol.world_time + UPDATE_FREQUENCY <= self.clock.rightNow:
+            protocol.loop_count += 1
+
+            measure("world step", protocol.world.update, UPDATE_FREQUENCY)
+            measure("world update", protocol.on_world_update)
+
+            protocol.world_time += UPDATE_FREQUENCY
+
+        if self.clock.rightNow - protocol.last_network_update >= 1 / NETWORK_FPS:
+            protocol.last_network_update = protocol.world_time
+            measure("network update", protocol.update_network)
+
+    def dispatch(self, kind, index, data):
+        protocol, measure = self.protocol, self.costs.measure
+
+        if kind == MAP:
+            measure("map change", protocol.set_map_info, self.load_map(data.decode()))
+        elif kind == CONNECT:
+            peer = self.peers[index] = self.make_peer(index)
+            measure("connect", protocol.on_connect, peer)
+        elif kind == DISCONNECT:
+            if (peer := self.peers.pop(index, None)) is not None:
+                measure("disconnect", protocol.on_disconnect, peer)
+        elif kind == PACKET:
+            # Players kicked during the replay (or before the first map) are not there anymore
+            if (peer := self.peers.get(index)) is None or peer not in protocol.connections:
+                self.dropped += 1
+                return
+
+            name = self.packet_names.get(data[0], "packet {}".format(data[0])) if data else "packet"
+            measure(name, protocol.data_received, peer, enet.Packet(data))
+
+    def run(self, records):
+        start = self.clock.rightNow
+        count = 0
+
+        for t, kind, index, data in records:
+            self.advance(start + t)
+            self.dispatch(kind, index, data)
+            count += 1
+
+        self.advance(self.clock.rightNow + UPDATE_FREQUENCY)
+
+        return self.clock.rightNow - start, count
+
+def install_clock():
+    # Before the game mode and the scripts are loaded: they import `monotonic` from `time`
+    clock = ReplayClock(time.monotonic())
+    time.monotonic = clock
+
+    reactor.seconds   = clock.seconds
+    reactor.callLater = clock.callLater
+
+    return clock
+
+def format_result(result):
+    lines = [
+        "{recording}: {records} records, {duration:.1f} s replayed in {wall:.2f} s (cpu {cpu:.2f} s, ×{speed:.1f}), {dropped} packets dropped".format(**result),
+        "  {:<28} {:>9} {:>11} {:>10} {:>7}".format("handler", "calls", "total (ms)", "mean (µs)", "share")
+    ]
+
+    for handler in result["handlers"]:
+        lines.append("  {name:<28} {calls:>9} {total:>11.1f} {mean:>10.2f} {share:>7.1%}".format(**handler))
+
+    return "\n".join(lines)
+
+def main(argv = None):
+    parser = ArgumentParser(prog = "python -m arenalib.replay", description = "Replay a recording of the arena and measure the server.")
+    parser.add_argument("recording", help = "file written by the script `arenalib.replay`")
+    parser.add_argument("-d", "--config-dir", default = ".", help = "directory of the maps, scripts and game modes (default: .)")
+    parser.add_argument("-c", "--config-file", default = None, help = "config file of the server (default: none)")
+    parser.add_argument("--seed", type = int, default = 0, help = "random seed (default: 0)")
+    parser.add_argument("--json", metavar = "FILE", help = "write the results to FILE")
+
+    args = parser.parse_args(argv)
+
+    config_dir = abspath(args.config_dir)
+    clock      = install_clock()
+
+    from arenalib.supervisor import load_config
+    from arenalib.bench import BenchPeer, load_classes, load_map
+    import random
+
+    # Before the game mode is loaded: it reads its options once
+    if args.config_file is not None:
+        load_config(config_dir, abspath(args.config_file))
+
+    random.seed(args.seed)
+
+    protocol = load_classes(config_dir)()
+    replay   = Replay(protocol, clock, partial(load_map, config_dir), BenchPeer)
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    duration, count = replay.run(read_records(args.recording))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    result = {
+        "recording": args.recording,
+        "records":   count,
+        "duration":  duration,
+        "wall":      wall,
+        "cpu":       cpu,
+        "speed":     duration / wall if wall > 0 else 0.0,
+        "dropped":   replay.dropped,
+        "handlers":  replay.costs.get_handlers()
+    }
+
+    print(format_result(result), flush = True)
+
+    if args.json is not None:
+        with open(args.json, 'w') as fout:
+            json.dump(result, fout, indent = 2)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import Counter
+from hashlib import sha1
+from io import BytesIO
+import zlib
+
+from os.path import join, isfile, isdir, splitext, getmtime
+from os import makedirs, replace, remove, scandir
+
+# Every chunk covers 4 rows of the map (VXL columns are stored row after row)
+CHUNK_COLUMNS = 4 * 512
+
+COMPRESSION_LEVEL = 6
+
+MANIFEST_SUFFIX = ".manifest"
+MANIFEST_HEADER = "vxl-chunks 1 {}"
+
+def write_atomic(filename, data):
+    temporary = filename + ".tmp"
+
+    with open(temporary, 'wb') as fout:
+        fout.write(data)
+
+    replace(temporary, filename)
+
+class SaveStore:
+    """
+    Maps saved in `dirname`, split into chunks of `CHUNK_COLUMNS` columns. Every chunk is
+    stored once, compressed, in `dirname/chunks/` under the hash of its contents, so saves
+    sharing the same regions (water, flat ground) share their chunks. A save is only
+    a manifest listing its chunks, `dirname/X.manifest`. Chunks no longer listed by
+    any manifest are removed when a save is overwritten or deleted.
+    """
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self.chunks  = join(dirname, "chunks")
+        self.refs    = None # digest → number of manifests listing it
+
+    def get_manifest_path(self, name):
+        return join(self.dirname, name + MANIFEST_SUFFIX)
+
+    def get_chunk_path(self, digest):
+        return join(self.chunks, digest + ".z")
+
+    def exists(self, name):
+        return isfile(self.get_manifest_path(name))
+
+    def getmtime(self, name):
+        return getmtime(self.get_manifest_path(name))
+
+    def names(self):
+        if isdir(self.dirname) is False:
+            return
+
+        for entry in scandir(self.dirname):
+            stem, suffix = splitext(entry.name)
+
+            if suffix == MANIFEST_SUFFIX and entry.is_file():
+                yield stem
+
+    def read_manifest(self, name):
+        with open(self.get_manifest_path(name), 'r') as fin:
+            header, *digests = fin.read().splitlines()
+
+        return digests
+
+    def read_chunk(self, digest):
+        with open(self.get_chunk_path(digest), 'rb') as fin:
+            return zlib.decompress(fin.read())
+
+    def open(self, name):
+        """
+        Returns a file-like object with the VXL data of the save `name`, for `VXLData`
+        (which reads the whole map at once: the chunks are joined beforehand).
+        """
+
+        return BytesIO(b''.join(map(self.read_chunk, self.read_manifest(name))))
+
+    def get_refs(self):
+        if self.refs is None:
+            self.refs = Counter()
+
+            for name in self.names():
+                self.refs.update(set(self.read_manifest(name)))
+
+        return self.refs
+
+    def save(self, name, chunks):
+        """
+        Saves a map serialized by pieces of `CHUNK_COLUMNS` columns (see `MapCache.get_chunks`),
+        writing only the chunks that are not stored already.
+        """
+
+        makedirs(self.chunks, exist_ok = True)
+
+        refs     = self.get_refs()
+        previous = set(self.read_manifest(name)) if self.exists(name) else set()
+        digests  = []
+
+        for data in chunks:
+            digest = sha1(data).hexdigest()
+
+            if refs[digest] <= 0 and not isfile(self.get_chunk_path(digest)):
+                write_atomic(self.get_chunk_path(digest), zlib.compress(data, COMPRESSION_LEVEL))
+
+            digests.append(digest)
+
+        manifest = "\n".join([MANIFEST_HEADER.format(CHUNK_COLUMNS), *digests])
+        write_atomic(self.get_manifest_path(name), manifest.encode())
+
+        current = set(digests)
+
+        refs.update(current - previous)
+        self.release(previous - current)
+
+    def delete(self, name):
+        digests = set(self.read_manifest(name))
+        remove(self.get_manifest_path(name))
+
+        self.get_refs()
+        self.release(digests)
+
+    def release(self, digests):
+        unused = []
+
+        for digest in digests:
+            self.refs[digest] -= 1
+
+            if self.refs[digest] <= 0:
+                del self.refs[digest]
+                unused.append(digest)
+
+        if not unused:
+            return
+
+        # Several servers might save to the same directory: the manifests on disk have the last word
+        self.refs = None
+        refs = self.get_refs()
+
+        for digest in unused:
+            if refs[digest] <= 0 and isfile(filename := self.get_chunk_path(digest)):
+                remove(filename)
+
+    def get_usage(self):
+        """
+        Returns the number of saves, of chunks, and the size of the chunks on disk.
+        """
+
+        saves = sum(1 for name in self.names())
+
+        if isdir(self.chunks) is False:
+            return saves, 0, 0
+
+        chunks, size = 0, 0
+
+        for entry in scandir(self.chunks):
+            if entry.is_file():
+                chunks += 1
+                size   += entry.stat().st_size
+
+        return saves, chunks, size
+
+stores = dict()
+
+def get_store(dirname):
+    # Stores are shared by directory, to keep the counts of references consistent
+    if (store := stores.get(dirname)) is None:
+        store = stores[dirname] = SaveStore(dirname)
+
+    return store
@@ -0,0 +1,157 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from time import perf_counter
+from math import ceil, isfinite
+import traceback
+
+from piqueserver.commands import command
+
+# Fractional part of the golden ratio: consecutive multiples of it are spread evenly over [0, 1),
+# which is used to offset the phases of the tasks registered with the same period.
+φ = 0.6180339887498949
+
+class PeriodicTask:
+    __slots__ = (
+        'name', 'period', 'callback', 'per_player', 'owner',
+        'elapsed', 'cycle', 'cursor', 'calls', 'total_time', 'worst_time', 'last_time'
+    )
+
+    def __init__(self, name, period, callback, per_player, owner, phase):
+        self.name       = name
+        self.period     = period
+        self.callback   = callback
+        self.per_player = per_player
+        self.owner      = owner
+
+        self.elapsed    = phase * period if isfinite(period) else 0.0
+        self.cycle      = []
+        self.cursor     = 0
+
+        self.calls      = 0
+        self.total_time = 0.0
+        self.worst_time = 0.0
+        self.last_time  = 0.0
+
+    def record(self, Δt):
+        self.calls      += 1
+        self.total_time += Δt
+        self.last_time   = Δt
+        self.worst_time  = max(self.worst_time, Δt)
+
+    def update(self, protocol, dt, t):
+        if not isfinite(self.period):
+            return
+
+        self.elapsed += dt
+
+        if self.per_player:
+            self.sweep(protocol, t)
+        elif self.period <= self.elapsed:
+            self.elapsed = 0.0 if self.elapsed >= 2 * self.period else self.elapsed - self.period
+
+            t0 = perf_counter()
+
+            try:
+                self.callback(protocol, t)
+            except Exception:
+                traceback.print_exc()
+
+            self.record(perf_counter() - t0)
+
+    def sweep(self, protocol, t):
+        # Every player is visited once per period, but the visits are spread evenly over the ticks
+        # of the period instead of all landing on the same one.
+        if self.period <= self.elapsed:
+            self.run(self.cycle, len(self.cycle), t)
+
+            self.elapsed = 0.0 if self.elapsed >= 2 * self.period else self.elapsed - self.period
+            self.cycle   = list(protocol.players.values())
+            self.cursor  = 0
+
+        target = min(len(self.cycle), ceil(len(self.cycle) * self.elapsed / self.period))
+        self.run(self.cycle, target, t)
+
+    def run(self, cycle, target, t):
+        if self.cursor >= target:
+            return
+
+        t0 = perf_counter()
+
+        for player in cycle[self.cursor:target]:
+            if player.name is None:
+                continue
+
+            try:
+                self.callback(player, t)
+            except Exception:
+                traceback.print_exc()
+
+        self.cursor = target
+
+        self.record(perf_counter() - t0)
+
+class TaskScheduler:
+    def __init__(self):
+        self.tasks = dict()
+        self.count = 0
+
+    def register(self, name, period, callback, per_player = False, owner = None):
+        self.count += 1
+
+        task = PeriodicTask(name, period, callback, per_player, owner, (self.count * φ) % 1.0)
+        self.tasks[name] = task
+
+        return task
+
+    def unregister(self, name):
+        self.tasks.pop(name, None)
+
+    def clear(self, owner = None):
+        for name, task in list(self.tasks.items()):
+            if owner is None or task.owner == owner:
+                del self.tasks[name]
+
+    def update(self, protocol, dt, t):
+        for task in list(self.tasks.values()):
+            task.update(protocol, dt, t)
+
+    def __iter__(self):
+        return iter(self.tasks.values())
+
+@command('tickstats', 'tasks', admin_only = True)
+def c_tickstats(connection):
+    """
+    Report timing of the periodic arena tasks
+    /tickstats or /tasks
+    """
+
+    protocol = connection.protocol
+
+    lines = []
+
+    for task in protocol.arena_tasks:
+        if task.calls <= 0:
+            continue
+
+        lines.append("{} ({:.2f} s{}): {:.2f} ms avg, {:.2f} ms max, {} calls".format(
+            task.name, task.period, ", per player" if task.per_player else "",
+            1000 * task.total_time / task.calls, 1000 * task.worst_time, task.calls
+        ))
+
+    if bool(lines):
+        return "\n".join(lines)
+    else:
+        return "No periodic tasks have run yet"
@@ -0,0 +1,173 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pyspades.contained import BlockAction, BlockLine
+from pyspades.constants import BUILD_BLOCK, DESTROY_BLOCK
+
+from arenalib.packets import block_action_layout, block_line_layout
+from arenalib.backlog import get_destroyed
+from arenalib.broadcast import broadcast_data
+from arenalib.raycast import cube_line
+from arenalib import packets
+
+# Voxels are packed as x << 15 | y << 6 | z
+def pack(x, y, z):
+    return x << 15 | y << 6 | z
+
+def unpack(key):
+    return key >> 15, (key >> 6) & 0x1FF, key & 0x3F
+
+def is_valid(x, y, z):
+    return 0 <= x < 512 and 0 <= y < 512 and 0 <= z < 63
+
+neighbours = ((-1, 0, 0), (1, 0, 0), (0, -1, 0), (0, 1, 0), (0, 0, -1), (0, 0, 1))
+
+class RoundSnapshot:
+    """
+    State of the map at the beginning of the first round, to which every round is rolled back:
+    a copy of the map and the set of voxels touched by the block packets since the last rollback.
+    `get_delta` compares these voxels (and the blocks that fell with them) with their current
+    state, so that a rollback costs as much as the blocks modified during the round.
+    """
+
+    __slots__ = ('map', 'touched')
+
+    def __init__(self, M):
+        self.map     = M
+        self.touched = set()
+
+    def observe(self, data):
+        packet_id = data[0]
+
+        if packet_id == BlockAction.id:
+            _, player_id, value, x, y, z = block_action_layout.unpack_from(data)
+
+            if value == BUILD_BLOCK or value == DESTROY_BLOCK:
+                voxels = ((x, y, z),)
+            else:
+                voxels = get_destroyed(value, x, y, z)
+        elif packet_id == BlockLine.id:
+            voxels = cube_line(*block_line_layout.unpack_from(data)[2:])
+        else:
+            return
+
+        self.touched.update(pack(x, y, z) for x, y, z in voxels if is_valid(x, y, z))
+
+    def get_delta(self, M):
+        """
+        Returns the blocks to build (voxel → color) and to destroy to restore the map `M`.
+        """
+
+        S = self.map
+
+        builds, destroys = dict(), []
+
+        visited = set(self.touched)
+        queue   = list(self.touched)
+
+        while queue:
+            key = queue.pop()
+            x, y, z = unpack(key)
+
+            if S.get_solid(x, y, z):
+                color = S.get_color(x, y, z)
+
+                if not M.get_solid(x, y, z):
+                    builds[key] = color
+
+                    # Blocks left floating by the removal of this one were removed as well
+                    for dx, dy, dz in neighbours:
+                        if is_valid(x + dx, y + dy, z + dz):
+                            if (other := pack(x + dx, y + dy, z + dz)) not in visited:
+                                visited.add(other)
+                                queue.append(other)
+                elif M.get_color(x, y, z) != color:
+                    builds[key] = color
+            elif M.get_solid(x, y, z):
+                destroys.append(key)
+
+        return builds, destroys
+
+def get_columns(builds):
+    # Blocks of the same color stacked in the same column are sent as a single line
+    runs = []
+
+    for key in sorted(builds, key = lambda key: (builds[key], key)):
+        x, y, z = unpack(key)
+
+        if runs:
+            color, x0, y0, z1, z2 = runs[-1]
+
+            if color == builds[key] and (x0, y0, z2 + 1) == (x, y, z):
+                runs[-1] = (color, x, y, z1, z)
+                continue
+
+        runs.append((builds[key], x, y, z, z))
+
+    return runs
+
+def get_free_player_id(protocol):
+    # Clients build the blocks of an unknown player with the last color set for that player id
+    return next((player_id for player_id in reversed(range(32)) if player_id not in protocol.players), 31)
+
+def restore_snapshot(protocol, snapshot, player = None):
+    """
+    Rolls the map back to `snapshot`, sending only the blocks that differ.
+    """
+
+    builds, destroys = snapshot.get_delta(protocol.map)
+    result = apply_blocks(protocol, builds, destroys, player)
+
+    snapshot.touched.clear()
+
+    return result
+
+def apply_blocks(protocol, builds, destroys, player = None):
+    """
+    Builds blocks (voxel → color) and destroys others, on the map and for the clients. The blocks
+    are built on behalf of `player`, whose color is set for every color in turn and restored
+    afterwards. Without a player, they are built on behalf of a player id that is not in use.
+    """
+
+    M = protocol.map
+
+    for key, color in builds.items():
+        M.set_point(*unpack(key), color)
+
+    for key in destroys:
+        M.remove_point(*unpack(key))
+
+    player_id  = player.player_id if player is not None else get_free_player_id(protocol)
+    last_color = None
+
+    for color, x, y, z1, z2 in get_columns(builds):
+        if color != last_color:
+            broadcast_data(protocol, packets.encode_set_color(player_id, color), save = True)
+            last_color = color
+
+        if z1 == z2:
+            data = packets.build_block.encode(player_id, x, y, z1)
+        else:
+            data = packets.encode_block_line(player_id, x, y, z1, x, y, z2)
+
+        broadcast_data(protocol, data, save = True)
+
+    if last_color is not None and player is not None:
+        broadcast_data(protocol, packets.encode_set_color(player_id, player.color), save = True)
+
+    for key in destroys:
+        broadcast_data(protocol, packets.destroy_block.encode(player_id, *unpack(key)), save = True)
+
+    return len(builds), len(destroys)
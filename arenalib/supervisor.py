@@ -0,0 +1,295 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Runs several arena servers from the same configuration, one process each (so one core each),
+restarts those that exit and reports their state.
+
+    python -m arenalib.supervisor [-d CONFIG_DIR] [-c CONFIG_FILE] [-n INSTANCES]
+
+Every server gets the port `port + i` and the name `name #i`. The rotation of the
+configuration is dealt between the servers, unless “rotations” gives a rotation for each
+of them. The servers share the directory of map assets (see `arenalib.assets`), and if
+“arena.net_stats_port” is set, server i serves its network statistics at that port + i.
+Configured in the section `[supervisor]`:
+
+    instances   = 2
+    rotations   = [["Babylon", "Chaos"], ["MeatGrinder"]]
+    status_port = 32900 # the status server of server i (on 127.0.0.1) is at status_port + i
+    port        = 32899 # state of all the servers, as JSON (0 to disable)
+    asset_dir   = "assets"
+    interval    = 5     # how often the servers are checked (seconds)
+"""
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.request import urlopen
+from argparse import ArgumentParser
+from threading import Thread
+from time import monotonic, sleep
+import subprocess
+import signal
+import json
+import sys
+
+from os.path import join, isabs, isfile, splitext, abspath
+
+from piqueserver.config import config, TOML_FORMAT, JSON_FORMAT
+
+supervisor_section = config.section("supervisor")
+
+instances_option   = supervisor_section.option("instances", 2)
+rotations_option   = supervisor_section.option("rotations", [])
+status_port_option = supervisor_section.option("status_port", 32900)
+port_option        = supervisor_section.option("port", 32899)
+asset_dir_option   = supervisor_section.option("asset_dir", "assets")
+interval_option    = supervisor_section.option("interval", 5.0)
+
+# Servers that exit are restarted after this many seconds, doubled after every restart up to the maximum
+RESTART_DELAY     = 1.0
+RESTART_MAX_DELAY = 60.0
+
+# Servers are not polled before their first map is loaded (seconds)
+STARTUP_DELAY = 5.0
+
+def load_config(config_dir, config_file):
+    # Same search order as piqueserver
+    if config_file is None:
+        for ext in ('toml', 'json'):
+            if isfile(config_file := join(config_dir, "config.{}".format(ext))):
+                break
+
+    format_ = JSON_FORMAT if splitext(config_file)[1] == ".json" else TOML_FORMAT
+
+    with open(config_file) as fin:
+        config.load_from_file(fin, format_ = format_)
+
+    return config_file
+
+def deal_rotations(rotation, instances):
+    if rotations := rotations_option.get():
+        if len(rotations) != instances:
+            raise ValueError("supervisor.rotations must have a rotation for each of the {} instances".format(instances))
+
+        return rotations
+
+    # Fewer maps than servers: they all play the whole rotation
+    if len(rotation) < instances:
+        return [list(rotation)] * instances
+
+    return [rotation[i::instances] for i in range(instances)]
+
+class Instance:
+    def __init__(self, index, command, status_port):
+        self.index       = index
+        self.command     = command
+        self.status_port = status_port
+
+        self.process    = None
+        self.restarts   = 0
+        self.delay      = RESTART_DELAY
+        self.start_at   = 0.0
+        self.started_at = 0.0
+        self.state      = None
+
+    def start(self, t):
+        self.process    = subprocess.Popen(self.command)
+        self.state      = None
+        self.started_at = t
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+    def check(self, t):
+        if self.process is None:
+            if t >= self.start_at:
+                self.start(t)
+        elif (code := self.process.poll()) is not None:
+            print("arena #{}: exited with {}, restarting in {:.0f} s".format(self.index + 1, code, self.delay), flush = True)
+
+            self.process  = None
+            self.state    = None
+            self.start_at = t + self.delay
+            self.delay    = min(RESTART_MAX_DELAY, 2 * self.delay)
+            self.restarts += 1
+        elif t >= self.started_at + STARTUP_DELAY:
+            self.state = self.poll()
+
+            if self.state is not None:
+                self.delay = RESTART_DELAY
+
+    def poll(self):
+        try:
+            with urlopen("http://127.0.0.1:{}/json".format(self.status_port), timeout = 1.0) as response:
+                return json.load(response)
+        except (OSError, ValueError):
+            return None
+
+    def get_health(self):
+        health = {
+            "instance": self.index + 1,
+            "pid":      self.process.pid if self.process is not None else None,
+            "running":  self.process is not None,
+            "healthy":  self.state is not None,
+            "restarts": self.restarts
+        }
+
+        if state := self.state:
+            health.update(
+                name       = state["serverName"],
+                map        = state["map"]["name"],
+                players    = len(state["players"]),
+                maxPlayers = state["maxPlayers"],
+                uptime     = state["serverUptime"]
+            )
+
+        return health
+
+class Supervisor:
+    def __init__(self, instances):
+        self.instances = instances
+        self.health    = {"instances": [], "players": 0, "maxPlayers": 0}
+        self.running   = True
+
+    def get_health(self):
+        instances = [instance.get_health() for instance in self.instances]
+
+        return {
+            "instances":  instances,
+            "players":    sum(health.get("players", 0) for health in instances),
+            "maxPlayers": sum(health.get("maxPlayers", 0) for health in instances)
+        }
+
+    def summary(self):
+        return " | ".join(
+            "#{} {}".format(health["instance"], "{} {}/{}".format(health["map"], health["players"], health["maxPlayers"])
+                if health["healthy"] else ("starting" if health["running"] else "down"))
+            for health in self.health["instances"]
+        ) + " | total {}/{}".format(self.health["players"], self.health["maxPlayers"])
+
+    def run(self, interval):
+        last = None
+
+        while self.running:
+            t = monotonic()
+
+            for instance in self.instances:
+                instance.check(t)
+
+            self.health = self.get_health()
+
+            if (summary := self.summary()) != last:
+                print(summary, flush = True)
+                last = summary
+
+            sleep(max(0.0, interval - (monotonic() - t)))
+
+    def stop(self, *args):
+        self.running = False
+
+    def shutdown(self, timeout = 10.0):
+        for instance in self.instances:
+            instance.stop()
+
+        for instance in self.instances:
+            if process := instance.process:
+                try:
+                    process.wait(timeout)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+def serve_health(supervisor, port):
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(supervisor.health).encode()
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), HealthHandler)
+    Thread(target = server.serve_forever, daemon = True).start()
+
+    return server
+
+def main(argv = None):
+    parser = ArgumentParser(prog = "python -m arenalib.supervisor", description = "Run several arena servers.")
+    parser.add_argument("-d", "--config-dir", default = config.config_dir, help = "directory of the maps, scripts and config")
+    parser.add_argument("-c", "--config-file", default = None, help = "config file (default: config.toml in the config dir)")
+    parser.add_argument("-n", "--instances", type = int, default = None, help = "number of servers")
+
+    args = parser.parse_args(argv)
+
+    config_dir  = abspath(args.config_dir)
+    config_file = abspath(load_config(config_dir, args.config_file))
+
+    count     = args.instances or instances_option.get()
+    rotations = deal_rotations(config.option("rotation", ["classicgen"]).get(), count)
+
+    asset_dir = asset_dir_option.get()
+    asset_dir = asset_dir if isabs(asset_dir) else join(config_dir, asset_dir)
+
+    base_port   = config.option("port", 32887).get()
+    base_name   = config.option("name", "piqueserver").get()
+    status_port = status_port_option.get()
+
+    net_stats_port = config.section("arena").option("net_stats_port", 0).get()
+
+    instances = []
+
+    for i in range(count):
+        arena = {"asset_dir": asset_dir}
+
+        if net_stats_port:
+            arena["net_stats_port"] = net_stats_port + i
+
+        overrides = {
+            "port":          base_port + i,
+            "name":          "{} #{}".format(base_name, i + 1),
+            "rotation":      rotations[i],
+            "status_server": {"enabled": True, "host": "127.0.0.1", "port": status_port + i},
+            "logging":       {"logfile": "./logs/arena-{}.txt".format(i + 1)},
+            "arena":         arena
+        }
+
+        command = [
+            sys.executable, "-m", "piqueserver", "-d", config_dir, "-c", config_file,
+            "-j", json.dumps(overrides)
+        ]
+
+        instances.append(Instance(i, command, status_port + i))
+
+    supervisor = Supervisor(instances)
+
+    if port := port_option.get():
+        serve_health(supervisor, port)
+
+    signal.signal(signal.SIGINT, supervisor.stop)
+    signal.signal(signal.SIGTERM, supervisor.stop)
+
+    try:
+        supervisor.run(interval_option.get())
+    finally:
+        supervisor.shutdown()
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
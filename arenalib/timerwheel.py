@@ -0,0 +1,146 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import defaultdict
+from math import ceil, floor
+import traceback
+
+class Timer:
+    __slots__ = ('wheel', 'deadline', 'callback', 'args', 'kwargs', 'scope', 'slot')
+
+    def __init__(self, wheel, deadline, callback, args, kwargs, scope):
+        self.wheel    = wheel
+        self.deadline = deadline
+        self.callback = callback
+        self.args     = args
+        self.kwargs   = kwargs
+        self.scope    = scope
+        self.slot     = None
+
+    # Same interface as `twisted.internet.base.DelayedCall`, so that a timer can be stored
+    # where piqueserver expects one (e.g. `ServerConnection.spawn_call`).
+
+    def active(self):
+        return self.slot is not None
+
+    def cancel(self):
+        if self.slot is None:
+            return
+
+        del self.slot[self]
+        self.slot = None
+
+        if self.scope is not None:
+            self.wheel.scopes[self.scope].discard(self)
+
+    def getTime(self):
+        return self.deadline * self.wheel.resolution
+
+class TimerWheel:
+    def __init__(self, now, resolution = 1 / 64, bits = 8, levels = 3):
+        self.resolution = resolution
+        self.bits       = bits
+        self.size       = 1 << bits
+        self.mask       = self.size - 1
+        self.levels     = levels
+
+        self.tick   = floor(now / resolution)
+        self.wheels = [[dict() for i in range(self.size)] for ℓ in range(levels)]
+        self.scopes = defaultdict(set)
+
+    def __len__(self):
+        return sum(len(slot) for wheel in self.wheels for slot in wheel)
+
+    def insert(self, timer):
+        Δ = timer.deadline - self.tick
+
+        for ℓ in range(self.levels):
+            if Δ < 1 << (self.bits * (ℓ + 1)):
+                index = (timer.deadline >> (self.bits * ℓ)) & self.mask
+                break
+        else:
+            # Beyond the span of the wheel: park it one revolution ahead, it will be re-inserted
+            # when that slot cascades.
+            ℓ = self.levels - 1
+            index = ((self.tick >> (self.bits * ℓ)) - 1) & self.mask
+
+        slot = self.wheels[ℓ][index]
+        slot[timer] = None
+        timer.slot = slot
+
+    def call_later(self, delay, callback, *args, scope = None, **kwargs):
+        deadline = self.tick + max(1, ceil(delay / self.resolution))
+
+        timer = Timer(self, deadline, callback, args, kwargs, scope)
+        self.insert(timer)
+
+        if scope is not None:
+            self.scopes[scope].add(timer)
+
+        return timer
+
+    def cancel_scope(self, scope):
+        for timer in self.scopes.pop(scope, ()):
+            timer.scope = None
+            timer.cancel()
+
+    def cancel_all(self):
+        for wheel in self.wheels:
+            for slot in wheel:
+                for timer in slot:
+                    timer.slot = timer.scope = None
+
+                slot.clear()
+
+        self.scopes.clear()
+
+    def cascade(self):
+        for ℓ in range(self.levels - 1, 0, -1):
+            shift = self.bits * ℓ
+
+            if self.tick & ((1 << shift) - 1) != 0:
+                continue
+
+            slot = self.wheels[ℓ][(self.tick >> shift) & self.mask]
+            timers = list(slot)
+            slot.clear()
+
+            for timer in timers:
+                self.insert(timer)
+
+    def advance(self, now):
+        target = floor(now / self.resolution)
+
+        while self.tick < target:
+            self.tick += 1
+            self.cascade()
+
+            slot = self.wheels[0][self.tick & self.mask]
+            if len(slot) <= 0: continue
+
+            for timer in list(slot):
+                if timer.slot is not slot:
+                    continue # cancelled by an earlier callback
+
+                del slot[timer]
+                timer.slot = None
+
+                if timer.scope is not None:
+                    self.scopes[timer.scope].discard(timer)
+
+                try:
+                    timer.callback(*timer.args, **timer.kwargs)
+                except Exception:
+                    traceback.print_exc()
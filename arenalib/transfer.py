@@ -0,0 +1,122 @@
+# Copyright © 2026 rzrn
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pyspades import contained as loaders
+
+from arenalib.ratelimit import TokenBucket
+
+# Same chunk size and number of chunks per call as `ServerConnection.send_map`
+MAP_CHUNK_SIZE   = 8192
+MAP_CHUNK_BURST  = 10
+
+def is_loading(connection):
+    return connection.player_id is not None and connection.map_data is not None
+
+def get_loaded_count(protocol, team):
+    return sum(not is_loading(player) for player in protocol.players.values() if player.team is team)
+
+class MapTransferScheduler:
+    """
+    Paces map transfers instead of sending every client 80 KiB whenever its previous chunks
+    were acknowledged: the chunks are taken from a global budget of `rate` bytes per second
+    and from a budget of `client_rate` bytes per second for each client. The clients
+    of the team with fewer loaded players are served first, then the ones closest to
+    finishing. A rate of 0 is unlimited.
+    """
+
+    def __init__(self, rate, client_rate, t):
+        self.rate        = rate
+        self.client_rate = client_rate
+
+        self.bucket  = self.make_bucket(rate, t)
+        self.buckets = dict()
+        self.pending = dict()
+
+        self.bytes_sent = 0
+
+    def make_bucket(self, rate, t):
+        if rate > 0:
+            return TokenBucket(rate, max(rate, MAP_CHUNK_BURST * MAP_CHUNK_SIZE), t)
+
+    def request(self, connection):
+        self.pending[connection] = None
+
+    def forget(self, connection):
+        self.pending.pop(connection, None)
+        self.buckets.pop(connection, None)
+
+    def get_priority(self, protocol, connection, loaded):
+        team = connection.team or connection.loading_team
+
+        count = loaded.get(team, min(loaded.values()))
+        left  = connection.map_data.get_size() - connection.map_data.pos
+
+        return count, left
+
+    def update(self, protocol, t):
+        if not self.pending:
+            return
+
+        pending, self.pending = self.pending, dict()
+
+        if bucket := self.bucket:
+            bucket.refill(t)
+
+        loaded = {team: get_loaded_count(protocol, team) for team in (protocol.team_1, protocol.team_2)}
+        queue  = [connection for connection in pending if is_loading(connection)]
+
+        queue.sort(key = lambda connection: self.get_priority(protocol, connection, loaded))
+
+        for connection in queue:
+            # See `SavedPackets`: too much has changed since the download has started
+            if connection.saved_loaders.overflow:
+                connection.disconnect(reason = "Too many changes during the map download, please reconnect")
+                continue
+
+            if connection not in self.buckets:
+                self.buckets[connection] = self.make_bucket(self.client_rate, t)
+
+            if client_bucket := self.buckets[connection]:
+                client_bucket.refill(t)
+
+            sent = 0
+
+            for _ in range(MAP_CHUNK_BURST):
+                if not connection.map_data.data_left():
+                    break
+
+                if client_bucket and not client_bucket.has(MAP_CHUNK_SIZE):
+                    break
+
+                if bucket and not bucket.has(MAP_CHUNK_SIZE):
+                    break
+
+                chunk = loaders.MapChunk()
+                chunk.data = connection.map_data.read(MAP_CHUNK_SIZE)
+                connection.send_contained(chunk)
+
+                for b in bucket, client_bucket:
+                    if b: b.take(len(chunk.data))
+
+                sent += len(chunk.data)
+
+            self.bytes_sent += sent
+
+            # Otherwise the client asks again once these chunks are acknowledged
+            # (or on the next tick, if it was out of budget)
+            if not connection.map_data.data_left():
+                # Lets `ServerConnection.send_map` send the saved packets and join the player
+                connection.send_map()
+                self.buckets.pop(connection, None)
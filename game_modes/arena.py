@@ -27,21 +27,22 @@ from time import monotonic
 from random import choice
 import math
 
-from twisted.internet import reactor
-
 from pyspades.contained import (
-    HitPacket, BlockAction, KillAction, IntelPickup,
-    IntelDrop, GrenadePacket, WeaponInput, WeaponReload,
-    Restock, SetHP
+    HitPacket, KillAction, IntelPickup,
+    IntelDrop, WeaponInput, WeaponReload,
+    Restock, SetHP, MapStart, HandShakeInit,
+    BlockAction
 )
-
 from pyspades.packet import register_packet_handler
-from pyspades.collision import vector_collision
+from pyspades.bytes import ByteWriter
+from pyspades.collision import vector_collision, collision_3d
 from pyspades.player import ServerConnection
 from pyspades.common import Vertex3
 from pyspades.constants import *
 from pyspades import world
 
+from twisted.internet import reactor
+
 from piqueserver.config import config
 
 from arenalib.defusal import (
@@ -49,6 +50,23 @@ from arenalib.defusal import (
     arena_bomb_explosion_duration
 )
 from arenalib.common import ArenaException, wall_tunnel
+from arenalib.timerwheel import TimerWheel
+from arenalib.scheduler import TaskScheduler
+from arenalib.mapconfig import ArenaMapConfig
+from arenalib.lagcomp import PositionHistory, validate_hit
+from arenalib.broadcast import (
+    send_data, broadcast_data, broadcast_chat_message, broadcast_chat_status, broadcast_chat_warning
+)
+from arenalib.culling import WorldUpdateCuller
+from arenalib.mapcache import MapCache
+from arenalib.assets import get_shared_assets, get_map_key, get_point_table
+from arenalib.transfer import MapTransferScheduler, is_loading
+from arenalib.backlog import SavedPackets, get_destroyed
+from arenalib.ratelimit import ActionLimiter, ActionStats, default_action_costs
+from arenalib.snapshot import RoundSnapshot, restore_snapshot
+from arenalib.provenance import BlockHistory, BUILT, DESTROYED, EMPTY, UNKNOWN, encode_color, destroy_point
+from arenalib.netstats import NetStats, serve_metrics
+from arenalib import packets
 
 MAX_TEAM_NAME_SIZE = 9
 
@@ -65,15 +83,90 @@ arena_time_limit = arena_section.option("time_limit", 120.0).get()
 # Delay before first round in game (seconds)
 arena_map_change_delay = arena_section.option("map_change_delay", 15.0).get()
 
+# Once every player has downloaded the map, the delay above is shortened to this (seconds)...
+arena_map_change_min_delay = arena_section.option("map_change_min_delay", 5.0).get()
+
+assert 5.0 <= arena_map_change_min_delay
+
+# ...but the first round waits for the players still downloading it until this much time has passed (seconds)
+arena_map_change_max_delay = arena_section.option("map_change_max_delay", 30.0).get()
+
+# Bandwidth shared by all map transfers, and bandwidth of a single one (KiB/s, 0 for unlimited)
+arena_map_transfer_rate        = arena_section.option("map_transfer_rate", 2048).get()
+arena_map_transfer_client_rate = arena_section.option("map_transfer_client_rate", 512).get()
+
+# Line builds, spade tunnels, grenades and some commands (see `default_action_costs`) take tokens
+# from a bucket of every player, refilled at this rate up to “action_burst” (tokens per second,
+# 0 to disable). Costs can be changed with “action_costs”, e.g. `action_costs = { line = 10 }`
+arena_action_rate  = arena_section.option("action_rate", 10.0).get()
+arena_action_burst = arena_section.option("action_burst", 30.0).get()
+arena_action_costs = {**default_action_costs, **arena_section.option("action_costs", {}).get()}
+
+# The last player to modify every block is remembered (see /whobuilt, /whodestroyed and /revert)
+# for this many chunks of 8×8 columns (about 45 KiB each), each kept for this long (seconds)
+arena_block_history_chunks = arena_section.option("block_history_chunks", 256).get()
+arena_block_history_age    = arena_section.option("block_history_age", 3600).get()
+
+# Players who receive more packets than this while downloading the map (after dropping
+# the superseded ones) are disconnected
+arena_saved_packets_limit = arena_section.option("saved_packets_limit", 8192).get()
+
 # Value to which it resets when the next map is loaded (for reference, vanilla value is 32.0)
 arena_grenade_blast_radius = arena_section.option("grenade_blast_radius", 128.0).get()
 
+# Number of past positions remembered for each player to validate hits at the time they were made
+arena_position_history = arena_section.option("position_history", 64).get()
+
+# How far back in time a hit can be validated (seconds)
+arena_max_rewind = arena_section.option("max_rewind", 0.5).get()
+
+# Send each client a world update of its own, where enemies that are far away or hidden behind
+# the terrain are refreshed less often (teammates are always sent in full)
+arena_cull_world_updates = arena_section.option("cull_world_updates", False).get()
+
+# Enemies further than this are refreshed every “cull_far_interval” updates (blocks)
+arena_cull_near_distance = arena_section.option("cull_near_distance", 64.0).get()
+arena_cull_far_interval  = arena_section.option("cull_far_interval", 3).get()
+
+# Enemies out of sight are refreshed every “cull_hidden_interval” updates (0 to never send them)
+arena_cull_hidden_interval = arena_section.option("cull_hidden_interval", 10).get()
+
+# How long the result of a line of sight test is reused (seconds)
+arena_cull_visibility_ttl = arena_section.option("cull_visibility_ttl", 0.3).get()
+
+# Count the packets and bytes received and sent per packet type and per call site (see /netstats)...
+arena_net_stats = arena_section.option("net_stats", False).get()
+
+# ...and serve them as JSON on 127.0.0.1 at this port (0 to disable)
+arena_net_stats_port = arena_section.option("net_stats_port", 0).get()
+
 def get_team_alive_count(team):
     return sum(player.is_alive() for player in team.get_players())
 
 def is_team_dead(team):
     return all(not player.is_alive() for player in team.get_players())
 
+class PendingHit:
+    __slots__ = ('rewind_time', 'position', 'orientation', 'pellets')
+
+    def __init__(self, rewind_time, position, orientation):
+        self.rewind_time = rewind_time
+        self.position    = position
+        self.orientation = orientation
+        self.pellets     = [] # (body part, damage), in the order they were received
+
+    def add(self, part, hit_amount):
+        self.pellets.append((part, hit_amount))
+
+def defuse_on_heartbeat(player, t):
+    if player.hp is None:
+        return
+
+    if player.team is None or player.team.spectator:
+        return
+
+    arena_try_defuse(player)
+
 def apply_script(protocol, connection, config):
     class ArenaConnection(connection):
         cash_balance         = 0
@@ -89,12 +182,25 @@ def apply_script(protocol, connection, config):
         last_buy_on_key_2    = 0
         last_buy_on_key_3    = 0
         last_buy_on_key_4    = 0
+        loading_team         = None
+        line_build_points    = ()
+        removed_colors       = None
+        falling_colors       = None
 
         def __init__(self, *w, **kw):
             connection.__init__(self, *w, **kw)
 
             self.teamkill_time_deque = deque(maxlen = 30)
             self.last_activity_time = None
+            self.position_history = PositionHistory(arena_position_history)
+            self.pending_hits = dict()
+            self.action_limiter = ActionLimiter(
+                arena_action_rate, arena_action_burst, arena_action_costs,
+                self.protocol.action_stats, monotonic()
+            )
+
+        def rate_limit(self, action):
+            return self.action_limiter.allow(self, action, monotonic())
 
         def give_player_cash(self, amount):
             self.cash_balance = max(0, min(16_000, self.cash_balance + amount))
@@ -123,6 +229,10 @@ def apply_script(protocol, connection, config):
 
         def on_disconnect(self):
             self.remove_last_killer()
+            self.protocol.map_transfer.forget(self)
+
+            if culler := self.protocol.world_update_culler:
+                culler.forget(self)
 
             connection.on_disconnect(self)
 
@@ -159,7 +269,7 @@ def apply_script(protocol, connection, config):
             connection.on_secondary_fire_set(self, secondary)
 
             if secondary and self.tool == SPADE_TOOL:
-                if self.protocol.arena_running is False:
+                if self.protocol.arena_running is False and self.rate_limit('tunnel'):
                     wall_tunnel(self)
 
         def on_tool_set_attempt(self, tool):
@@ -193,18 +303,14 @@ def apply_script(protocol, connection, config):
             if retval is False: return False
 
             if killer is not None:
-                ds = self.protocol.map_info.extensions
+                cfg = self.protocol.arena_config
 
                 if killer.team is not self.team:
                     killer.team.last_killer = killer
-
-                    kill_reward = ds.get('arena_kill_reward', 0)
-                    killer.give_player_cash(kill_reward)
+                    killer.give_player_cash(cfg.kill_reward)
                 elif killer is not self:
                     killer.teamkill_time_deque.appendleft(monotonic())
-
-                    teamkill_penalty = ds.get('arena_teamkill_penalty', 0)
-                    killer.give_player_cash(-teamkill_penalty)
+                    killer.give_player_cash(-cfg.teamkill_penalty)
 
             self.last_death_time = monotonic()
 
@@ -220,14 +326,10 @@ def apply_script(protocol, connection, config):
                     Vertex3(0, 0, 0), self.grenade_exploded
                 )
                 grenade.team = self.team
-    
-                contained           = GrenadePacket()
-                contained.player_id = self.player_id
-                contained.value     = fuse
-                contained.position  = grenade.position.get()
-                contained.velocity  = grenade.velocity.get()
-    
-                protocol.broadcast_contained(contained)
+
+                broadcast_data(protocol, packets.grenade_effect.encode(
+                    self.player_id, *grenade.position.get(), fuse = fuse
+                ))
 
                 protocol.arena_timer_delay = max(protocol.arena_timer_delay, monotonic() + fuse)
 
@@ -239,33 +341,85 @@ def apply_script(protocol, connection, config):
             if self.team.spectator:
                 return 0
             elif self.protocol.arena_running:
-                ds = self.protocol.map_info.extensions
-                return ds.get('arena_respawn_time', -1)
+                return self.protocol.arena_config.respawn_time
             else:
                 return 0
 
         assert connection.respawn is ServerConnection.respawn
 
         def respawn(self):
-            if self.spawn_call is not None:
+            if self.spawn_call is not None and self.spawn_call.active():
                 return
 
             respawn_time = self.get_respawn_time()
 
             if 0 < respawn_time:
-                self.spawn_call = reactor.callLater(respawn_time, self.spawn)
+                self.spawn_call = self.protocol.arena_timers.call_later(
+                    respawn_time, self.spawn, scope = 'round'
+                )
             elif respawn_time < 0:
                 return
             else:
                 self.spawn()
 
+        def send_contained(self, contained, sequence = False):
+            if self.disconnected:
+                return
+
+            writer = ByteWriter()
+            contained.write(writer)
+
+            send_data(self, bytes(writer), sequence)
+
+        def _connection_ack(self):
+            # Same as `ServerConnection._connection_ack`, without its `ProgressiveMapGenerator`
+            # (which copies the whole map for every player)
+            self._send_connection_data()
+            self.send_map(self.protocol.map_cache.reader())
+
+            if not self.client_info:
+                self.send_contained(HandShakeInit())
+
+        def send_map(self, data = None):
+            if data is None:
+                # The saved packets are sent by `ServerConnection.send_map` once the map is sent
+                if (stats := self.protocol.net_stats) and self.map_data is not None and self.saved_loaders is not None:
+                    if not self.map_data.data_left():
+                        for packet in self.saved_loaders:
+                            stats.record_sent(packet[0], len(packet), 1, site = "saved packets")
+
+                connection.send_map(self)
+                return
+
+            # Every map transfer is served from the same compressed buffer (see `_connection_ack`)
+            # until the map changes, and its chunks are paced by `protocol.map_transfer`
+            self.map_data = data
+
+            self.saved_loaders = SavedPackets(
+                self.protocol, self.saved_loaders, arena_saved_packets_limit
+            )
+
+            contained      = MapStart()
+            contained.size = self.map_data.get_size()
+            self.send_contained(contained)
+
+            self.protocol.map_transfer.request(self)
+
+        def continue_map_transfer(self):
+            self.protocol.map_transfer.request(self)
+
+        def reset(self):
+            # Reconnecting after a map change: remembered to prioritize the map transfer
+            self.loading_team = self.team
+
+            connection.reset(self)
+
         def on_join(self):
             connection.on_join(self)
 
-            ds = self.protocol.map_info.extensions
-            arena_starting_balance = ds.get('arena_starting_balance', 0)
+            self.loading_team = None
 
-            self.cash_balance = arena_starting_balance
+            self.cash_balance = self.protocol.arena_config.starting_balance
 
             self.has_builder_kit = False
 
@@ -290,21 +444,19 @@ def apply_script(protocol, connection, config):
 
             connection.on_spawn(self, loc)
 
+            self.position_history.clear()
+
             self.bomb_defusal_timer  = None
             self.has_defuse_kit      = False
             self.has_kevlar_equipped = False
             self.has_helmet_equipped = False
 
-            ds = self.protocol.map_info.extensions
-
-            arena_give_builder_kit = ds.get('arena_give_builder_kit', False)
+            cfg = self.protocol.arena_config
 
-            if arena_give_builder_kit is not False:
+            if cfg.give_builder_kit:
                 self.has_builder_kit = False
 
-            arena_give_ammo = ds.get('arena_give_ammo', True)
-
-            if arena_give_ammo is False:
+            if not cfg.give_ammo:
                 self.weapon_object.current_stock = 0
                 self.adjust_ammo()
 
@@ -337,13 +489,13 @@ def apply_script(protocol, connection, config):
                 if not self.world_object.can_see(flag.x, flag.y, flag.z - 0.5):
                     return False
 
-                ds = self.protocol.map_info.extensions
+                cfg = self.protocol.arena_config
 
                 if flag.id == BLUE_FLAG:
-                    return 'arena_blue_flag' in ds
+                    return cfg.blue_flag is not None
 
                 if flag.id == GREEN_FLAG:
-                    return 'arena_green_flag' in ds
+                    return cfg.green_flag is not None
 
             return False
 
@@ -352,23 +504,17 @@ def apply_script(protocol, connection, config):
 
             connection.capture_flag(self)
 
-            for player in protocol.players.values():
-                player.send_chat_status(
-                    "{} team wins the round".format(self.team.name)
-                )
+            broadcast_chat_status(protocol, "{} team wins the round".format(self.team.name))
 
-            ds = protocol.map_info.extensions
-            arena_win_reward     = ds.get('arena_win_reward', 0)
-            arena_lose_reward    = ds.get('arena_lose_reward', 0)
-            arena_capture_reward = ds.get('arena_capture_reward', 0)
+            cfg = protocol.arena_config
 
-            self.give_player_cash(arena_capture_reward)
+            self.give_player_cash(cfg.capture_reward)
 
             for player in self.team.get_players():
-                player.give_player_cash(arena_win_reward)
+                player.give_player_cash(cfg.win_reward)
 
             for player in self.team.other.get_players():
-                player.give_player_cash(arena_lose_reward)
+                player.give_player_cash(cfg.lose_reward)
 
             protocol.begin_arena_countdown(protocol.arena_break_time)
             protocol.arena_spawn()
@@ -380,12 +526,12 @@ def apply_script(protocol, connection, config):
                 if team.other.flag.player is not self:
                     return
 
-                ds = protocol.map_info.extensions
+                cfg = protocol.arena_config
 
                 if team is protocol.team_1:
-                    team_has_bomb = 'arena_blue_bombsites' in ds
+                    team_has_bomb = cfg.blue_has_bomb
                 elif team is protocol.team_2:
-                    team_has_bomb = 'arena_green_bombsites' in ds
+                    team_has_bomb = cfg.green_has_bomb
                 else:
                     team_has_bomb = False
 
@@ -399,12 +545,12 @@ def apply_script(protocol, connection, config):
                 if flag.player is not self:
                     continue
 
-                ds = protocol.map_info.extensions
+                cfg = protocol.arena_config
 
                 if flag.team is protocol.team_1:
-                    team_has_flag = 'arena_blue_flag' in ds
+                    team_has_flag = cfg.blue_flag is not None
                 elif flag.team is protocol.team_2:
-                    team_has_flag = 'arena_green_flag' in ds
+                    team_has_flag = cfg.green_flag is not None
                 else:
                     team_has_flag = False
 
@@ -438,28 +584,90 @@ def apply_script(protocol, connection, config):
             connection.on_block_build(self, x, y, z)
             self.last_activity_time = monotonic()
 
+            self.protocol.block_history.record(x, y, z, self.name, BUILT, EMPTY)
+
             if self.has_builder_kit:
                 self.refill()
 
+        def on_line_build_attempt(self, points):
+            if connection.on_line_build_attempt(self, points) is False:
+                return False
+
+            if not self.rate_limit('line'):
+                return False
+
+            M = self.protocol.map
+            self.line_build_points = [point for point in points if not M.get_solid(*point)]
+
         def on_line_build(self, points):
             connection.on_line_build(self, points)
             self.last_activity_time = monotonic()
 
+            history = self.protocol.block_history
+
+            for x, y, z in self.line_build_points:
+                history.record(x, y, z, self.name, BUILT, EMPTY)
+
+            self.line_build_points = ()
+
             if self.has_builder_kit:
                 self.refill()
 
+        def on_block_destroy(self, x, y, z, mode):
+            if connection.on_block_destroy(self, x, y, z, mode) is False:
+                return False
+
+            # Colors of the blocks about to be removed, for `BlockHistory`
+            M = self.protocol.map
+            voxels = ((x, y, z),) if mode == DESTROY_BLOCK else get_destroyed(mode, x, y, z)
+
+            self.removed_colors = {
+                voxel: encode_color(M.get_color(*voxel)) for voxel in voxels if M.get_solid(*voxel)
+            }
+
+        def destroy_point(self, x, y, z):
+            # The blocks that fell with it are recorded by `on_block_removed`
+            count, self.falling_colors = destroy_point(self.protocol.map, x, y, z)
+            return count
+
         def on_block_removed(self, x, y, z):
             connection.on_block_removed(self, x, y, z)
             self.last_activity_time = monotonic()
 
+            history = self.protocol.block_history
+
+            before = self.removed_colors.get((x, y, z), UNKNOWN) if self.removed_colors else UNKNOWN
+            history.record(x, y, z, self.name, DESTROYED, before)
+
+            # The blocks that fell with it are recorded as destroyed by the same player
+            if falling := self.falling_colors:
+                self.falling_colors = None
+
+                for voxel, color in falling.items():
+                    history.record(*voxel, self.name, DESTROYED, color)
+
             if self.tool == WEAPON_TOOL:
                 self.try_revoke_builder_kit()
 
+        def record_position(self):
+            if wo := self.world_object:
+                if not wo.dead:
+                    r = wo.position
+                    self.position_history.push(monotonic(), r.x, r.y, r.z)
+
+        def set_location(self, location = None):
+            # Do not interpolate across a teleport
+            self.position_history.clear()
+
+            return connection.set_location(self, location)
+
         def on_position_update(self):
             # “ServerConnection.on_position_update_recieved” does this only for “self.team.base”
             if vector_collision(self.world_object.position, self.team.other.base):
                 self.check_refill()
 
+            self.record_position()
+
             connection.on_position_update(self)
 
         def on_orientation_update(self, x, y, z):
@@ -504,13 +712,7 @@ def apply_script(protocol, connection, config):
             )
             grenade.team = self.team
 
-            contained           = GrenadePacket()
-            contained.player_id = self.player_id
-            contained.value     = 0
-            contained.position  = grenade.position.get()
-            contained.velocity  = grenade.velocity.get()
-
-            protocol.broadcast_contained(contained)
+            broadcast_data(protocol, packets.grenade_effect.encode(self.player_id, *grenade.position.get()))
             protocol.broadcast_chat("{} spadenaded himself".format(self.name))
 
         def grenade_destroy(self, xf, yf, zf):
@@ -520,41 +722,30 @@ def apply_script(protocol, connection, config):
             x, y, z = math.floor(xf), math.floor(yf), math.floor(zf)
 
             protocol = self.protocol
-            M = protocol.map
 
             if self.on_block_destroy(x, y, z, GRENADE_DESTROY) is not False:
                 for X, Y, Z in product(range(x - 1, x + 2), range(y - 1, y + 2), range(z - 1, z + 2)):
-                    count = M.destroy_point(X, Y, Z)
+                    count = self.destroy_point(X, Y, Z)
 
                     if count > 0:
                         self.total_blocks_removed += count
                         self.on_block_removed(X, Y, Z)
 
-                contained           = BlockAction()
-                contained.x         = x
-                contained.y         = y
-                contained.z         = z
-                contained.value     = GRENADE_DESTROY
-                contained.player_id = self.player_id
-
-                protocol.broadcast_contained(contained, save = True)
+                broadcast_data(
+                    protocol, packets.grenade_destroy.encode(self.player_id, x, y, z), save = True
+                )
             else:
                 for X, Y, Z in product(range(x - 1, x + 2), range(y - 1, y + 2), range(z - 1, z + 2)):
                     if self.on_block_destroy(X, Y, Z, DESTROY_BLOCK) is not False:
-                        count = M.destroy_point(X, Y, Z)
+                        count = self.destroy_point(X, Y, Z)
 
                         if count > 0:
                             self.total_blocks_removed += count
                             self.on_block_removed(X, Y, Z)
 
-                            contained           = BlockAction()
-                            contained.x         = X
-                            contained.y         = Y
-                            contained.z         = Z
-                            contained.value     = DESTROY_BLOCK
-                            contained.player_id = self.player_id
-
-                            protocol.broadcast_contained(contained, save = True)
+                            broadcast_data(
+                                protocol, packets.destroy_block.encode(self.player_id, X, Y, Z), save = True
+                            )
 
             protocol.update_entities()
 
@@ -654,31 +845,173 @@ def apply_script(protocol, connection, config):
                 if not is_melee and self.weapon_object.is_empty():
                     return
 
-                valid_hit = world_object.validate_hit(
-                    player.world_object, value,
+                # Validate against where the target was when the shot was fired
+                rewind_time = max(hit_time, monotonic() - arena_max_rewind)
+
+                if not is_melee:
+                    # All pellets of a shotgun shot arrive within the same tick: they are collected here,
+                    # validated once per target and body part and applied together in “flush_hits”.
+                    if (pending := self.pending_hits.get(player)) is None:
+                        pending = PendingHit(rewind_time, v1.copy(), world_object.orientation.copy())
+
+                        self.pending_hits[player] = pending
+                        self.protocol.pending_shooters[self] = None
+
+                    pending.add(value, hit_amount)
+
+                    return
+
+                x, y, z = player.get_past_position(rewind_time)
+
+                valid_hit = validate_hit(
+                    v1, world_object.orientation, x, y, z, value,
                     HIT_TOLERANCE, self.rubberband_distance
                 )
 
                 if not valid_hit:
                     return
 
-                if is_melee:
-                    if not vector_collision(v1, v2, MELEE_DISTANCE):
-                        return
+                if max(abs(v1.x - x), abs(v1.y - y), abs(v1.z - z)) >= MELEE_DISTANCE:
+                    return
 
-                    x, y, z = v2.get()
-                    if not world_object.can_see(x, y, z):
-                        return
+                if not world_object.can_see(x, y, z):
+                    return
+
+                self.apply_hit(hit_amount, player, kill_type)
+
+        def get_past_position(self, t):
+            if r := self.position_history.sample(t):
+                return r
+            else:
+                return self.world_object.position.get()
+
+        def flush_hits(self):
+            pending_hits, self.pending_hits = self.pending_hits, dict()
+
+            if self.name is None:
+                return
+
+            for player, pending in pending_hits.items():
+                if player.name is None or player.world_object is None:
+                    continue
+
+                x, y, z = player.get_past_position(pending.rewind_time)
+
+                valid = dict() # body part → whether it is hit
+
+                # Every pellet goes through “on_hit” as if it had been applied on its own, and the health
+                # of the target is followed as “ServerConnection.set_hp” would have changed it: the kill
+                # is credited to the pellet that would have killed. Only “player.hit” is called once.
+                hp        = player.hp
+                hits      = 0
+                kill_type = WEAPON_KILL
+
+                for part, hit_amount in pending.pellets:
+                    if (valid_hit := valid.get(part)) is None:
+                        valid_hit = valid[part] = validate_hit(
+                            pending.position, pending.orientation, x, y, z, part,
+                            HIT_TOLERANCE, self.rubberband_distance
+                        )
+
+                    if not valid_hit:
+                        continue
+
+                    pellet_kill_type = HEADSHOT_KILL if part == HEAD else WEAPON_KILL
 
-                retval = self.on_hit(hit_amount, player, kill_type, None)
+                    retval = self.on_hit(hit_amount, player, pellet_kill_type, None)
 
-                if retval is False:
+                    if retval is False:
+                        continue
+                    elif retval is not None:
+                        hit_amount = retval
+
+                    hits += 1
+
+                    if hp is not None and hp > 0:
+                        hp        = max(0, min(100, int(hp - hit_amount)))
+                        kill_type = pellet_kill_type
+
+                if hits > 0:
+                    self.try_revoke_builder_kit()
+
+                    if player.hp is not None:
+                        player.hit(player.hp - hp, self, kill_type)
+
+        def apply_hit(self, hit_amount, player, kill_type):
+            retval = self.on_hit(hit_amount, player, kill_type, None)
+
+            if retval is False:
+                return
+            elif retval is not None:
+                hit_amount = retval
+
+            self.try_revoke_builder_kit()
+            player.hit(hit_amount, self, kill_type)
+
+        @register_packet_handler(BlockAction)
+        def on_block_action_recieved(self, contained):
+            # Same as `ServerConnection.on_block_action_recieved` for the blocks destroyed,
+            # except that `destroy_point` tells which blocks fell with them
+            value = contained.value
+
+            if value != DESTROY_BLOCK and value != SPADE_DESTROY:
+                return connection.on_block_action_recieved(self, contained)
+
+            if not self.hp:
+                return
+
+            if self.tool == WEAPON_TOOL:
+                if self.weapon_object.is_empty():
                     return
-                elif retval is not None:
-                    hit_amount = retval
 
-                self.try_revoke_builder_kit()
-                player.hit(hit_amount, self, kill_type)
+                interval = WEAPON_INTERVAL[self.weapon]
+            else:
+                interval = TOOL_INTERVAL[self.tool]
+
+            current_time = reactor.seconds()
+            last_time, self.last_block = self.last_block, current_time
+
+            if self.rapid_hack_detect and last_time is not None and current_time - last_time < interval:
+                self.rapids.record_event(current_time)
+
+                if self.rapids.above_limit():
+                    self.on_hack_attempt('Rapid hack detected')
+
+                return
+
+            x, y, z = contained.x, contained.y, contained.z
+
+            if z >= 62 or not self.protocol.map.get_solid(x, y, z):
+                return
+
+            if self.tool == SPADE_TOOL:
+                r = self.world_object.position
+
+                if not collision_3d(r.x, r.y, r.z, x, y, z, MAX_DIG_DISTANCE):
+                    return
+
+            if self.on_block_destroy(x, y, z, value) is False:
+                return
+
+            if value == DESTROY_BLOCK:
+                if count := self.destroy_point(x, y, z):
+                    self.total_blocks_removed += count
+                    self.blocks = min(50, self.blocks + 1)
+                    self.on_block_removed(x, y, z)
+
+                data = packets.destroy_block.encode(self.player_id, x, y, z)
+            else:
+                for X, Y, Z in ((x, y, z), (x, y, z + 1), (x, y, z - 1)):
+                    if count := self.destroy_point(X, Y, Z):
+                        self.total_blocks_removed += count
+                        self.on_block_removed(X, Y, Z)
+
+                data = packets.spade_destroy.encode(self.player_id, x, y, z)
+
+            self.last_block_destroy = reactor.seconds()
+
+            broadcast_data(self.protocol, data, save = True)
+            self.protocol.update_entities()
 
         @register_packet_handler(WeaponInput)
         def on_weapon_input_recieved(self, contained):
@@ -715,8 +1048,7 @@ def apply_script(protocol, connection, config):
             return True
 
         def try_give_kevlar(self):
-            ds = self.protocol.map_info.extensions
-            kevlar_price = ds.get('arena_kevlar_price', None)
+            kevlar_price = self.protocol.arena_config.kevlar_price
 
             if kevlar_price is None:
                 self.send_chat_error("No item on key 2 is available.")
@@ -733,9 +1065,10 @@ def apply_script(protocol, connection, config):
                 self.has_kevlar_equipped = True
 
         def try_give_assault_vest(self):
-            ds = self.protocol.map_info.extensions
-            kevlar_price = ds.get('arena_kevlar_price', None)
-            helmet_price = ds.get('arena_helmet_price', None)
+            cfg = self.protocol.arena_config
+
+            kevlar_price = cfg.kevlar_price
+            helmet_price = cfg.helmet_price
 
             if helmet_price is None or kevlar_price is None:
                 self.send_chat_error("No item on key 4 is available.")
@@ -758,8 +1091,7 @@ def apply_script(protocol, connection, config):
                     self.has_kevlar_equipped = True
 
         def try_give_defuse_kit(self):
-            ds = self.protocol.map_info.extensions
-            defuse_kit_price = ds.get('arena_defuse_kit_price', 0)
+            defuse_kit_price = self.protocol.arena_config.defuse_kit_price
 
             if self.has_defuse_kit:
                 self.send_chat_warning("You already have a defuse kit.")
@@ -770,8 +1102,7 @@ def apply_script(protocol, connection, config):
                 self.has_defuse_kit = True
 
         def try_give_builder_kit(self):
-            ds = self.protocol.map_info.extensions
-            builder_kit_price = ds.get('arena_builder_kit_price', 0)
+            builder_kit_price = self.protocol.arena_config.builder_kit_price
 
             if self.has_builder_kit:
                 self.send_chat_warning("You already have a builder kit.")
@@ -783,15 +1114,12 @@ def apply_script(protocol, connection, config):
                 self.refill()
 
         def try_give_refill(self):
-            ds = self.protocol.map_info.extensions
-            arena_has_refill = ds.get('arena_has_refill', False)
-
             if self.can_be_refilled() is False:
                 self.send_chat_warning("No refill needed.")
 
                 return
 
-            if arena_has_refill is False:
+            if self.protocol.arena_config.has_refill is False:
                 refill_price = self.get_refill_price()
             else:
                 refill_price = 0
@@ -859,8 +1187,8 @@ def apply_script(protocol, connection, config):
             if self.team is None:
                 return
 
-            ds = self.protocol.map_info.extensions
-            refill_interval = ds.get('arena_refill_interval', self.protocol.refill_interval)
+            cfg = self.protocol.arena_config
+            refill_interval = cfg.refill_interval
 
             if tool == SPADE_TOOL:
                 last_buy = self.last_buy_on_key_1
@@ -889,15 +1217,11 @@ def apply_script(protocol, connection, config):
             if tool == SPADE_TOOL:
                 self.last_buy_on_key_1 = monotonic()
 
-                blue_has_bomb          = 'arena_blue_bombsites'  in ds
-                green_has_bomb         = 'arena_green_bombsites' in ds
-                arena_give_builder_kit = ds.get('arena_give_builder_kit', False)
-
-                if self.team is self.protocol.blue_team and green_has_bomb:
+                if self.team is self.protocol.blue_team and cfg.green_has_bomb:
                     self.try_give_defuse_kit()
-                elif self.team is self.protocol.green_team and blue_has_bomb:
+                elif self.team is self.protocol.green_team and cfg.blue_has_bomb:
                     self.try_give_defuse_kit()
-                elif arena_give_builder_kit:
+                elif cfg.give_builder_kit:
                     self.try_give_builder_kit()
                 else:
                     self.send_chat_error("No item on key 1 is available.")
@@ -924,11 +1248,21 @@ def apply_script(protocol, connection, config):
         hide_coord = (math.inf, math.inf, 128)
 
         grenade_blast_radius = None
+        arena_config         = None
 
-        def get_mode_name(self):
-            ds = self.map_info.extensions
+        def broadcast_chat(self, value, global_message = True, sender = None, team = None, irc = False):
+            if irc:
+                self.irc_say('* %s' % value)
 
-            return ds.get('arena_game_mode', 'arena')
+            broadcast_chat_message(
+                self, value, global_message = global_message, team = team, sender = sender
+            )
+
+        def get_mode_name(self):
+            if cfg := self.arena_config:
+                return cfg.game_mode
+            else:
+                return 'arena'
 
         def __init__(self, *w, **kw):
             protocol.__init__(self, *w, **kw)
@@ -943,48 +1277,156 @@ def apply_script(protocol, connection, config):
             self.team_1.bomb = None
             self.team_2.bomb = None
 
-            self.arena_running          = False
-            self.arena_counting_down    = False
-            self.arena_countdown_timers = None
-            self.arena_time_limit       = 0
-            self.arena_limit_timer      = math.inf
-            self.arena_heartbeat_rate   = math.inf
+            self.arena_running        = False
+            self.arena_counting_down  = False
+            self.arena_time_limit     = 0
+            self.arena_limit_timer    = math.inf
+            self.arena_heartbeat_rate = math.inf
 
             self.time          = monotonic()
-            self.stopwatch     = 0
+            self.arena_timers  = TimerWheel(self.time)
+            self.arena_tasks   = TaskScheduler()
+
+            self.pending_shooters = dict()
             self.players_alive = 0
 
+            self.map_cache      = MapCache()
+            self.asset_cache    = get_shared_assets()
+            self.action_stats   = ActionStats()
+            self.round_snapshot = None
+            self.block_history  = BlockHistory(arena_block_history_chunks, arena_block_history_age)
+            self.map_transfer = MapTransferScheduler(
+                1024 * arena_map_transfer_rate, 1024 * arena_map_transfer_client_rate, self.time
+            )
+
+            self.arena_map_change_time = self.time
+            self.arena_countdown_end   = math.inf
+            self.arena_map_loaded      = True
+
+            if arena_cull_world_updates:
+                self.world_update_culler = WorldUpdateCuller(
+                    arena_cull_near_distance, arena_cull_far_interval,
+                    arena_cull_hidden_interval, arena_cull_visibility_ttl
+                )
+            else:
+                self.world_update_culler = None
+
+            self.net_stats        = NetStats(self.time) if arena_net_stats else None
+            self.net_stats_server = None
+
+            if arena_net_stats and arena_net_stats_port:
+                self.net_stats_server = serve_metrics(self, arena_net_stats_port)
+
+        def broadcast_contained(self, contained, unsequenced = False, sender = None, team = None, save = False, rule = None):
+            writer = ByteWriter()
+            contained.write(writer)
+
+            # Also tells `on_map_packet` about the changes of the map
+            broadcast_data(self, bytes(writer), unsequenced, sender, team, save, rule)
+
+        def data_received(self, peer, packet):
+            if stats := self.net_stats:
+                stats.record_received(packet.data)
+
+            protocol.data_received(self, peer, packet)
+
+        def on_map_packet(self, data):
+            self.map_cache.touch()
+
+            if snapshot := self.round_snapshot:
+                snapshot.observe(data)
+
+        def update_network(self):
+            if stats := self.net_stats:
+                stats.sample_queues(self)
+
+            if culler := self.world_update_culler:
+                culler.update_network(self)
+            else:
+                protocol.update_network(self)
+
         def on_world_update(self):
             dt = monotonic() - self.time
             self.time += dt
 
-            self.stopwatch += dt
-            if self.arena_heartbeat_rate <= self.stopwatch:
-                self.stopwatch = 0
+            self.arena_timers.advance(self.time)
+            self.map_cache.update()
+            self.map_transfer.update(self, self.time)
 
-                if map_info := self.map_info:
-                    if map_on_arena_heartbeat := getattr(map_info.info, 'on_arena_heartbeat', None):
-                        map_on_arena_heartbeat(self, self.time)
+            if self.pending_shooters:
+                pending_shooters, self.pending_shooters = self.pending_shooters, dict()
 
-                if self.arena_running and self.arena_timer_delay <= self.time:
-                    players_alive = sum(player.is_alive() for player in self.players.values())
+                for player in pending_shooters:
+                    player.flush_hits()
 
-                    if self.players_alive == players_alive:
-                        self.check_round_end()
+            for player in self.players.values():
+                player.record_position()
 
-                    self.players_alive = players_alive
+            if map_info := self.map_info:
+                if map_on_world_update := getattr(map_info.info, 'on_world_update', None):
+                    map_on_world_update(self, dt)
 
-                    if self.arena_limit_timer <= self.time:
-                        self.on_arena_time_limit()
+            self.arena_tasks.update(self, dt, self.time)
 
-                for player in self.players.values():
-                    if player.hp is None or player.name is None:
-                        continue
+        def check_players_alive(self, t):
+            if self.arena_running and self.arena_timer_delay <= self.time:
+                players_alive = sum(player.is_alive() for player in self.players.values())
 
-                    if player.team is None or player.team.spectator:
-                        continue
+                if self.players_alive == players_alive:
+                    self.check_round_end()
+
+                self.players_alive = players_alive
+
+        def register_arena_tasks(self):
+            # The tasks registered by scripts are left alone
+            self.arena_tasks.clear(owner = 'arena')
+            self.arena_tasks.clear(owner = 'map')
+
+            rate = self.arena_heartbeat_rate
+
+            # Every task gets its own phase, and per-player tasks are spread over the whole period,
+            # so that no single tick has to do all the work of a heartbeat.
+            self.arena_tasks.register('round', rate, type(self).check_players_alive, owner = 'arena')
+            self.arena_tasks.register('defusal', rate, defuse_on_heartbeat, per_player = True, owner = 'arena')
+            self.arena_tasks.register('loading', 0.5, type(self).check_map_loaded, owner = 'arena')
 
-                    arena_try_defuse(player)
+            if self.net_stats:
+                self.arena_tasks.register('netstats', 1.0, type(self).update_net_stats, owner = 'arena')
+
+            o = self.map_info.info
+
+            if map_on_arena_heartbeat := getattr(o, 'on_arena_heartbeat', None):
+                self.arena_tasks.register('map', rate, map_on_arena_heartbeat, owner = 'map')
+
+            if map_on_arena_player_heartbeat := getattr(o, 'on_arena_player_heartbeat', None):
+                self.arena_tasks.register(
+                    'map_player', rate, map_on_arena_player_heartbeat, per_player = True, owner = 'map'
+                )
+
+            # The tasks of the map should be registered with `owner = 'map'` to go with it
+            if map_on_arena_tasks := getattr(o, 'on_arena_tasks', None):
+                map_on_arena_tasks(self, self.arena_tasks)
+
+        def update_net_stats(self, t):
+            if stats := self.net_stats:
+                stats.update(self, t)
+
+        def check_map_loaded(self, t):
+            if self.arena_map_loaded or not self.arena_counting_down:
+                return
+
+            if any(map(is_loading, self.connections.values())):
+                return
+
+            for team in self.green_team, self.blue_team:
+                if team.count() == 0:
+                    return
+
+            self.arena_map_loaded = True
+
+            # Everyone is here: no need to wait for the rest of `map_change_delay`
+            if arena_map_change_min_delay < self.arena_countdown_end - t:
+                self.schedule_arena_countdown(arena_map_change_min_delay)
 
         def bomb_exploded(self, bomb):
             if self.team_1.bomb is not bomb and self.team_2.bomb is not bomb:
@@ -997,7 +1439,9 @@ def apply_script(protocol, connection, config):
             if player := self.get_arbitrary_player(bomb.team):
                 arena_bomb_effect(player, bomb)
 
-            reactor.callLater(arena_bomb_explosion_duration, self.arena_win, bomb.team)
+            self.arena_timers.call_later(
+                arena_bomb_explosion_duration, self.arena_win, bomb.team, scope = 'round'
+            )
 
         def check_round_end(self, killer = None):
             P1 = is_team_dead(self.team_1)
@@ -1015,8 +1459,23 @@ def apply_script(protocol, connection, config):
             else:
                 return
 
+        def check_arena_time_limit(self):
+            if not self.arena_running:
+                return
+
+            # The deadline can be pushed back by a planted bomb or by grenades still in flight.
+            deadline = max(self.arena_limit_timer, self.arena_timer_delay)
+
+            if self.time < deadline:
+                if math.isfinite(deadline):
+                    self.arena_timers.call_later(
+                        deadline - self.time, self.check_arena_time_limit, scope = 'round'
+                    )
+            else:
+                self.on_arena_time_limit()
+
         def on_arena_time_limit(self):
-            ds = self.map_info.extensions
+            cfg = self.arena_config
 
             self.arena_limit_timer = math.inf
 
@@ -1024,8 +1483,8 @@ def apply_script(protocol, connection, config):
             blue_team      = self.blue_team
             green_count    = get_team_alive_count(green_team)
             blue_count     = get_team_alive_count(blue_team)
-            green_has_bomb = 'arena_green_bombsites' in ds
-            blue_has_bomb  = 'arena_blue_bombsites'  in ds
+            green_has_bomb = cfg.green_has_bomb
+            blue_has_bomb  = cfg.blue_has_bomb
 
             if blue_has_bomb and not green_has_bomb:
                 self.arena_win(green_team)
@@ -1081,6 +1540,13 @@ def apply_script(protocol, connection, config):
             killer.arena_end_round()
 
         def on_map_change(self, M):
+            if assets := self.asset_cache:
+                self.map_cache.reset(M, assets, get_map_key(self.map_info, ".vxl.z"))
+            else:
+                self.map_cache.reset(M)
+            self.round_snapshot = None
+            self.block_history.reset()
+
             o = self.map_info.info
 
             self.team_1.name  = getattr(o, 'team1_name',  self.team1_name)
@@ -1096,6 +1562,8 @@ def apply_script(protocol, connection, config):
 
             self.grenade_blast_radius = arena_grenade_blast_radius
 
+            self.update_arena_config()
+
             extensions = self.map_info.extensions
 
             self.arena_map_change_delay = extensions.get('arena_map_change_delay', arena_map_change_delay)
@@ -1117,10 +1585,22 @@ def apply_script(protocol, connection, config):
             else:
                 raise ArenaException('No arena_blue_spawns given in map metadata.')
 
-            if timers := self.arena_countdown_timers:
-                for timer in timers:
-                    if timer.active():
-                        timer.cancel()
+            # Long lists of spawns are shared between the servers playing the same map
+            if (assets := self.asset_cache) and (key := get_map_key(self.map_info, "")):
+                for team in self.blue_team, self.green_team:
+                    if len(team.arena_spawns) >= 256:
+                        team.arena_spawns = get_point_table(
+                            assets, "{}.{}.spawns".format(key, team.id), team.arena_spawns
+                        )
+
+            self.arena_timers.cancel_all()
+            self.register_arena_tasks()
+
+            if culler := self.world_update_culler:
+                culler.reset()
+
+            self.arena_map_change_time = self.time
+            self.arena_map_loaded      = False
 
             self.arena_counting_down = False
             self.begin_arena_countdown(self.arena_map_change_delay)
@@ -1129,6 +1609,9 @@ def apply_script(protocol, connection, config):
 
             return protocol.on_map_change(self, M)
 
+        def update_arena_config(self):
+            self.arena_config = ArenaMapConfig(self.map_info.extensions, self.refill_interval)
+
         def arena_spawn(self):
             if self.map_info.extensions.get('swap_spawns', False):
                 self.blue_team.arena_spawns, self.green_team.arena_spawns = self.green_team.arena_spawns, self.blue_team.arena_spawns
@@ -1167,10 +1650,7 @@ def apply_script(protocol, connection, config):
                 stock = player.weapon_object.current_stock
                 player.refill()
 
-                ds = self.map_info.extensions
-                arena_give_ammo = ds.get('arena_give_ammo', True)
-
-                if arena_give_ammo is False:
+                if self.arena_config.give_ammo is False:
                     player.weapon_object.current_stock = stock
                     player.adjust_ammo()
 
@@ -1187,10 +1667,12 @@ def apply_script(protocol, connection, config):
                 warning = "{} seconds".format(seconds)
 
             if warning is not None:
-                for player in self.players.values():
-                    player.send_chat_warning(warning)
+                broadcast_chat_warning(self, warning)
 
         def begin_arena_countdown(self, delay):
+            # Whatever was scheduled for the round that has just ended (respawns, bomb effects, etc.)
+            self.arena_timers.cancel_scope('round')
+
             if delay <= 0.0:
                 self.begin_arena(await_players = False)
                 return
@@ -1205,27 +1687,48 @@ def apply_script(protocol, connection, config):
             self.arena_counting_down = True
             self.building            = False
 
+            self.restore_round_snapshot()
+
             o = self.map_info.info
 
             if map_on_arena_end := getattr(o, 'on_arena_end', None):
                 map_on_arena_end(self)
 
-            self.arena_countdown_timers = [
-                reactor.callLater(delay - 5, self.game_start_warning, 5),
-                reactor.callLater(delay, self.begin_arena)
-            ]
+            self.schedule_arena_countdown(delay)
+
+        def schedule_arena_countdown(self, delay):
+            self.arena_timers.cancel_scope('countdown')
+            self.arena_countdown_end = self.time + delay
+
+            self.arena_timers.call_later(delay - 5, self.game_start_warning, 5, scope = 'countdown')
+            self.arena_timers.call_later(delay, self.begin_arena, scope = 'countdown')
+
+        def restore_round_snapshot(self):
+            if snapshot := self.round_snapshot:
+                player = next((player for player in self.players.values() if player.name is not None), None)
+                restore_snapshot(self, snapshot, player)
 
         def begin_arena(self, await_players = True):
             self.arena_counting_down = False
 
             if await_players is True:
+                if self.time < self.arena_map_change_time + arena_map_change_max_delay:
+                    if any(map(is_loading, self.connections.values())):
+                        self.arena_counting_down = True
+                        self.arena_timers.call_later(1.0, self.begin_arena, scope = 'countdown')
+                        return
+
                 for team in self.green_team, self.blue_team:
                     if team.count() == 0:
                         self.begin_arena_countdown(self.arena_break_time)
                         return
 
             self.arena_running = True
-            self.building      = self.map_info.extensions.get('building_enabled', True)
+            self.building      = self.arena_config.building_enabled
+
+            # Taken once per map: every round is rolled back to it
+            if self.arena_config.rollback and self.round_snapshot is None:
+                self.round_snapshot = RoundSnapshot(self.map.copy())
 
             o = self.map_info.info
 
@@ -1240,6 +1743,9 @@ def apply_script(protocol, connection, config):
                 )
 
                 self.arena_limit_timer = self.time + self.arena_time_limit
+                self.arena_timers.call_later(
+                    self.arena_time_limit, self.check_arena_time_limit, scope = 'round'
+                )
             else:
                 self.arena_limit_timer = math.inf
 
@@ -1248,27 +1754,27 @@ def apply_script(protocol, connection, config):
             return x, y, self.map.get_z(x, y, z)
 
         def on_base_spawn(self, x, y, z, base, entity_id):
-            ds = self.map_info.extensions
+            cfg = self.arena_config
 
             if entity_id == BLUE_BASE:
-                if loc := ds.get('arena_blue_base', None):
+                if loc := cfg.blue_base:
                     return self.get_drop_location(loc)
 
             if entity_id == GREEN_BASE:
-                if loc := ds.get('arena_green_base', None):
+                if loc := cfg.green_base:
                     return self.get_drop_location(loc)
 
             return self.hide_coord
 
         def on_flag_spawn(self, x, y, z, flag, entity_id):
-            ds = self.map_info.extensions
+            cfg = self.arena_config
 
             if entity_id == BLUE_FLAG:
-                if loc := ds.get('arena_blue_flag', None):
+                if loc := cfg.blue_flag:
                     return self.get_drop_location(loc)
 
             if entity_id == GREEN_FLAG:
-                if loc := ds.get('arena_green_flag', None):
+                if loc := cfg.green_flag:
                     return self.get_drop_location(loc)
 
             return self.hide_coord
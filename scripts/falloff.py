@@ -15,25 +15,32 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from math import ceil
+from math import ceil, sqrt, isfinite
+from array import array
 
-from pyspades.collision import distance_3d_vector
 from pyspades import contained as loaders
 from pyspades.weapon import BaseWeapon
 from pyspades.constants import *
 
 from arenalib.common import ArenaException
 
+# Damage tables are indexed by the squared distance divided by this step, so that no square root
+# is taken per hit. They cover the longest distance possible on a 512×512×64 map.
+FALLOFF_STEP  = 16
+FALLOFF_SCALE = 1 / FALLOFF_STEP
+FALLOFF_SIZE  = (512 * 512 + 512 * 512 + 64 * 64) // FALLOFF_STEP + 1
+
 class Weapon(BaseWeapon):
     discard_reloading = False
+    falloff           = None
 
     def get_damage(self, value, v1, v2):
-        d = distance_3d_vector(v1, v2)
+        table = self.falloff[value]
 
-        t = (d - self.near) / (self.far - self.near)
-        t = 1 - max(0, min(1, t))
+        dx, dy, dz = v1.x - v2.x, v1.y - v2.y, v1.z - v2.z
+        i = int((dx * dx + dy * dy + dz * dz) * FALLOFF_SCALE)
 
-        return ceil(self.damage[value] * t)
+        return table[i] if i < FALLOFF_SIZE else table[-1]
 
     def on_reload(self):
         self.reloading = False
@@ -113,38 +120,170 @@ class Shotgun(Weapon):
         LEGS:  20
     }
 
+weapon_classes = {
+    RIFLE_WEAPON:   Rifle,
+    SMG_WEAPON:     SMG,
+    SHOTGUN_WEAPON: Shotgun
+}
+
+weapon_names = {
+    'rifle':   RIFLE_WEAPON,
+    'smg':     SMG_WEAPON,
+    'shotgun': SHOTGUN_WEAPON
+}
+
+part_names = {
+    'torso': TORSO,
+    'head':  HEAD,
+    'arms':  ARMS,
+    'legs':  LEGS
+}
+
+def linear_curve(spec):
+    near, far = spec['near'], spec['far']
+
+    if not near < far:
+        raise ArenaException("Linear falloff requires near < far, got {} and {}.".format(near, far))
+
+    def f(d):
+        t = (d - near) / (far - near)
+        return 1 - max(0, min(1, t))
+
+    return f
+
+def exponential_curve(spec):
+    near, half_distance = spec['near'], spec.get('half_distance')
+
+    if half_distance is None or not half_distance > 0:
+        raise ArenaException("Exponential falloff requires a positive half_distance.")
+
+    def f(d):
+        return 1.0 if d <= near else 0.5 ** ((d - near) / half_distance)
+
+    return f
+
+def piecewise_curve(spec):
+    points = spec.get('points')
+
+    if not points:
+        raise ArenaException("Piecewise falloff requires a list of (distance, multiplier) points.")
+
+    points = [(float(d), float(m)) for d, m in points]
+
+    if any(d1 >= d2 for (d1, _), (d2, _) in zip(points, points[1:])):
+        raise ArenaException("Piecewise falloff points must be sorted by distance.")
+
+    def f(d):
+        if d <= points[0][0]:
+            return points[0][1]
+
+        for (d1, m1), (d2, m2) in zip(points, points[1:]):
+            if d <= d2:
+                return m1 + (m2 - m1) * (d - d1) / (d2 - d1)
+
+        return points[-1][1]
+
+    return f
+
+falloff_curves = {
+    'linear':      linear_curve,
+    'exponential': exponential_curve,
+    'piecewise':   piecewise_curve
+}
+
+def parse_key(key, names, kind):
+    if isinstance(key, str):
+        if key.lower() in names:
+            return names[key.lower()]
+    elif key in names.values():
+        return key
+
+    raise ArenaException("Unknown {} “{}” in arena_falloff.".format(kind, key))
+
+def split_spec(spec):
+    spec = dict(spec)
+
+    parts   = {parse_key(k, part_names, 'body part'): v for k, v in spec.pop('parts', {}).items()}
+    weapons = {parse_key(k, weapon_names, 'weapon'): v for k, v in spec.pop('weapons', {}).items()}
+
+    return spec, parts, weapons
+
+def compile_curve(spec, cache):
+    curve = spec.get('curve', 'linear')
+
+    if curve not in falloff_curves:
+        raise ArenaException("Unknown falloff curve “{}”.".format(curve))
+
+    key = (curve,) + tuple(sorted((k, repr(v)) for k, v in spec.items() if k != 'damage'))
+
+    if key not in cache:
+        f = falloff_curves[curve](spec)
+
+        multipliers = [f(sqrt((i + 0.5) * FALLOFF_STEP)) for i in range(FALLOFF_SIZE)]
+
+        if not all(isfinite(m) and m >= 0 for m in multipliers):
+            raise ArenaException("Falloff curve “{}” yields invalid multipliers.".format(curve))
+
+        cache[key] = multipliers
+
+    return cache[key]
+
+def compile_falloff(extensions):
+    """
+    Builds the damage tables of every weapon from the `arena_falloff` map extension:
+
+        arena_falloff = dict(
+            curve   = 'exponential', near = 16, half_distance = 48,
+            parts   = dict(head = dict(curve = 'linear', far = 128)),
+            weapons = dict(shotgun = dict(curve = 'piecewise', points = [(8, 1.0), (32, 0.5), (64, 0)]))
+        )
+
+    The most specific setting wins: weapon and body part, then weapon, then body part, then the map,
+    then the weapon class itself (linear between `near` and `far`).
+    """
+
+    spec, parts, weapons = split_spec(extensions.get('arena_falloff', {}))
+
+    tables, cache = dict(), dict()
+
+    for weapon_class in (Rifle, SMG, Shotgun):
+        weapon_spec, weapon_parts, _ = split_spec(weapons.get(weapon_class.id, {}))
+
+        tables[weapon_class.id] = table = dict()
+
+        for part, damage in weapon_class.damage.items():
+            merged = dict(near = weapon_class.near, far = weapon_class.far, damage = damage)
+            merged.update(spec)
+            merged.update(parts.get(part, {}))
+            merged.update(weapon_spec)
+            merged.update(weapon_parts.get(part, {}))
+
+            multipliers = compile_curve(merged, cache)
+
+            damage = merged['damage']
+            table[part] = array('H', (ceil(damage * m) for m in multipliers))
+
+    return tables
+
 def apply_script(protocol, connection, config):
+    class FalloffProtocol(protocol):
+        falloff_tables = compile_falloff({})
+
+        def on_map_change(self, M):
+            self.falloff_tables = compile_falloff(self.map_info.extensions)
+
+            for player in self.players.values():
+                if weapon_object := player.weapon_object:
+                    weapon_object.falloff = self.falloff_tables[player.weapon]
+
+            return protocol.on_map_change(self, M)
+
     class FalloffConnection(connection):
         def get_weapon(self, weapon):
-            ds = self.protocol.map_info.extensions
-
-            arena_rifle_enabled   = ds.get("arena_rifle_enabled",   True)
-            arena_smg_enabled     = ds.get("arena_smg_enabled",     True)
-            arena_shotgun_enabled = ds.get("arena_shotgun_enabled", True)
-
-            if weapon == RIFLE_WEAPON:
-                if arena_rifle_enabled:
-                    return Rifle
-                elif arena_smg_enabled:
-                    return SMG
-                elif arena_shotgun_enabled:
-                    return Shotgun
-
-            if weapon == SMG_WEAPON:
-                if arena_smg_enabled:
-                    return SMG
-                elif arena_rifle_enabled:
-                    return Rifle
-                elif arena_shotgun_enabled:
-                    return Shotgun
-
-            if weapon == SHOTGUN_WEAPON:
-                if arena_shotgun_enabled:
-                    return Shotgun
-                elif arena_rifle_enabled:
-                    return Rifle
-                elif arena_smg_enabled:
-                    return SMG
+            if cfg := getattr(self.protocol, 'arena_config', None):
+                weapon = cfg.weapons.get(weapon)
+
+            return weapon_classes.get(weapon)
 
         def set_weapon(self, weapon, local = False, no_kill = False):
             if weapon_class := self.get_weapon(weapon):
@@ -154,9 +293,10 @@ def apply_script(protocol, connection, config):
                     self.weapon_object.reset()
 
                 self.weapon_object = weapon_class(self._on_reload)
+                self.weapon_object.falloff = self.protocol.falloff_tables[weapon_class.id]
 
-                ds = self.protocol.map_info.extensions
-                self.weapon_object.discard_reloading = ds.get("arena_discard_reloading", False)
+                cfg = getattr(self.protocol, 'arena_config', None)
+                self.weapon_object.discard_reloading = cfg.discard_reloading if cfg else False
 
                 if local is False and self.world_object is not None:
                     change_weapon = loaders.ChangeWeapon()
@@ -171,4 +311,4 @@ def apply_script(protocol, connection, config):
 
             return connection.on_spawn(self, pos)
 
-    return protocol, FalloffConnection
\ No newline at end of file
+    return FalloffProtocol, FalloffConnection
\ No newline at end of file
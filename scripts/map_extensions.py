@@ -51,7 +51,9 @@ def apply_script(protocol, connection, config):
                     map_on_map_unloaded(self, None)
 
         def on_entity_updated(self, entity):
-            protocol.on_entity_updated(self, entity)
+            # Not defined by the base protocol
+            if on_entity_updated := getattr(protocol, 'on_entity_updated', None):
+                on_entity_updated(self, entity)
 
             o = self.map_info.info
 
@@ -127,41 +129,31 @@ def apply_script(protocol, connection, config):
         def on_position_update(self):
             i = self.protocol.map_info
 
-            extensions = i.extensions
+            # Without the arena game mode, the map has none of these settings
+            if cfg := getattr(self.protocol, 'arena_config', None):
+                if water_damage := cfg.water_damage:
+                    if self.world_object.position.z >= 61:
+                        self.environment_hit(water_damage)
 
-            if water_damage := extensions.get('water_damage'):
-                if self.world_object.position.z >= 61:
-                    self.environment_hit(water_damage)
+                if ds := cfg.boundary_damage:
+                    apply_boundary_damage(self, ds)
 
-            if ds := extensions.get('boundary_damage'):
-                apply_boundary_damage(self, ds)
+                if self.team is self.protocol.blue_team:
+                    if ds1 := cfg.boundary_blue_team:
+                        apply_boundary_damage(self, ds1)
 
-            if self.team is self.protocol.blue_team:
-                if ds1 := extensions.get('boundary_blue_team'):
-                    apply_boundary_damage(self, ds1)
+                if self.team is self.protocol.green_team:
+                    if ds2 := cfg.boundary_green_team:
+                         apply_boundary_damage(self, ds2)
 
-            if self.team is self.protocol.green_team:
-                if ds2 := extensions.get('boundary_green_team'):
-                     apply_boundary_damage(self, ds2)
+                if teleporters := cfg.teleporters:
+                    x, y, z = self.world_object.position.get()
 
-            if teleporters := extensions.get('teleporters'):
-                x, y, z = self.world_object.position.get()
-
-                for teleporter in teleporters:
-                    xmin = teleporter['xmin']
-                    xmax = teleporter['xmax']
-                    ymin = teleporter['ymin']
-                    ymax = teleporter['ymax']
-                    zmin = teleporter['zmin']
-                    zmax = teleporter['zmax']
-                    xout = teleporter['xout']
-                    yout = teleporter['yout']
-                    zout = teleporter['zout']
+                    for xmin, xmax, ymin, ymax, zmin, zmax, xout, yout, zout in teleporters:
+                        if xmin <= x <= xmax and ymin <= y <= ymax and zmin <= z <= zmax:
+                            self.set_location((xout + 0.5, yout + 0.5, zout))
 
-                    if xmin <= x <= xmax and ymin <= y <= ymax and zmin <= z <= zmax:
-                        self.set_location((xout + 0.5, yout + 0.5, zout))
-
-                        break
+                            break
 
             o = i.info
 
@@ -186,8 +178,9 @@ def apply_script(protocol, connection, config):
             self.set_hp(self.hp - value)
 
         def on_command(self, command, parameters):
-            disabled = self.protocol.map_info.extensions.get('disabled_commands', [])
-            if command in disabled:
+            cfg = getattr(self.protocol, 'arena_config', None)
+
+            if cfg and command in cfg.disabled_commands:
                 self.send_chat("Command '{}' disabled for this map".format(command))
                 return
 